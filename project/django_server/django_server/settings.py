@@ -34,6 +34,73 @@ CACHES = {
         'TIMEOUT': None,
     }
 }
+
+# Number of R worker processes serving Ballgown queries (see stress_mice/rpool.py).
+# Each worker holds its own copy of the Ballgown objects it has loaded.
+R_WORKERS = int(os.environ.get("STRESS_MICE_R_WORKERS", 4))
+
+# Factory of the pool answering the R calls of the views. The benchmarks
+# replace it with stress_mice.bench.fake_r.get_pool (see stress_mice/bench/).
+R_BACKEND = "stress_mice.rpool.get_pool"
+
+# Alternative locations of the data/ tree, of the gene_plotter images and
+# of the gene annotation (utils/); None means the default one.
+STRESS_MICE_DATA_DIR = os.environ.get("STRESS_MICE_DATA_DIR")
+STRESS_MICE_PLOT_DIR = None
+STRESS_MICE_ANNOTATION_DIR = None
+
+# Memory budget (in bytes, as estimated by R's object.size) for the Ballgown
+# objects kept by each R worker; least recently used ones are evicted
+# beyond it. None means unbounded. Pinned bioprojects are never evicted.
+# The budget is per worker: the datasets of a server process may use up to
+# R_WORKERS times this, and every server process runs its own workers.
+R_WORKER_DATASET_BYTES = int(os.environ["STRESS_MICE_R_WORKER_DATASET_BYTES"]) if "STRESS_MICE_R_WORKER_DATASET_BYTES" in os.environ else None
+R_PINNED_BIOPROJECTS = []
+
+# Preload bioprojects in the background when the server starts (see
+# stress_mice/warmup.py); the ready/ endpoint answers 503 until it is over.
+# WARMUP_BIOPROJECTS = None means every bioproject in project.json.
+WARMUP_ON_STARTUP = os.environ.get("STRESS_MICE_WARMUP", "0") == "1"
+WARMUP_BIOPROJECTS = None
+
+# Threads running the asynchronous jobs of jobs/submit/ (see
+# stress_mice/jobs.py). They mostly wait for the R workers, so more
+# threads than R_WORKERS only lengthens the workers' queues.
+JOB_THREADS = int(os.environ.get("STRESS_MICE_JOB_THREADS", R_WORKERS))
+# Finished jobs (done or failed) and their results are deleted this many
+# seconds after they end; None keeps them forever.
+JOB_RETENTION_SECONDS = int(os.environ.get("STRESS_MICE_JOB_RETENTION_SECONDS", 24 * 3600))
+
+# Threads querying the bioprojects in parallel for the cross-bioproject
+# endpoints (see stress_mice/fanout.py). Lookups in the exported
+# expression matrices and DEG tables do not need an R worker, hence the
+# default above R_WORKERS.
+FANOUT_THREADS = int(os.environ.get("STRESS_MICE_FANOUT_THREADS", 4 * R_WORKERS))
+
+# Largest number of genes accepted by the batch endpoints
+# (search_by_gene_list/, search_degs_by_gene_list/; see stress_mice/gene_lists.py).
+GENE_LIST_MAX = 5000
+
+# Size budget of the gene_plotter image cache (material/imgs/temp/); the
+# least recently used images are deleted beyond it.
+PLOT_CACHE_BYTES = 512 * 1024 * 1024
+
+# Seconds browsers and proxies may reuse the responses of the data-backed
+# endpoints before revalidating them with their ETag (see
+# stress_mice/conditional.py).
+HTTP_CACHE_MAX_AGE = 300
+
+# Table responses larger than this (in bytes) are streamed, and gzipped
+# when the client accepts it, instead of being sent in one piece (see
+# stress_mice/streaming.py).
+GZIP_THRESHOLD = 64 * 1024
+
+# Maximum number of suggestions returned by the genes/transcripts
+# autocomplete, and whether ids containing the typed text (not only
+# starting with it) are suggested too.
+AUTOCOMPLETE_LIMIT = 50
+AUTOCOMPLETE_SUBSTRING = True
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -43,9 +110,11 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'stress_mice.apps.StressMiceConfig',
 ]
 
 MIDDLEWARE = [
+    'stress_mice.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -120,6 +189,43 @@ USE_L10N = True
 USE_TZ = True
 
 
+# Logging
+# https://docs.djangoproject.com/en/2.0/topics/logging/
+# The request parameters and R results are logged at DEBUG level; records
+# repeating the same message are rate-limited (see stress_mice/log.py).
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'rate_limit': {
+            '()': 'stress_mice.log.RateLimitFilter',
+            'rate': 10,
+            'per': 60,
+        },
+    },
+    'formatters': {
+        'default': {
+            'format': '%(asctime)s %(levelname)s %(name)s: %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'default',
+            'filters': ['rate_limit'],
+        },
+    },
+    'loggers': {
+        'stress_mice': {
+            'handlers': ['console'],
+            'level': os.environ.get('STRESS_MICE_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.0/howto/static-files/
 
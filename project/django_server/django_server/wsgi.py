@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_server.settings")
 
 application = get_wsgi_application()
+
+# Preload the datasets off the request path (see stress_mice/warmup.py)
+from django.conf import settings
+if settings.WARMUP_ON_STARTUP:
+    from stress_mice import warmup
+    warmup.start_in_background()
@@ -1,3 +1,6 @@
 from django.contrib import admin
 
+from stress_mice.models import Job
+
 # Register your models here.
+admin.site.register(Job)
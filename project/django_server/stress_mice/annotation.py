@@ -0,0 +1,99 @@
+"""
+Gene annotation index (gene symbol -> NCBI id, chromosome, start, end, strand).
+
+The index is built from utils/genename2id.tsv and the Ensembl GTF the
+first time it is needed, saved next to them as a pickle and afterwards
+loaded from there; it is rebuilt whenever one of the two source files
+changes.
+"""
+import os
+import pickle
+
+from django.conf import settings
+
+from stress_mice.datacache import FileBackedCache, file_stamp
+
+# STRESS_MICE_ANNOTATION_DIR replaces utils/ as the location of the two
+# files below and of the index (e.g. for the benchmark fixtures)
+UTILS_DIR = os.path.join(getattr(settings, "STRESS_MICE_ANNOTATION_DIR", None) or os.path.dirname(__file__) + "/utils", "")
+
+# Download file from here: "ftp://ftp.ncbi.nlm.nih.gov/genomes/refseq/vertebrate_mammalian/Mus_musculus/reference/GCF_000001635.26_GRCm38.p6/GCF_000001635.26_GRCm38.p6_genomic.gff.gz"
+# and extracted two-column file with the following command
+# zcat GCF_000001635.26_GRCm38.p6_genomic.gff.gz | cut -f 9 | grep "Name=" | tr ';' '\t' | grep "GeneID" | grep "ID=gene" | cut -f 2,3 | sed 's/Dbxref=GeneID://g' | sed 's/Name=//g' | sed 's/,[^\t]*//g' | awk '{ print $2"\t"$1}'
+# TODO: make it perfect by considering this border-case:
+# NC_000068.7     BestRefSeq      gene    175470025       175480553       .       +       .       ID=gene6037;Dbxref=GeneID:100503949,MGI:MGI:3779822;Name=Zfp965;description=zinc finger protein 965;gbkey=Gene;gene=Zfp965;gene_biotype=protein_coding;gene_synonym=668009,Gm8923
+# in which DESeq uses a synonym for the name of the gene (e.g.. Gm8923 or Gm10094)
+GENE2ID_PATH = UTILS_DIR + "genename2id.tsv"
+GTF_PATH = UTILS_DIR + "Mus_musculus.GRCm38.93.genes.gtf"
+INDEX_PATH = UTILS_DIR + "annotation.idx"
+
+FIELDS = ["id", "chr", "start", "end", "strand"]
+
+
+def parse_sources(gene2id_path, gtf_path):
+    # Each gene is stored as an (id, chr, start, end, strand) tuple, with
+    # None for whatever the sources do not provide.
+    map = {}
+
+    with open(gene2id_path) as reader:
+        for line in reader:
+            gene_name, gene_id = line.strip().split("\t")
+            map[gene_name] = (gene_id, None, None, None, None)
+
+    if os.path.exists(gtf_path):
+        with open(gtf_path) as reader:
+            for line in reader:
+                fields = line.strip().split("\t")
+                chr, start, end, strand, info = [fields[i] for i in [0,3,4,6,8]]
+                gene_name = None
+
+                for f in info.split(";"):
+                    if "gene_name" in f:
+                        gene_name = f.strip().split(" ")[1].replace("\"", "")
+
+                if gene_name is not None:
+                    gene_id = map[gene_name][0] if gene_name in map else "UNKNOWN"
+                    map[gene_name] = (gene_id, "chr" + chr, start, end, strand)
+
+    return map
+
+
+def load_index(gene2id_path=GENE2ID_PATH, gtf_path=GTF_PATH, index_path=INDEX_PATH):
+    sources = file_stamp([gene2id_path, gtf_path])
+
+    try:
+        with open(index_path, "rb") as reader:
+            index = pickle.load(reader)
+        if index["sources"] == sources:
+            return index["genes"]
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+        pass
+
+    genes = parse_sources(gene2id_path, gtf_path)
+
+    try:
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "wb") as writer:
+            pickle.dump({"sources": sources, "genes": genes}, writer, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        # A read-only checkout still works, it just parses on every start
+        pass
+
+    return genes
+
+
+_index = FileBackedCache()
+
+
+def get_index():
+    return _index.get("genes", [GENE2ID_PATH, GTF_PATH], load_index)
+
+
+def lookup(gene_name):
+    # Same dictionary the old gene2id() map held for each gene: only the
+    # fields known for the gene are present.
+    record = get_index().get(gene_name)
+    if record is None: return None
+
+    return {key: value for key, value in zip(FIELDS, record) if value is not None}
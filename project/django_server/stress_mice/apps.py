@@ -1,5 +1,15 @@
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class StressMiceConfig(AppConfig):
     name = 'stress_mice'
+
+    def ready(self):
+        # runserver's autoreloader imports the project twice: only warm up
+        # the process which actually serves requests
+        if getattr(settings, "WARMUP_ON_STARTUP", False) and os.environ.get("RUN_MAIN") == "true":
+            from stress_mice import warmup
+            warmup.start_in_background()
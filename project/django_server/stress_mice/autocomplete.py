@@ -0,0 +1,79 @@
+"""
+Autocomplete index over the gene and transcript identifiers of a bioproject.
+
+Identifiers are kept sorted, so prefix matches are a contiguous range
+found by binary search and ranked with a bounded heap, and also joined
+into a single string, so substring matches are found by str.find in C
+instead of testing every identifier in Python.
+"""
+import bisect
+import heapq
+
+from stress_mice.datacache import FileBackedCache
+
+SEPARATOR = "\n"
+
+# Sorts after any character an id may continue with
+LAST_CHARACTER = chr(0x10FFFF)
+
+
+class AutocompleteIndex(object):
+
+    def __init__(self, ids):
+        self.ids = sorted(set(str(x) for x in ids))
+        self._text = SEPARATOR + SEPARATOR.join(self.ids) + SEPARATOR
+        # Start offset of each id within _text, to map a match back to its id
+        self._starts = []
+        position = 1
+        for id in self.ids:
+            self._starts.append(position)
+            position += len(id) + 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def prefix_range(self, prefix):
+        # ids[start:end] are the ids starting with prefix
+        return bisect.bisect_left(self.ids, prefix), bisect.bisect_left(self.ids, prefix + LAST_CHARACTER)
+
+    def prefix(self, prefix, limit):
+        # The `limit` best ranked ids starting with prefix: the shortest
+        # ones, the exact match first, wherever they are in the range
+        start, end = self.prefix_range(prefix)
+        return heapq.nsmallest(limit, (self.ids[i] for i in range(start, end)), key=lambda x: (len(x), x))
+
+    def substring(self, text, limit, exclude=()):
+        matches = []
+        seen = set(exclude)
+        position = self._text.find(text)
+        while position >= 0 and len(matches) < limit:
+            i = bisect.bisect_right(self._starts, position) - 1
+            id = self.ids[i]
+            if id not in seen:
+                seen.add(id)
+                matches.append(id)
+            # Continue after the end of this id
+            position = self._text.find(text, self._starts[i] + len(id))
+        return matches
+
+    def search(self, text, limit=50, substring=True):
+        # Ranked: exact match, then prefix matches (shortest first), then
+        # the ids containing the text elsewhere.
+        if not text:
+            return self.ids[:limit]
+
+        matches = self.prefix(text, limit)
+
+        if substring and len(matches) < limit:
+            matches += self.substring(text, limit - len(matches), exclude=matches)
+
+        return matches
+
+
+_indexes = FileBackedCache()
+
+
+def get_index(key, paths, load_ids):
+    # Built with load_ids() the first time and again whenever one of
+    # `paths` (normally the bioproject's bg.RData) changes.
+    return _indexes.get(key, paths, lambda: AutocompleteIndex(load_ids()))
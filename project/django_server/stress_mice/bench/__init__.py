@@ -0,0 +1,15 @@
+"""
+Benchmarks of the stress_mice endpoints on synthetic data.
+
+fixtures.py writes a data/ tree of a chosen size, fake_r.py answers the
+R calls from it without R, settings.py points the project at both, and
+endpoints.py sends one request per route through Django's test client
+and measures it; loadtest.py replays the requests of the frontend with
+concurrent users, and scaling.py measures the endpoints on trees of
+growing size. From project/django_server:
+
+    DJANGO_SETTINGS_MODULE=stress_mice.bench.settings python manage.py bench_endpoints --generate --output before.json
+    DJANGO_SETTINGS_MODULE=stress_mice.bench.settings python manage.py bench_endpoints --compare before.json
+    DJANGO_SETTINGS_MODULE=stress_mice.bench.settings python manage.py loadtest --concurrency 16 --duration 60
+    DJANGO_SETTINGS_MODULE=stress_mice.bench.settings python manage.py scaling_report --factors 1 2 5 10
+"""
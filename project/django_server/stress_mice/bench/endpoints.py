@@ -0,0 +1,167 @@
+"""
+One benchmark request per route of stress_mice/urls.py, and their measurement.
+
+cases() builds the requests from the names recorded in a fixture
+manifest (see fixtures.py). measure() sends each of them through
+Django's test client: the first requests, timed on their own as "cold",
+fill the caches, the following `repeat` ones give the latency
+distribution, and a last one is traced with tracemalloc for the memory
+it allocates.
+"""
+import json
+import time
+import tracemalloc
+
+from stress_mice.bench import fixtures
+
+API = "/stress_mice/"
+
+
+class Case(object):
+
+    def __init__(self, name, method, path, body=None, capture=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        # capture(content, context) stores values used by later cases
+        self.capture = capture
+
+    def url(self, context):
+        return API + self.path.format(**context)
+
+    def send(self, client, context):
+        if self.method == "POST":
+            response = client.post(self.url(context), data=json.dumps(self.body), content_type="application/json")
+        else:
+            response = client.get(self.url(context))
+
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        if self.capture is not None and response.status_code < 400:
+            self.capture(content, context)
+        return response.status_code, content
+
+
+def capture_job(content, context):
+    context["job_id"] = json.loads(content.decode("utf-8"))["id"]
+
+
+def cases(manifest):
+    bioproject = manifest["bioproject_ids"][0]
+    gene = manifest["gene"]
+    transcript = manifest["transcript"]
+    region = manifest["region"]
+    gene_query = {"bioproject": bioproject, "gene_name_sy": gene}
+    # A 300-gene panel, as pasted from a paper
+    genes = [fixtures.gene_name(i) for i in range(min(300, manifest["genes"]))]
+
+    return [
+        Case("get_projects", "GET", "get_projects/"),
+        Case("dataset_overview", "GET", "dataset_overview/"),
+        Case("bioproject", "GET", "bioproject/" + bioproject + "/"),
+        Case("papers", "GET", "papers/" + bioproject + "/"),
+        Case("data_info", "GET", "data_info/" + bioproject + "/"),
+        Case("phenodata_info", "GET", "phenodata_info/" + bioproject + "/"),
+        Case("dataset_phenotypic_information", "GET", "dataset_phenotypic_information/"),
+        Case("covariates", "GET", "covariates/" + bioproject + "/"),
+        Case("covariate_values", "GET", "covariate_values/" + bioproject + "/Region/"),
+        Case("measures", "GET", "measures/"),
+        Case("features", "GET", "features/"),
+        Case("downloads", "GET", "downloads/"),
+        Case("genes", "GET", "genes/" + bioproject + "/" + gene[:4]),
+        Case("transcripts", "GET", "transcripts/" + bioproject + "/" + transcript[:4]),
+        Case("search_by_gene_symbol", "POST", "search_by_gene_symbol/", gene_query),
+        Case("see_gene_isoforms", "POST", "see_gene_isoforms/", gene_query),
+        Case("search_by_gene_list", "POST", "search_by_gene_list/", {"bioproject": bioproject, "genes": genes}),
+        Case("search_degs_by_gene_list", "POST", "search_degs_by_gene_list/", {"bioproject": bioproject, "genes": genes}),
+        Case("gene_across_bioprojects", "GET", "gene_across_bioprojects/?gene_name_sy=" + gene),
+        Case("search_by_transcript_symbol", "POST", "search_by_transcript_symbol/", {"bioproject": bioproject, "transcript_name_sy": transcript}),
+        Case("search_by_feature", "POST", "search_by_feature/", dict(gene_query, feature="transcript")),
+        Case("search_by_condition", "POST", "search_by_condition/", dict(gene_query, condition1="Region", condition_value1=region)),
+        Case("search_by_diff_fold_expr", "POST", "search_by_diff_fold_expr/", {"bioproject": bioproject, "pvalue": "0.05", "qvalue": "ALL", "min_fold_change": "1"}),
+        Case("search_by_diff_fold_expr_sorted", "POST", "search_by_diff_fold_expr/", {"bioproject": bioproject, "pvalue": "ALL", "qvalue": "ALL", "min_fold_change": "ALL",
+                                                                                "filters": [{"key": "baseMean", "min": 100}], "sort": "padj", "order": "asc"}),
+        Case("gene_plotter", "POST", "gene_plotter/", dict(gene_query, measure="FPKM", covariate="Region")),
+        Case("combinations", "POST", "combinations/", {"condition1": "Region"}),
+        Case("get_criteria", "POST", "get_criteria/", {"bioproject": bioproject, "Criterion1": 'Region=="' + region + '"'}),
+        Case("differential_expression", "POST", "differential_expression/", {"Region": region, "offset": 0, "limit": 10}),
+        Case("differential_expression_file", "POST", "differential_expression_file/", {}),
+        Case("submit_job", "POST", "jobs/submit/", {"kind": "see_gene_isoforms", "params": gene_query}, capture_job),
+        Case("job_status", "GET", "jobs/{job_id}/"),
+        Case("job_result", "GET", "jobs/{job_id}/result/"),
+        Case("ready", "GET", "ready/"),
+        Case("cache_stats", "GET", "cache_stats/"),
+        Case("metrics", "GET", "metrics/"),
+        # Last, since it empties every cache
+        Case("clear_cache", "GET", "clear_cache/"),
+    ]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def measure_case(client, case, context, repeat=20, cold=1, allocations=True):
+    entry = {"method": case.method, "path": case.url(context)}
+
+    try:
+        start = time.time()
+        for _ in range(max(1, cold)):
+            status, content = case.send(client, context)
+        entry["cold_ms"] = (time.time() - start) * 1000 / max(1, cold)
+        entry["status"] = status
+        entry["bytes"] = len(content)
+
+        latencies = []
+        for _ in range(repeat):
+            start = time.time()
+            case.send(client, context)
+            latencies.append((time.time() - start) * 1000)
+
+        if latencies:
+            entry.update({
+                "mean_ms": sum(latencies) / len(latencies),
+                "min_ms": min(latencies),
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "max_ms": max(latencies),
+            })
+
+        if allocations:
+            tracemalloc.start()
+            try:
+                case.send(client, context)
+                retained, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            entry["alloc_peak_bytes"] = peak
+            entry["alloc_retained_bytes"] = retained
+    except Exception as e:
+        entry["error"] = "{}: {}".format(type(e).__name__, e)
+
+    return entry
+
+
+def measure(client, cases, repeat=20, cold=1, allocations=True, only=None):
+    context = {"job_id": "none"}
+    results = {}
+    for case in cases:
+        if only and case.name not in only: continue
+        results[case.name] = measure_case(client, case, context, repeat, cold, allocations)
+    return results
+
+
+def compare(old, new, key="p50_ms"):
+    # Lines of a side by side comparison of two reports
+    lines = ["{:<32} {:>12} {:>12} {:>8}".format("endpoint", "before", "after", "change")]
+    for name in sorted(set(old) | set(new)):
+        before = old.get(name, {}).get(key)
+        after = new.get(name, {}).get(key)
+        change = "{:+.0f}%".format((after - before) / before * 100) if before and after is not None else "-"
+        lines.append("{:<32} {:>12} {:>12} {:>8}".format(
+            name,
+            "{:.2f}".format(before) if before is not None else "-",
+            "{:.2f}".format(after) if after is not None else "-",
+            change))
+    return lines
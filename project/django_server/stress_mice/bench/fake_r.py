@@ -0,0 +1,242 @@
+"""
+Stand-in for the R worker pool, for machines without R.
+
+FakePool has the interface of rpool.RPool and answers the functions of
+definitions.R the views call (getGenes, SearchByGene, SearchByCondition,
+Gene_Plotter_By_Group, ...) from the JSON files the benchmark fixtures
+write in place of bg.RData (see fixtures.py), returning the same
+RVector/RDataFrame types. Like the real pool it routes bioprojects to a
+fixed number of workers, each serving one request at a time with its own
+dataset cache, so lock contention shows up as it would with R.
+FAKE_R_DELAY adds a fixed time to every R call. Select it with
+R_BACKEND = "stress_mice.bench.fake_r.get_pool".
+"""
+import json
+import os
+import random
+import threading
+import time
+import zlib
+
+from django.conf import settings
+
+from stress_mice import metrics
+from stress_mice.dataset_cache import DatasetCache
+from stress_mice.rpool import RDataFrame, RVector, RWorkerError
+
+
+def expression(bg, feature, sample):
+    rng = random.Random(zlib.crc32((feature + "\t" + sample).encode("utf-8")) ^ bg["seed"])
+    return round(rng.lognormvariate(1, 1.5), 4)
+
+
+def find_gene(bg, symbol):
+    for gene in bg["genes"]:
+        if gene["name"] == symbol: return gene
+    return None
+
+
+def select_genes(bg, symbol):
+    if symbol in (None, "", "ALL"): return bg["genes"]
+    gene = find_gene(bg, symbol)
+    return [gene] if gene is not None else []
+
+
+def select_samples(bg, conditions):
+    # conditions: clauses key=='value' joined by " & ", as built by search_by_condition
+    clauses = []
+    for clause in conditions.split("&"):
+        clause = clause.strip()
+        if not clause: continue
+        key, value = clause.split("==")
+        clauses.append((key.strip(), value.strip().strip("'\"")))
+    return [s for s in bg["samples"] if all(s.get(k) == v for k, v in clauses)]
+
+
+def feature_table(bg, rows, samples, label):
+    # rows: (name, gene) pairs, one per gene or transcript
+    with_gene = label != "gene_name"
+    colnames = [label, "chr", "start", "end", "strand"] + (["gene_name"] if with_gene else []) + ["FPKM." + s["ids"] for s in samples]
+    return RDataFrame(colnames, [
+        [name, gene["chr"], gene["start"], gene["end"], gene["strand"]] + ([gene["name"]] if with_gene else []) +
+        [expression(bg, name, s["ids"]) for s in samples]
+        for name, gene in rows])
+
+
+def getGenes(bg):
+    return RVector([g["name"] for g in bg["genes"]])
+
+
+def getTranscript(bg):
+    return RVector([t for g in bg["genes"] for t in g["transcripts"]])
+
+
+def getCovariates(bg):
+    colnames = list(bg["samples"][0].keys()) if bg["samples"] else ["ids"]
+    return RDataFrame(colnames, [[s[c] for c in colnames] for s in bg["samples"]])
+
+
+def SearchByGene(symbol, bg):
+    gene = find_gene(bg, symbol)
+    if gene is None: return RVector([], [])
+    return RVector([expression(bg, gene["name"], s["ids"]) for s in bg["samples"]], ["FPKM." + s["ids"] for s in bg["samples"]])
+
+
+def SearchGeneIsoforms(symbol, bg):
+    return feature_table(bg, [(t, g) for g in select_genes(bg, symbol) for t in g["transcripts"]], bg["samples"], "t_name")
+
+
+def SearchByTranscript(symbol, bg):
+    rows = [(t, g) for g in bg["genes"] for t in g["transcripts"] if symbol in (None, "", "ALL", t)]
+    return feature_table(bg, rows, bg["samples"], "t_name")
+
+
+def SearchByFeature(symbol, feature, bg):
+    genes = select_genes(bg, symbol)
+    if feature == "transcript":
+        return feature_table(bg, [(t, g) for g in genes for t in g["transcripts"]], bg["samples"], "t_name")
+    return feature_table(bg, [(g["name"], g) for g in genes], bg["samples"], "gene_name")
+
+
+def SearchByCondition(conditions, symbol, bg):
+    return feature_table(bg, [(g["name"], g) for g in select_genes(bg, symbol)], select_samples(bg, conditions), "gene_name")
+
+
+def Gene_Plotter_By_Group(symbol, measure, covariate, basedir, bg):
+    from stress_mice.bench.fixtures import png
+
+    gene = find_gene(bg, symbol)
+    if gene is None: return None
+
+    if not os.path.exists(basedir):
+        os.makedirs(basedir)
+    path = os.path.join(basedir, "fake_{}_{}_{}.png".format(threading.get_ident(), time.time(), symbol))
+    with open(path, "wb") as writer:
+        writer.write(png(64, 48))
+
+    n = len(gene["transcripts"])
+    return RVector([
+        RVector(gene["transcripts"]),
+        RVector([gene["chr"]] * n),
+        RVector([gene["start"]] * n),
+        RVector([gene["end"]] * n),
+        RVector([path]),
+    ], ["transcripts", "chr", "start", "end", "file"])
+
+
+def search_genes_in_ballgown(symbols, bg):
+    from stress_mice.expression_store import gene_matrix
+
+    genes = {g["name"]: g for g in bg["genes"]}
+    return gene_matrix(symbols, ["FPKM." + s["ids"] for s in bg["samples"]],
+                       lambda symbol: [expression(bg, symbol, s["ids"]) for s in bg["samples"]] if symbol in genes else None)
+
+
+FUNCTIONS = {fx.__name__: fx for fx in [getGenes, getTranscript, getCovariates, SearchByGene, SearchGeneIsoforms,
+                                        SearchByTranscript, SearchByFeature, SearchByCondition, Gene_Plotter_By_Group,
+                                        search_genes_in_ballgown]}
+
+# Python functions run by RPool.run(), as function(bg, *args), and their stand-ins above
+RUN_FUNCTIONS = {
+    "stress_mice.expression_store.search_genes_in_ballgown": "search_genes_in_ballgown",
+}
+
+
+def load(path):
+    with open(path) as reader:
+        bg = json.load(reader)
+    # The size of the file stands for R's object.size
+    bg["bytes"] = os.path.getsize(path)
+    return bg
+
+
+class FakeWorker(object):
+
+    def __init__(self, index, budget=None, pinned=()):
+        self.index = index
+        self.lock = threading.Lock()
+        self.datasets = DatasetCache(load, size_of=lambda bg: bg["bytes"], budget=budget, pinned=pinned)
+
+    def request(self, path, function, args, window=None, delay=0):
+        wait_start = time.time()
+        with self.lock:
+            metrics.add_phase("lock_wait", time.time() - wait_start)
+            timings = {}
+
+            start = time.time()
+            misses = self.datasets.misses
+            bg = self.datasets.get(path)
+            timings["dataset_load"] = time.time() - start
+            timings["cache_hit"] = self.datasets.misses == misses
+
+            if function not in FUNCTIONS:
+                raise RWorkerError("Function '{}' is not available in the fake R backend".format(function))
+
+            start = time.time()
+            if delay: time.sleep(delay)
+            result = FUNCTIONS[function](*(list(args) + [bg]))
+            timings["r_call"] = time.time() - start
+
+            start = time.time()
+            if window is not None and isinstance(result, RDataFrame):
+                offset, limit = window
+                first = min(offset, result.total)
+                result = RDataFrame(result.colnames, result.rows[first:offset + limit], first, result.total)
+            timings["conversion"] = time.time() - start
+
+        metrics.add_worker_timings(timings)
+        return result
+
+
+class FakePool(object):
+
+    def __init__(self, size, budget=None, pinned=(), delay=0):
+        self.delay = delay
+        self.workers = [FakeWorker(i, budget, pinned) for i in range(max(1, size))]
+
+    def worker_for(self, bioproject):
+        return self.workers[zlib.crc32(bioproject.encode("utf-8")) % len(self.workers)]
+
+    def call(self, bioproject, path, function, *args):
+        return self.worker_for(bioproject).request(path, function, args, delay=self.delay)
+
+    def table(self, bioproject, path, offset, limit, function, *args):
+        return self.worker_for(bioproject).request(path, function, args, (offset, limit), self.delay)
+
+    def run(self, bioproject, path, function, *args):
+        if function not in RUN_FUNCTIONS:
+            raise RWorkerError("Python functions on Ballgown objects ({}) need the real R backend".format(function))
+        return self.worker_for(bioproject).request(path, RUN_FUNCTIONS[function], args, delay=self.delay)
+
+    def clear(self):
+        for worker in self.workers:
+            with worker.lock:
+                worker.datasets.clear()
+
+    def preload(self, bioproject, path):
+        worker = self.worker_for(bioproject)
+        with worker.lock:
+            worker.datasets.get(path)
+            entry = worker.datasets.entries[path]
+        return {"size": entry["size"], "load_seconds": entry["load_seconds"], "max_rss": 0}
+
+    def stats(self):
+        return [dict(worker.datasets.stats(), worker=worker.index) for worker in self.workers]
+
+    def stop(self):
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(definitions, pinned=()):
+    # Same signature as rpool.get_pool; definitions.R is not needed
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = FakePool(getattr(settings, "R_WORKERS", 4), getattr(settings, "R_WORKER_DATASET_BYTES", None),
+                             pinned, getattr(settings, "FAKE_R_DELAY", 0))
+    return _pool
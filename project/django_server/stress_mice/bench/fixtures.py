@@ -0,0 +1,227 @@
+"""
+Synthetic data/ tree for the benchmarks.
+
+generate() writes, for a chosen number of bioprojects, genes, samples
+and configurations, every file the views read: project.json, the
+phenodata, the DESeq tables, configurations.tsv, combinations.tsv, the
+diff/<key>=<value>/ tables with their distribution.txt, the annotation
+(gene ids and GTF) and, in place of each bg.RData, the JSON description
+of the dataset served by the fake R backend (see fake_r.py). Values are
+drawn from a seeded generator, so the same arguments give the same tree.
+fixture.json records the arguments and the names the benchmarks query;
+a previous fixture is removed first, so no file of another size remains.
+"""
+import json
+import os
+import random
+import shutil
+import struct
+import zlib
+
+from stress_mice.utils import distribution
+
+MANIFEST = "fixture.json"
+
+CHROMOSOMES = ["chr" + str(x) for x in range(1, 20)] + ["chrX"]
+
+# Phenodata columns and the values they cycle through
+COVARIATES = [
+    ("Region", ["hipp", "pfc", "nacc", "amy", "hypo"]),
+    ("Stress.protocol", ["control", "RS", "CSDS", "FST", "CFC"]),
+    ("Time_from_stress.h", ["0", "1", "4", "24"]),
+]
+
+
+def png(width=1, height=1):
+    # A blank RGBA image, for the plots and the phenotypic information
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    pixels = b"".join(b"\0" + b"\0" * 4 * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)) +
+            chunk(b"IDAT", zlib.compress(pixels)) + chunk(b"IEND", b""))
+
+
+def bioproject_id(i):
+    return "PRJNA" + str(900001 + i)
+
+
+def gene_name(i):
+    return "Gsyn{:05d}".format(i + 1)
+
+
+def write_text(path, text):
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, "w") as writer:
+        writer.write(text)
+
+
+def check_target(directory):
+    # Only an empty directory or a previous fixture may be overwritten
+    if not os.path.exists(directory): return
+    if os.path.exists(os.path.join(directory, MANIFEST)):
+        shutil.rmtree(directory)
+    elif os.listdir(directory):
+        raise ValueError("Refusing to write a fixture into {}: it is not empty and holds no {}".format(directory, MANIFEST))
+
+
+def make_genes(rng, n_genes):
+    genes = []
+    for i in range(n_genes):
+        chromosome = rng.choice(CHROMOSOMES)
+        start = rng.randint(1000000, 190000000)
+        end = start + rng.randint(1000, 200000)
+        strand = rng.choice("+-")
+        transcripts = [gene_name(i) + ".t" + str(t + 1) for t in range(rng.randint(1, 3))]
+        genes.append({
+            "name": gene_name(i),
+            "id": str(100000 + i),
+            "chr": chromosome,
+            "start": start,
+            "end": end,
+            "strand": strand,
+            "transcripts": transcripts,
+        })
+    return genes
+
+
+def write_annotation(directory, genes):
+    write_text(os.path.join(directory, "genename2id.tsv"), "".join(g["name"] + "\t" + g["id"] + "\n" for g in genes))
+    write_text(os.path.join(directory, "Mus_musculus.GRCm38.93.genes.gtf"), "".join(
+        "\t".join([g["chr"].replace("chr", ""), "synthetic", "gene", str(g["start"]), str(g["end"]), ".", g["strand"], ".",
+                   'gene_id "{}"; gene_name "{}";'.format(g["id"], g["name"])]) + "\n"
+        for g in genes))
+
+
+def make_samples(rng, bioproject, n_samples):
+    samples = []
+    for s in range(n_samples):
+        sample = {"ids": "SRR" + bioproject[5:] + "{:04d}".format(s)}
+        for i, (covariate, values) in enumerate(COVARIATES):
+            sample[covariate] = values[(s // (i + 1)) % len(values)]
+        sample["Replicate"] = str(s % 3 + 1)
+        samples.append(sample)
+    return samples
+
+
+def write_phenodata(path, samples):
+    columns = ["ids"] + [c for c, _ in COVARIATES] + ["Replicate"]
+    write_text(path, ",".join(columns) + "\n" + "".join(",".join(s[c] for c in columns) + "\n" for s in samples))
+
+
+def write_degs(rng, path, genes):
+    lines = ["gene baseMean log2FoldChange lfcSE stat pvalue padj\n"]
+    for g in genes:
+        fc = rng.gauss(0, 2)
+        pvalue = rng.random() ** 3
+        lines.append(" ".join([g["name"], "%.4f" % rng.uniform(1, 5000), "%.6f" % fc, "%.6f" % rng.uniform(0.1, 1),
+                               "%.6f" % (fc * 3), "%.6g" % pvalue, "%.6g" % min(1, pvalue * 10)]) + "\n")
+    write_text(path, "".join(lines))
+
+
+def write_diff_tables(rng, directory, name, genes):
+    gene_lines = ['"t_id","id","feature","fc","pval","qval","chr","strand","start","end","t_name","num_exons","length","gene_id","gene_name"\n']
+    transcript_lines = ['"id","feature","fc","pval","qval","chr","strand","start","end","t_name","num_exons","length","gene_id","gene_name"\n']
+    for i, g in enumerate(rng.sample(genes, max(1, len(genes) // 10))):
+        fc = rng.gauss(0, 3)
+        pval, qval = rng.random() / 20, rng.random()
+        position = ['"' + g["chr"] + '"', '"' + g["strand"] + '"', str(g["start"]), str(g["end"])]
+        gene_lines.append(",".join([str(i), '"' + g["id"] + '"', '"gene"', repr(fc), repr(pval), repr(qval)] + position +
+                                   ['"' + g["transcripts"][0] + '"', "5", "1000", '"' + g["id"] + '"', '"' + g["name"] + '"']) + "\n")
+        transcript_lines.append(",".join(['"' + str(i) + '"', '"transcript"', repr(fc), repr(pval), repr(qval)] + position +
+                                         ['"' + g["transcripts"][0] + '"', "5", "1000", '"' + g["id"] + '"', '"' + g["name"] + '"']) + "\n")
+
+    write_text(os.path.join(directory, "out_gene", name + ".csv"), "".join(gene_lines))
+    write_text(os.path.join(directory, "out_transcript", name + ".csv"), "".join(transcript_lines))
+
+
+def generate(directory, bioprojects=3, genes=2000, samples=12, configurations=4, seed=0):
+    check_target(directory)
+    rng = random.Random(seed)
+
+    gene_list = make_genes(rng, genes)
+    write_annotation(os.path.join(directory, "annotation"), gene_list)
+
+    projects = []
+    configuration_lines = []
+    combination_lines = []
+    regions = COVARIATES[0][1]
+    protocols = COVARIATES[1][1]
+
+    for b in range(bioprojects):
+        bioproject = bioproject_id(b)
+        sample_list = make_samples(rng, bioproject, samples)
+
+        projects.append({
+            "id": bioproject,
+            "papers": [{"id": str(30000000 + b), "source": "automatic", "url": "https://www.ncbi.nlm.nih.gov/pubmed/" + str(30000000 + b)}],
+            "experiments": [{"dataset": {
+                "bioproject_id": bioproject,
+                "genome": "Mus musculus",
+                "platform": "Illumina HiSeq 2500",
+                "sample_ids": [{"id": s["ids"], "type": "run"}],
+                "size": rng.randint(10 ** 9, 4 * 10 ** 9),
+            }} for s in sample_list],
+        })
+
+        write_phenodata(os.path.join(directory, "phenodata", bioproject, "phenodata.csv"), sample_list)
+        write_degs(rng, os.path.join(directory, "degs", bioproject, "sorted.DEG.csv"), gene_list)
+
+        # Stand-in for bg.RData, read by the fake R backend only
+        write_text(os.path.join(directory, bioproject, "bg.RData"), json.dumps({
+            "bioproject": bioproject,
+            "seed": seed * 1000 + b,
+            "genes": gene_list,
+            "samples": sample_list,
+        }))
+
+        for c in range(configurations):
+            region = regions[(b + c) % len(regions)]
+            protocol = protocols[1 + c % (len(protocols) - 1)]
+            condition = '(Region=="{}") & (Stress.protocol=="control" | Stress.protocol=="{}")'.format(region, protocol)
+            name = "{}_{}".format(bioproject, c + 1)
+
+            configuration_lines.append(bioproject + "\t" + condition + "\n")
+            combination_lines.append("\t".join([name, bioproject, condition, "Stress.protocol", "Stress.protocol|Region"]) + "\n")
+            write_diff_tables(rng, os.path.join(directory, "diff", "Region=" + region), name, gene_list)
+
+    write_text(os.path.join(directory, "project.json"), json.dumps({"id": "Stress", "projects": projects}, indent=1))
+    write_text(os.path.join(directory, "configurations.tsv"), "".join(configuration_lines))
+    write_text(os.path.join(directory, "combinations.tsv"), "".join(combination_lines))
+
+    for name in ["Stress.protocol", "Region", "Time_from_stress.h"]:
+        path = os.path.join(directory, "phenotypic_information", name + ".csv.png")
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as writer:
+            writer.write(png())
+
+    distribution.rebuild_all(os.path.join(directory, "diff"), processes=1)
+
+    manifest = {
+        "bioprojects": bioprojects,
+        "genes": genes,
+        "samples": samples,
+        "configurations": configurations,
+        "seed": seed,
+        "bioproject_ids": [bioproject_id(b) for b in range(bioprojects)],
+        "gene": gene_list[0]["name"],
+        "transcript": gene_list[0]["transcripts"][0],
+        "region": regions[0],
+    }
+    write_text(os.path.join(directory, MANIFEST), json.dumps(manifest, indent=1))
+    return manifest
+
+
+def tree_size(directory):
+    # Bytes on disk of a generated tree
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path): return None
+    with open(path) as reader:
+        return json.load(reader)
@@ -0,0 +1,253 @@
+"""
+Concurrent load generator for the API calls of the frontend.
+
+The request templates come either from the URLs the frontend configuration
+(project/material/config.json) points to, weighted by how many times each
+one appears there, or from a captured access log, replayed in order. The
+placeholders of the frontend URLs (BIOPROJECT, CONDITION, PARAM1) are
+filled in with names from a benchmark fixture, and the POST endpoints get
+the bodies of the benchmark cases (see endpoints.py).
+
+A number of virtual users send requests back to back, each waiting a
+random think time (exponentially distributed around the chosen mean)
+between two requests, either over HTTP to a running server or in this
+process through Django's test client. run() returns the throughput and
+the p50/p95/p99 latency of every endpoint.
+"""
+import bisect
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from stress_mice.bench import endpoints
+
+FRONTEND_PREFIX = "/stress_mice_api/stress_mice/"
+
+# "GET /path HTTP/1.1" in the common/combined log formats
+LOG_REQUEST = re.compile(r'"(GET|POST|HEAD) (\S+) HTTP/[\d.]+"')
+
+
+class Template(object):
+
+    def __init__(self, endpoint, method, path, body=None, weight=1):
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.body = body
+        self.weight = weight
+
+
+def endpoint_of(path):
+    # First segment after the API prefix, e.g. "genes" for genes/PRJNA1/
+    path = path.split("?")[0]
+    for prefix in [FRONTEND_PREFIX, endpoints.API]:
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+            break
+    return path.strip("/").split("/")[0]
+
+
+def post_bodies(manifest):
+    # Endpoint -> body of its benchmark case, for the endpoints read with POST
+    bodies = {}
+    for case in endpoints.cases(manifest):
+        if case.method == "POST":
+            bodies[endpoint_of(endpoints.API + case.path)] = case.body
+    return bodies
+
+
+# Autocomplete sources: the frontend appends what has been typed so far
+AUTOCOMPLETE = {"genes": "gene", "transcripts": "transcript"}
+
+
+def fill(path, manifest, rng):
+    bioproject = rng.choice(manifest["bioproject_ids"])
+    path = path.replace("BIOPROJECT", bioproject).replace("PARAM1", bioproject).replace("CONDITION", "Region")
+    name = manifest[AUTOCOMPLETE[endpoint_of(path)]] if endpoint_of(path) in AUTOCOMPLETE else None
+    if name is not None and path.endswith("/"):
+        path += name[:rng.randint(1, len(name))]
+    return path
+
+
+def from_config(config_path, manifest):
+    with open(config_path) as reader:
+        config = json.load(reader)
+
+    counts = {}
+
+    def walk(node):
+        if isinstance(node, dict):
+            url = node.get("url")
+            if isinstance(url, str) and url.startswith(FRONTEND_PREFIX):
+                counts[url] = counts.get(url, 0) + 1
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(config)
+
+    bodies = post_bodies(manifest)
+    templates = []
+    for url, count in sorted(counts.items()):
+        endpoint = endpoint_of(url)
+        if endpoint in bodies:
+            templates.append(Template(endpoint, "POST", FRONTEND_PREFIX + endpoint + "/", bodies[endpoint], count))
+        else:
+            templates.append(Template(endpoint, "GET", url, None, count))
+    return templates
+
+
+def from_access_log(log_path, manifest):
+    # Access logs hold no request bodies: POSTs get the benchmark ones
+    bodies = post_bodies(manifest)
+    templates = []
+    with open(log_path) as reader:
+        for line in reader:
+            match = LOG_REQUEST.search(line)
+            if match is None: continue
+            method, path = match.groups()
+            endpoint = endpoint_of(path)
+            if method == "POST":
+                if endpoint not in bodies: continue
+                templates.append(Template(endpoint, "POST", path, bodies[endpoint]))
+            else:
+                templates.append(Template(endpoint, method, path))
+    return templates
+
+
+def local_path(path, api_prefix):
+    # The frontend goes through a proxy mounting the API under FRONTEND_PREFIX
+    if path.startswith(FRONTEND_PREFIX):
+        return api_prefix + path[len(FRONTEND_PREFIX):]
+    return path
+
+
+class HttpSender(object):
+
+    def __init__(self, base_url, timeout=300):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def __call__(self, method, path, body):
+        data = json.dumps(body).encode("utf-8") if method == "POST" else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers={"Content-Type": "application/json", "Accept-Encoding": "gzip"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+
+class ClientSender(object):
+    """Sends the requests in this process through Django's test client (one per thread)."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def __call__(self, method, path, body):
+        from django.test import Client
+
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = Client()
+
+        if method == "POST":
+            response = client.post(path, data=json.dumps(body), content_type="application/json")
+        else:
+            response = client.generic(method, path)
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, len(content)
+
+
+def run(templates, send, manifest, concurrency=8, duration=30, requests=None, think=0.5, replay=False, api_prefix=endpoints.API, seed=0):
+    if not templates:
+        raise ValueError("No request templates")
+
+    samples = []
+    lock = threading.Lock()
+    deadline = time.time() + duration if duration else None
+    sequence = {"next": 0}
+    # random.choices is not available before Python 3.6
+    cumulative = list(itertools.accumulate(t.weight for t in templates))
+
+    def next_template(rng):
+        with lock:
+            if requests is not None and sequence["next"] >= requests: return None
+            index = sequence["next"]
+            sequence["next"] += 1
+        if replay: return templates[index % len(templates)]
+        return templates[bisect.bisect_right(cumulative, rng.random() * cumulative[-1])]
+
+    def user(number):
+        rng = random.Random(seed * 1000 + number)
+        while deadline is None or time.time() < deadline:
+            template = next_template(rng)
+            if template is None: break
+
+            path = local_path(template.path if replay else fill(template.path, manifest, rng), api_prefix)
+            start = time.time()
+            try:
+                status, size = send(template.method, path, template.body)
+            except Exception as e:
+                status, size = type(e).__name__, 0
+            samples.append((template.endpoint, start, time.time() - start, status, size))
+
+            if think > 0:
+                time.sleep(rng.expovariate(1.0 / think))
+
+    started = time.time()
+    threads = [threading.Thread(target=user, args=(i,), name="loadtest-{}".format(i)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    return summarize(samples, elapsed, concurrency, think)
+
+
+def summarize(samples, elapsed, concurrency, think):
+    def stats(group):
+        latencies = [x[2] * 1000 for x in group]
+        errors = sum(1 for x in group if not isinstance(x[3], int) or x[3] >= 400)
+        return {
+            "requests": len(group),
+            "errors": errors,
+            "throughput_rps": len(group) / elapsed if elapsed else 0,
+            "mean_ms": sum(latencies) / len(latencies),
+            "p50_ms": endpoints.percentile(latencies, 50),
+            "p95_ms": endpoints.percentile(latencies, 95),
+            "p99_ms": endpoints.percentile(latencies, 99),
+            "max_ms": max(latencies),
+            "bytes": sum(x[4] for x in group),
+        }
+
+    by_endpoint = {}
+    for sample in samples:
+        by_endpoint.setdefault(sample[0], []).append(sample)
+
+    return {
+        "seconds": elapsed,
+        "concurrency": concurrency,
+        "think_seconds": think,
+        "total": stats(samples) if samples else None,
+        "endpoints": {name: stats(group) for name, group in sorted(by_endpoint.items())},
+    }
+
+
+def format_report(report):
+    lines = ["{:<32} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}".format("endpoint", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms")]
+    rows = sorted(report["endpoints"].items())
+    if report["total"] is not None:
+        rows.append(("TOTAL", report["total"]))
+    for name, entry in rows:
+        lines.append("{:<32} {:>8} {:>7} {:>9.2f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            name, entry["requests"], entry["errors"], entry["throughput_rps"], entry["p50_ms"], entry["p95_ms"], entry["p99_ms"]))
+    return lines
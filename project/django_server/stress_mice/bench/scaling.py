@@ -0,0 +1,139 @@
+"""
+Growth of the endpoint latencies and allocations with the size of the data.
+
+Starting from a base fixture size, each axis (bioprojects, genes, samples,
+configurations) is multiplied in turn by a list of factors, the other
+ones staying at their base value. Every scale point is generated in its
+own directory and measured by bench_endpoints in a fresh process, so that
+no cache, module constant or memory is shared between two points.
+
+For every axis and endpoint, the report gives the measurements at each
+factor and their growth exponents: log(value / base value) / log(factor)
+at the largest factor, 0 for a constant cost and 1 for a linear one. The
+endpoints with the largest exponents are those that break first when the
+study grows along that axis.
+"""
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+
+from django.conf import settings
+
+from stress_mice.bench import fixtures
+
+AXES = ["bioprojects", "genes", "samples", "configurations"]
+
+BASE = {"bioprojects": 3, "genes": 2000, "samples": 12, "configurations": 4}
+
+# Measurements whose growth is reported
+KEYS = ["p50_ms", "p95_ms", "alloc_peak_bytes", "bytes"]
+
+
+def points(base, factors, axes=AXES):
+    # (axis, factor, sizes) of every scale point; the base point is measured once, as factor 1
+    yield None, 1, dict(base)
+    for axis in axes:
+        for factor in factors:
+            if factor == 1: continue
+            sizes = dict(base)
+            sizes[axis] = max(1, int(round(base[axis] * factor)))
+            yield axis, factor, sizes
+
+
+def point_name(sizes):
+    return "_".join("{}{}".format(axis[0], sizes[axis]) for axis in AXES)
+
+
+def measure_point(sizes, directory, repeat=5, seed=0, only=None):
+    # Generates the tree of this point and measures it with bench_endpoints in a subprocess
+    output = os.path.join(directory, "report.json")
+    command = [sys.executable, os.path.join(settings.BASE_DIR, "manage.py"), "bench_endpoints", "--generate",
+               "--seed", str(seed), "--repeat", str(repeat), "--output", output]
+    for axis in AXES:
+        command += ["--" + axis, str(sizes[axis])]
+    if only:
+        command += ["--only"] + list(only)
+
+    env = dict(os.environ, STRESS_MICE_BENCH_DIR=directory, DJANGO_SETTINGS_MODULE="stress_mice.bench.settings")
+    subprocess.check_call(command, env=env, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL)
+
+    with open(output) as reader:
+        report = json.load(reader)
+    report["data_bytes"] = fixtures.tree_size(os.path.join(directory, "data"))
+    return report
+
+
+def exponent(before, after, factor):
+    if not before or after is None or factor == 1: return None
+    if after <= 0: return None
+    return math.log(float(after) / before) / math.log(factor)
+
+
+def run(work_dir, base=BASE, factors=(1, 2, 5, 10), axes=AXES, repeat=5, seed=0, only=None, keep=False, log=None):
+    measured = []
+    for axis, factor, sizes in points(base, factors, axes):
+        directory = os.path.join(work_dir, point_name(sizes))
+        if log is not None:
+            log("Measuring {}".format(", ".join("{}={}".format(a, sizes[a]) for a in AXES)))
+        try:
+            report = measure_point(sizes, directory, repeat, seed, only)
+        finally:
+            if not keep:
+                shutil.rmtree(directory, ignore_errors=True)
+        measured.append((axis, factor, sizes, report))
+
+    base_report = measured[0][3]
+    result = {"base": dict(base), "factors": list(factors), "repeat": repeat, "commit": base_report.get("commit"),
+              "axes": {}}
+
+    for axis in axes:
+        series = [(1, measured[0][2], base_report)] + [(f, s, r) for a, f, s, r in measured if a == axis]
+        largest_factor, _, largest = series[-1]
+
+        endpoints = {}
+        for name in sorted(base_report["endpoints"]):
+            entries = [dict({k: report["endpoints"].get(name, {}).get(k) for k in KEYS + ["error"]}, factor=factor, size=sizes[axis])
+                       for factor, sizes, report in series]
+            endpoints[name] = {
+                "points": entries,
+                "growth": {k: exponent(entries[0][k], entries[-1][k], largest_factor) for k in KEYS},
+            }
+
+        result["axes"][axis] = {
+            "sizes": [sizes[axis] for _, sizes, _ in series],
+            "data_bytes": [report["data_bytes"] for _, _, report in series],
+            "endpoints": endpoints,
+        }
+
+    return result
+
+
+def format_report(report, key="p50_ms"):
+    # Per axis, the endpoints by decreasing growth exponent of `key`
+    lines = []
+    for axis, entry in sorted(report["axes"].items()):
+        lines.append("")
+        lines.append("{} ({}), data {}".format(axis, " -> ".join(str(s) for s in entry["sizes"]),
+                                             " -> ".join("{:.1f}MB".format(b / 1e6) for b in entry["data_bytes"])))
+        lines.append("{:<32} {:>17} {:>9} {:>17} {:>9}".format("endpoint", key, "exponent", "alloc", "exponent"))
+
+        def order(item):
+            growth = item[1]["growth"][key]
+            return -growth if growth is not None else float("inf")
+
+        for name, endpoint in sorted(entry["endpoints"].items(), key=order):
+            points = endpoint["points"]
+            errors = [p["error"] for p in points if p["error"]]
+            if errors:
+                lines.append("{:<32} {}".format(name, errors[0]))
+                continue
+            lines.append("{:<32} {:>17} {:>9} {:>17} {:>9}".format(
+                name,
+                "/".join("{:.1f}".format(p[key]) if p[key] is not None else "-" for p in (points[0], points[-1])),
+                "{:.2f}".format(endpoint["growth"][key]) if endpoint["growth"][key] is not None else "-",
+                "/".join("{:.0f}k".format(p["alloc_peak_bytes"] / 1e3) if p["alloc_peak_bytes"] is not None else "-" for p in (points[0], points[-1])),
+                "{:.2f}".format(endpoint["growth"]["alloc_peak_bytes"]) if endpoint["growth"]["alloc_peak_bytes"] is not None else "-"))
+    return lines
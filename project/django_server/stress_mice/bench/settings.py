@@ -0,0 +1,33 @@
+"""
+Settings of the benchmarks: the project settings with the fake R backend
+and every data location under STRESS_MICE_BENCH_DIR (by default
+<tmp>/stress_mice_bench).
+"""
+import os
+import tempfile
+
+from django_server.settings import *  # noqa: F401,F403
+from django_server.settings import LOGGING
+
+BENCH_DIR = os.environ.get("STRESS_MICE_BENCH_DIR", os.path.join(tempfile.gettempdir(), "stress_mice_bench"))
+
+STRESS_MICE_DATA_DIR = os.path.join(BENCH_DIR, "data")
+STRESS_MICE_PLOT_DIR = os.path.join(BENCH_DIR, "plots")
+STRESS_MICE_ANNOTATION_DIR = os.path.join(STRESS_MICE_DATA_DIR, "annotation")
+
+R_BACKEND = "stress_mice.bench.fake_r.get_pool"
+# Seconds added to every fake R call
+FAKE_R_DELAY = float(os.environ.get("STRESS_MICE_FAKE_R_DELAY", 0))
+
+WARMUP_ON_STARTUP = False
+
+ALLOWED_HOSTS = ["testserver", "localhost", "127.0.0.1"]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCH_DIR, 'db.sqlite3'),
+    }
+}
+
+LOGGING["loggers"]["stress_mice"]["level"] = os.environ.get("STRESS_MICE_LOG_LEVEL", "WARNING")
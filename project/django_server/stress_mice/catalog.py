@@ -0,0 +1,104 @@
+"""
+In-memory catalog of the bioprojects described in data/project.json.
+
+The file is parsed and aggregated once per version: the catalog keeps the
+per-bioproject summary (size, samples, experiments, platforms, papers)
+and re-reads the file only when its mtime, size or content hash changes,
+or when refresh() is called.
+"""
+import hashlib
+import json
+import os
+import threading
+
+# Bioprojects skipped/removed by Arianna
+EXCLUDED_BIOPROJECTS = ["PRJNA341670", "PRJNA392171"]
+
+
+def aggregate(dataset):
+    map = {}
+    for bioproject in dataset["projects"]:
+        bioproject_id = bioproject["id"]
+
+        if bioproject_id in EXCLUDED_BIOPROJECTS: continue
+
+        if bioproject_id not in map:
+            map[bioproject_id] = {
+                    "size": 0,
+                    "organism": None,
+                    "experiments": 0,
+                    "paper_id": set(),
+                    "platform": set(),
+                    "samples": 0,
+                }
+        data = map[bioproject_id]
+
+        data["paper_id"] = bioproject["papers"]
+
+        for experiment in bioproject["experiments"]:
+            data["experiments"] += 1
+            dataset = experiment["dataset"]
+            size = dataset["size"]
+            organism = dataset["genome"]
+            platform = dataset["platform"]
+            samples = len(dataset["sample_ids"])
+
+            data["size"] += size
+            data["platform"].add(platform)
+            data["samples"] += samples
+            data["organism"] = organism
+
+    return map
+
+
+class DatasetCatalog(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.projects = {}
+        self._stat = None
+        self._lock = threading.Lock()
+
+    def _current_stat(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self):
+        if self._current_stat() != self._stat:
+            self.refresh()
+
+        return self.projects
+
+    def refresh(self):
+        with self._lock:
+            stat = self._current_stat()
+            with open(self.path, "rb") as reader:
+                content = reader.read()
+
+            # A touched but unchanged file only costs the hash, not a reparse
+            version = hashlib.sha1(content).hexdigest()
+            if version != self.version:
+                self.projects = aggregate(json.loads(content.decode("utf-8")))
+                self.version = version
+
+            self._stat = stat
+
+        return self.projects
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(path):
+    catalog = _catalogs.get(path)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.setdefault(path, DatasetCatalog(path))
+    return catalog
+
+
+def refresh():
+    for catalog in list(_catalogs.values()):
+        catalog.refresh()
@@ -0,0 +1,62 @@
+"""
+Compiled form of data/combinations.tsv.
+
+Each line of the file describes a combination (id, bioproject, condition,
+covariate, dimensions). The conditions are parsed with the selector
+once per version of the file, and the dimensions and the values each
+dimension takes in the conditions are gathered, so that building the
+selection form only has to leave out the dimensions already chosen.
+The selector is imported when the index is built, so that the module
+(and the views importing it) load where utils/selector.py is missing.
+"""
+from stress_mice.datacache import FileBackedCache
+
+
+class Combination(object):
+
+    def __init__(self, id, bioproject, condition, covariate, dimensions):
+        self.id = id
+        self.bioproject = bioproject
+        self.condition = condition
+        self.covariate = covariate
+        self.dimensions = dimensions
+
+
+class CombinationsIndex(object):
+
+    def __init__(self, path):
+        from stress_mice.utils import selector
+
+        self.combinations = []
+        self.dimensions = set()
+        self.values = {}
+        self.by_bioproject = {}
+
+        with open(path, "r") as file:
+            for line in file:
+                combination_id, bioproject, condition, covariate, dimensions = line.strip().split("\t")
+
+                combination = Combination(combination_id, bioproject, selector.parse_condition(selector.tokenize(condition)), covariate, dimensions.split("|"))
+                self.combinations.append(combination)
+                self.by_bioproject.setdefault(bioproject, []).append(combination_id)
+                self.dimensions.update(combination.dimensions)
+
+                for leaf in combination.condition.get_leaves():
+                    if selector.get_operator(leaf) is None: continue
+                    key, value = leaf.split(selector.get_operator(leaf))
+                    self.values.setdefault(key, set()).add(value.replace("\"", ""))
+
+        # Sorted once here rather than on every request
+        self.sorted_values = {key: sorted(values) for key, values in self.values.items()}
+
+    def options(self, chosen=()):
+        # The dimensions still available, each with its sorted values
+        chosen = set(chosen)
+        return [(option, self.sorted_values.get(option, [])) for option in sorted(self.dimensions - chosen)]
+
+
+_indexes = FileBackedCache()
+
+
+def get_index(path):
+    return _indexes.get(path, [path], lambda: CombinationsIndex(path))
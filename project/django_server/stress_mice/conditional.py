@@ -0,0 +1,73 @@
+"""
+Conditional GET for the views whose response only depends on files under data/.
+
+data_condition(paths) wraps such a view with Django's condition() decorator
+and a Cache-Control header: the ETag is a hash of the stamps (mtime and
+size) of the files the view reads, as returned by paths(request, *args),
+and of the request path, body and query string; Last-Modified is the
+newest mtime among those files. A request carrying a matching
+If-None-Match or If-Modified-Since is answered 304 after a few
+os.stat() calls, without running the view. Only GET and HEAD requests
+get validators: for the POST queries of the frontend, a conditional
+header sent by a client or proxy would otherwise be answered 412.
+"""
+import datetime
+import functools
+import hashlib
+import os
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from stress_mice.datacache import file_stamp
+
+
+def request_etag(request, paths):
+    digest = hashlib.sha1()
+    digest.update(repr(file_stamp(paths)).encode("utf-8"))
+    digest.update(request.path.encode("utf-8"))
+    digest.update(b"\0" + request.body)
+    for key in sorted(request.GET):
+        digest.update(("\0" + key + "=" + "\t".join(request.GET.getlist(key))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def last_modified(paths):
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            continue
+    if not mtimes: return None
+    return datetime.datetime.utcfromtimestamp(max(mtimes))
+
+
+def is_cacheable(request):
+    return request.method in ("GET", "HEAD")
+
+
+def data_condition(paths):
+    def etag(request, *args, **kwargs):
+        if not is_cacheable(request): return None
+        return request_etag(request, paths(request, *args, **kwargs))
+
+    def modified(request, *args, **kwargs):
+        if not is_cacheable(request): return None
+        return last_modified(paths(request, *args, **kwargs))
+
+    def decorator(view):
+        conditional = condition(etag_func=etag, last_modified_func=modified)(view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            # Caches may keep the response for a while, then revalidate it with the ETag
+            if is_cacheable(request) and response.status_code in (200, 304):
+                patch_cache_control(response, public=True, max_age=getattr(settings, "HTTP_CACHE_MAX_AGE", 0))
+            return response
+
+        return wrapper
+
+    return decorator
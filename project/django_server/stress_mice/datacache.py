@@ -0,0 +1,58 @@
+"""
+Process-wide cache for structures derived from files under data/.
+
+Entries are keyed by an arbitrary name and remember the modification
+time and size of the files they were built from: a lookup is a few
+os.stat() calls and the structure is rebuilt only after one of those
+files changes on disk.
+"""
+import os
+import threading
+
+
+def file_stamp(paths):
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
+
+
+class FileBackedCache(object):
+
+    def __init__(self):
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        # One lock per key: a slow build only blocks requests for that key
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, key, paths, build):
+        stamp = file_stamp(paths)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+
+            value = build()
+            self._entries[key] = (stamp, value)
+
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
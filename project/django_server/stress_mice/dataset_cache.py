@@ -0,0 +1,103 @@
+"""
+Memory-bounded LRU cache for the Ballgown objects held by an R worker.
+
+Each entry records its estimated size, so the cache can evict the least
+recently used datasets once the worker's budget is exceeded. Pinned
+datasets are never evicted. Hits, misses, evictions and load times are
+counted and reported by stats().
+
+Eviction only runs after a load: the new dataset is loaded before older
+ones are released, so a worker's peak memory is its budget plus the
+size of the incoming dataset.
+
+The budget (R_WORKER_DATASET_BYTES) applies to each R worker on its own.
+A pool of R_WORKERS workers may hold up to R_WORKERS times as much, and
+every server process started by the WSGI server has its own pool.
+"""
+import collections
+import time
+
+
+class DatasetCache(object):
+
+    def __init__(self, load, size_of, budget=None, pinned=(), release=None):
+        # load(key) builds the object, size_of(obj) estimates its size in
+        # bytes and release() is called after evictions (e.g. R's gc()).
+        self.load = load
+        self.size_of = size_of
+        self.budget = budget
+        self.pinned = set(pinned)
+        self.release = release
+
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    @property
+    def used(self):
+        return sum(entry["size"] for entry in self.entries.values())
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            entry["hits"] += 1
+            self.entries.move_to_end(key)
+            return entry["value"]
+
+        self.misses += 1
+        start = time.time()
+        value = self.load(key)
+        elapsed = time.time() - start
+        self.load_seconds += elapsed
+
+        self.entries[key] = {
+            "value": value,
+            "size": self.size_of(value),
+            "hits": 0,
+            "load_seconds": elapsed,
+            "loaded_at": time.time(),
+        }
+        self.evict(keep=key)
+
+        return value
+
+    def evict(self, keep=None):
+        if self.budget is None: return
+
+        evicted = False
+        for key in list(self.entries.keys()):
+            if self.used <= self.budget: break
+            if key == keep or key in self.pinned: continue
+
+            del self.entries[key]
+            self.evictions += 1
+            evicted = True
+
+        if evicted and self.release is not None:
+            self.release()
+
+    def clear(self):
+        self.entries.clear()
+        if self.release is not None:
+            self.release()
+
+    def stats(self):
+        return {
+            "budget": self.budget,
+            "used": self.used,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "load_seconds": self.load_seconds,
+            "datasets": [{
+                "key": key,
+                "size": entry["size"],
+                "hits": entry["hits"],
+                "pinned": key in self.pinned,
+                "load_seconds": entry["load_seconds"],
+                "loaded_at": entry["loaded_at"],
+            } for key, entry in self.entries.items()],
+        }
@@ -0,0 +1,206 @@
+"""
+Typed, columnar copy of the DESeq2 tables in data/degs/<bioproject>/sorted.DEG.csv.
+
+The space-separated text file is converted once into sorted.DEG.bin,
+which holds the gene names and one float64 column per statistic (NA is
+stored as NaN and flagged in a per-column NA mask). The binary file is
+rebuilt whenever the CSV changes.
+
+Filtering on p-value, adjusted p-value and fold change yields the array
+of matching row numbers, which is cached per set of thresholds: the
+total is its length and any page is a slice of it, so page 500 costs
+the same as page 1. Column filters and sorting (see table_query.py) are
+applied to that array: the sort order of each column is computed once
+per table, and the result of each query is cached with the thresholds.
+"""
+import collections
+import json
+import os
+import threading
+from array import array
+
+from stress_mice import table_query
+from stress_mice.datacache import FileBackedCache, file_stamp
+
+COLUMNS = ["baseMean", "log2FoldChange", "lfcSE", "stat", "pvalue", "padj"]
+
+MAGIC = b"DEG1\n"
+
+# Number of distinct threshold combinations remembered per table
+SELECTION_CACHE_SIZE = 32
+
+
+class DegTable(object):
+
+    def __init__(self, header, genes, columns, na):
+        self.header = header
+        self.genes = genes
+        self.columns = columns
+        self.na = na
+        self.index = {}
+        for i, gene in enumerate(genes):
+            self.index.setdefault(gene, i)
+
+        self._selections = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._queryable = None
+
+    def __len__(self):
+        return len(self.genes)
+
+    def fields(self, i):
+        # The row as the view used to split it from the text file: gene
+        # name followed by the six statistics (NaN where the file had NA).
+        return [self.genes[i]] + [self.columns[name][i] for name in COLUMNS]
+
+    def queryable(self, extra_columns=None):
+        # table_query.Table over the gene names and the statistics, labelled
+        # as in the header; extra_columns: label -> function(genes) giving
+        # the values of a column computed elsewhere (e.g. from the
+        # annotation). The Table is built, with these columns, by the first
+        # call and shared afterwards, so later extra_columns are ignored.
+        with self._lock:
+            if self._queryable is None:
+                columns = {self.header[0]: self.genes}
+                for label, name in zip(self.header[1:], COLUMNS):
+                    columns[label] = self.columns[name]
+                lazy = {label: (lambda function=function: function(self.genes)) for label, function in (extra_columns or {}).items()}
+                self._queryable = table_query.Table(columns, len(self), lazy)
+            return self._queryable
+
+    def select(self, pvalue, qvalue, min_fold_change, query=None, extra_columns=None):
+        if query:
+            return self._select_query(pvalue, qvalue, min_fold_change, query, extra_columns)
+
+        key = (pvalue, qvalue, min_fold_change)
+
+        with self._lock:
+            selection = self._selections.get(key)
+            if selection is not None:
+                self._selections.move_to_end(key)
+                return selection
+
+        # NaN compares false with everything, so rows with NA in any of
+        # the three columns are dropped, as before.
+        selection = array("l", [
+            i for i, (fc, p, q) in enumerate(zip(self.columns["log2FoldChange"], self.columns["pvalue"], self.columns["padj"]))
+            if fc >= min_fold_change and p <= pvalue and q <= qvalue
+        ])
+
+        with self._lock:
+            self._selections[key] = selection
+            while len(self._selections) > SELECTION_CACHE_SIZE:
+                self._selections.popitem(last=False)
+
+        return selection
+
+    def _select_query(self, pvalue, qvalue, min_fold_change, query, extra_columns):
+        key = (pvalue, qvalue, min_fold_change, query.key())
+
+        with self._lock:
+            selection = self._selections.get(key)
+            if selection is not None:
+                self._selections.move_to_end(key)
+                return selection
+
+        selection = self.queryable(extra_columns).select(query, self.select(pvalue, qvalue, min_fold_change))
+
+        with self._lock:
+            self._selections[key] = selection
+            while len(self._selections) > SELECTION_CACHE_SIZE:
+                self._selections.popitem(last=False)
+
+        return selection
+
+
+def parse_csv(path):
+    genes = []
+    columns = {name: array("d") for name in COLUMNS}
+    na = {name: bytearray() for name in COLUMNS}
+
+    with open(path) as reader:
+        header = reader.readline().strip().split(" ")
+
+        for line in reader:
+            line = line.strip()
+            if not line: continue
+
+            fields = line.split(" ")
+            genes.append(fields[0])
+            for name, value in zip(COLUMNS, fields[1:]):
+                missing = value == "NA"
+                columns[name].append(float("nan") if missing else float(value))
+                na[name].append(missing)
+
+    return DegTable(header, genes, columns, {name: bytes(mask) for name, mask in na.items()})
+
+
+def write_binary(table, path, sources):
+    names = "\n".join(table.genes).encode("utf-8")
+    meta = {
+        "sources": sources,
+        "header": table.header,
+        "rows": len(table),
+        "names_bytes": len(names),
+    }
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as writer:
+        writer.write(MAGIC)
+        writer.write(json.dumps(meta).encode("utf-8") + b"\n")
+        writer.write(names)
+        for name in COLUMNS:
+            table.columns[name].tofile(writer)
+        for name in COLUMNS:
+            writer.write(table.na[name])
+    os.replace(tmp_path, path)
+
+
+def read_binary(path, sources):
+    # Returns None if the file is missing or was built from other sources
+    try:
+        reader = open(path, "rb")
+    except OSError:
+        return None
+
+    with reader:
+        if reader.readline() != MAGIC: return None
+
+        meta = json.loads(reader.readline().decode("utf-8"))
+        if [list(x) for x in sources] != meta["sources"]: return None
+
+        n = meta["rows"]
+        names = reader.read(meta["names_bytes"]).decode("utf-8")
+        genes = names.split("\n") if n else []
+
+        columns = {}
+        for name in COLUMNS:
+            columns[name] = array("d")
+            columns[name].fromfile(reader, n)
+        na = {}
+        for name in COLUMNS:
+            na[name] = reader.read(n)
+
+    return DegTable(meta["header"], genes, columns, na)
+
+
+def load_table(csv_path):
+    sources = file_stamp([csv_path])
+    bin_path = os.path.splitext(csv_path)[0] + ".bin"
+
+    table = read_binary(bin_path, sources)
+    if table is None:
+        table = parse_csv(csv_path)
+        try:
+            write_binary(table, bin_path, sources)
+        except OSError:
+            pass
+
+    return table
+
+
+_tables = FileBackedCache()
+
+
+def get_table(csv_path):
+    return _tables.get(csv_path, [csv_path], lambda: load_table(csv_path))
@@ -0,0 +1,237 @@
+"""
+Seekable line index and binary form of the consensus files diff/<key>=<value>/out_gene/distribution.txt.
+
+The sidecar <file>.idx stores the number of lines of the file and the
+byte offset of every STRIDE-th line, so any page can be read by seeking
+close to it and skipping at most STRIDE - 1 lines, and the total comes
+from the index instead of reading the file to the end. The sidecar
+records the size and mtime of the file it describes and is rebuilt
+when they no longer match.
+
+The binary form <file>.bin, written along with the file by
+utils/distribution.py, holds the same records ready to serve: the
+supporting file ids are stored once and referenced by number, and a
+table of record offsets gives any page with a single seek, without
+parsing text. It also records the size and mtime of the text file, and
+is ignored when they no longer match (the view then reads the text
+file through its line index).
+"""
+import os
+import struct
+from array import array
+
+from stress_mice.datacache import FileBackedCache
+
+STRIDE = 256
+
+MAGIC = b"DIDX1\n"
+HEADER = struct.Struct("<IQqQ")  # stride, lines, source mtime (ns), source size
+
+
+class DistributionIndex(object):
+
+    def __init__(self, lines, offsets, stride=STRIDE):
+        self.lines = lines
+        self.offsets = offsets
+        self.stride = stride
+
+    def read(self, path, offset, limit):
+        # Lines offset..offset+limit of the file, without their newline
+        if offset >= self.lines or limit <= 0: return []
+
+        result = []
+        with open(path, "rb") as reader:
+            reader.seek(self.offsets[offset // self.stride])
+            for _ in range(offset % self.stride):
+                reader.readline()
+
+            while len(result) < limit:
+                line = reader.readline()
+                if not line: break
+                result.append(line.decode("utf-8").rstrip("\n"))
+
+        return result
+
+
+class IndexWriter(object):
+    """Collects line offsets while a distribution file is being written."""
+
+    def __init__(self, stride=STRIDE):
+        self.stride = stride
+        self.lines = 0
+        self.position = 0
+        self.offsets = array("Q")
+
+    def add(self, line):
+        # `line` is the encoded line, newline included
+        if self.lines % self.stride == 0:
+            self.offsets.append(self.position)
+        self.lines += 1
+        self.position += len(line)
+
+    def index(self):
+        return DistributionIndex(self.lines, self.offsets, self.stride)
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+def scan(path, stride=STRIDE):
+    writer = IndexWriter(stride)
+    with open(path, "rb") as reader:
+        for line in reader:
+            writer.add(line)
+    return writer.index()
+
+
+def write_index(path, index):
+    st = os.stat(path)
+    tmp_path = index_path(path) + ".tmp"
+    with open(tmp_path, "wb") as writer:
+        writer.write(MAGIC)
+        writer.write(HEADER.pack(index.stride, index.lines, st.st_mtime_ns, st.st_size))
+        index.offsets.tofile(writer)
+    os.replace(tmp_path, index_path(path))
+
+
+def read_index(path):
+    # Returns None if the sidecar is missing or out of date
+    try:
+        st = os.stat(path)
+        with open(index_path(path), "rb") as reader:
+            if reader.read(len(MAGIC)) != MAGIC: return None
+            stride, lines, mtime, size = HEADER.unpack(reader.read(HEADER.size))
+            if (mtime, size) != (st.st_mtime_ns, st.st_size): return None
+
+            offsets = array("Q")
+            offsets.fromfile(reader, (lines + stride - 1) // stride)
+    except (OSError, EOFError, struct.error):
+        return None
+
+    return DistributionIndex(lines, offsets, stride)
+
+
+def load_index(path):
+    index = read_index(path)
+    if index is None:
+        index = scan(path)
+        try:
+            write_index(path, index)
+        except OSError:
+            pass
+    return index
+
+
+BINARY_MAGIC = b"DBIN1\n"
+# records, files, source mtime (ns), source size, position of the file ids, position of the offsets
+BINARY_HEADER = struct.Struct("<QIqQQQ")
+RECORD = struct.Struct("<HIIH")  # label bytes, up, down, supporting files
+
+
+def binary_path(path):
+    return path + ".bin"
+
+
+class BinaryWriter(object):
+    """Writes the binary form record by record; close() completes it once the text file is written."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.writer = open(self.tmp_path, "wb")
+        self.writer.write(BINARY_MAGIC)
+        self.writer.write(b"\0" * BINARY_HEADER.size)
+        self.offsets = array("Q")
+        self.files = {}
+
+    def add(self, label, up, down, who):
+        self.offsets.append(self.writer.tell())
+        label = label.encode("utf-8")
+        numbers = array("I", [self.files.setdefault(x, len(self.files)) for x in who])
+        self.writer.write(RECORD.pack(len(label), up, down, len(numbers)))
+        self.writer.write(label)
+        numbers.tofile(self.writer)
+
+    def close(self, source):
+        records = len(self.offsets)
+        self.offsets.append(self.writer.tell())
+
+        files_position = self.writer.tell()
+        names = sorted(self.files, key=self.files.get)
+        self.writer.write("\n".join(names).encode("utf-8"))
+        offsets_position = self.writer.tell()
+        self.offsets.tofile(self.writer)
+
+        st = os.stat(source)
+        self.writer.seek(len(BINARY_MAGIC))
+        self.writer.write(BINARY_HEADER.pack(records, len(names), st.st_mtime_ns, st.st_size, files_position, offsets_position))
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.writer.close()
+        os.remove(self.tmp_path)
+
+
+class DistributionBinary(object):
+
+    def __init__(self, path, records, files, offsets):
+        self.path = path
+        self.lines = records
+        self.files = files
+        self.offsets = offsets
+
+    def read(self, offset, limit):
+        # Records offset..offset+limit as (label, up, down, [file ids])
+        last = min(offset + limit, self.lines)
+        if offset >= last: return []
+
+        with open(self.path, "rb") as reader:
+            reader.seek(self.offsets[offset])
+            data = reader.read(self.offsets[last] - self.offsets[offset])
+
+        records = []
+        position = 0
+        for _ in range(last - offset):
+            label_size, up, down, count = RECORD.unpack_from(data, position)
+            position += RECORD.size
+            label = data[position:position + label_size].decode("utf-8")
+            position += label_size
+            numbers = array("I")
+            numbers.frombytes(data[position:position + 4 * count])
+            position += 4 * count
+            records.append((label, up, down, [self.files[x] for x in numbers]))
+        return records
+
+
+def read_binary(path):
+    # The binary form of the text file `path`, None if it is missing or out of date
+    try:
+        st = os.stat(path)
+        with open(binary_path(path), "rb") as reader:
+            if reader.read(len(BINARY_MAGIC)) != BINARY_MAGIC: return None
+            records, files, mtime, size, files_position, offsets_position = BINARY_HEADER.unpack(reader.read(BINARY_HEADER.size))
+            if (mtime, size) != (st.st_mtime_ns, st.st_size): return None
+
+            reader.seek(files_position)
+            names = reader.read(offsets_position - files_position).decode("utf-8")
+            offsets = array("Q")
+            offsets.fromfile(reader, records + 1)
+    except (OSError, EOFError, struct.error):
+        return None
+
+    return DistributionBinary(binary_path(path), records, names.split("\n") if files else [], offsets)
+
+
+_indexes = FileBackedCache()
+_binaries = FileBackedCache()
+
+
+def get_binary(path):
+    # Cached until the text file or its binary form changes
+    return _binaries.get(path, [path, binary_path(path)], lambda: read_binary(path))
+
+
+def get_index(path):
+    return _indexes.get(path, [path], lambda: load_index(path))
@@ -0,0 +1,242 @@
+"""
+Columnar, memory-mapped copy of the Ballgown expression matrices.
+
+`export_from_ballgown` runs inside an R worker (see rpool.RPool.run) and
+writes, for each matrix, a raw little-endian float64 file in row-major
+order plus one label per line for its rows and its columns:
+
+    data/<bioproject>/expression/
+        gene_fpkm.f64          gene_fpkm.rows         gene_fpkm.columns
+        transcript_fpkm.f64    transcript_fpkm.rows   transcript_fpkm.columns
+        transcript_cov.f64     transcript_cov.rows    transcript_cov.columns
+        gene_names.tsv         (gene symbol <TAB> gene id)
+        manifest.json          (written last, marks a complete export)
+
+The web process maps these files read-only, so a per-gene lookup is a
+slice of the mapped matrix and pages are only brought in when touched.
+A new export writes every file to <name>.tmp and renames it into place,
+the manifest last: processes that have the previous files mapped keep
+reading them (a file truncated under a mapping would fault on access)
+until the manifest changes and their store is rebuilt.
+Ballgown has no gene-level coverage, hence there is no gene_cov matrix.
+"""
+import json
+import mmap
+import os
+import sys
+from array import array
+
+from stress_mice.datacache import FileBackedCache
+from stress_mice.rpool import RDataFrame, RVector
+
+MATRICES = ["gene_fpkm", "transcript_fpkm", "transcript_cov"]
+
+MATRIX_FILES = [".f64", ".rows", ".columns"]
+
+_EXPORT_R = """
+function(m, prefix) {
+    con <- file(paste0(prefix, ".f64.tmp"), "wb")
+    writeBin(as.double(t(as.matrix(m))), con, size = 8, endian = "little")
+    close(con)
+    writeLines(as.character(rownames(m)), paste0(prefix, ".rows.tmp"))
+    writeLines(as.character(colnames(m)), paste0(prefix, ".columns.tmp"))
+    c(nrow(m), ncol(m))
+}
+"""
+
+
+def export_from_ballgown(bg, directory):
+    import rpy2.robjects as robjects
+    from rpy2.robjects.packages import importr
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    manifest_path = os.path.join(directory, "manifest.json")
+
+    ballgown = importr("ballgown")
+    write_matrix = robjects.r(_EXPORT_R)
+
+    attributes = ballgown.texpr(bg, "all")
+    matrices = {
+        "gene_fpkm": ballgown.gexpr(bg),
+        "transcript_fpkm": ballgown.texpr(bg, "FPKM"),
+        "transcript_cov": ballgown.texpr(bg, "cov"),
+    }
+
+    # Transcript matrices are indexed by t_id: label their rows by t_name
+    t_names = robjects.r("as.character")(attributes.rx2("t_name"))
+    for name in ["transcript_fpkm", "transcript_cov"]:
+        matrices[name] = robjects.r("function(m, n) { rownames(m) <- n; m }")(matrices[name], t_names)
+
+    manifest = {"matrices": {}}
+    for name in MATRICES:
+        shape = write_matrix(matrices[name], os.path.join(directory, name))
+        manifest["matrices"][name] = {"rows": int(shape[0]), "columns": int(shape[1])}
+
+    gene_names = robjects.r("as.character")(attributes.rx2("gene_name"))
+    gene_ids = robjects.r("as.character")(attributes.rx2("gene_id"))
+    seen = set()
+    gene_names_path = os.path.join(directory, "gene_names.tsv")
+    with open(gene_names_path + ".tmp", "w") as writer:
+        for gene_name, gene_id in zip(gene_names, gene_ids):
+            if gene_name in ("", ".", "NA") or (gene_name, gene_id) in seen: continue
+            seen.add((gene_name, gene_id))
+            writer.write(gene_name + "\t" + gene_id + "\n")
+
+    with open(manifest_path + ".tmp", "w") as writer:
+        writer.write(json.dumps(manifest))
+
+    # Everything is written: swap the files in, the manifest last
+    for name in MATRICES:
+        for extension in MATRIX_FILES:
+            path = os.path.join(directory, name + extension)
+            os.replace(path + ".tmp", path)
+    os.replace(gene_names_path + ".tmp", gene_names_path)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return manifest
+
+
+def gene_matrix(symbols, columns, values_of):
+    # Gene x sample table of a list of symbols; values_of(symbol) returns
+    # the row of a symbol, or None for the unknown ones (a row of None)
+    rows = []
+    for symbol in symbols:
+        values = values_of(symbol)
+        if values is None:
+            values = [None] * len(columns)
+        rows.append([symbol] + [None if x != x else x for x in values])
+    return RDataFrame(["gene_name"] + list(columns), rows)
+
+
+def search_genes_in_ballgown(bg, symbols):
+    # Runs inside an R worker (see rpool.RPool.run): the gene_fpkm rows of
+    # all the symbols, extracted from R in one call
+    import rpy2.robjects as robjects
+    from rpy2.robjects.packages import importr
+
+    ballgown = importr("ballgown")
+    attributes = ballgown.texpr(bg, "all")
+    matrix = ballgown.gexpr(bg)
+
+    symbol2genes = {}
+    gene_names = robjects.r("as.character")(attributes.rx2("gene_name"))
+    gene_ids = robjects.r("as.character")(attributes.rx2("gene_id"))
+    for gene_name, gene_id in zip(gene_names, gene_ids):
+        genes = symbol2genes.setdefault(gene_name, [])
+        if gene_id not in genes: genes.append(gene_id)
+
+    index = {}
+    for i, label in enumerate(robjects.r("rownames")(matrix)):
+        index.setdefault(label, i)
+    columns = list(robjects.r("colnames")(matrix))
+
+    found = {}
+    for symbol in symbols:
+        for gene_id in ([symbol] if symbol in index else symbol2genes.get(symbol, [])):
+            if gene_id in index:
+                found[symbol] = index[gene_id]
+                break
+
+    values = {}
+    if found:
+        wanted = sorted(set(found.values()))
+        flat = list(robjects.r("function(m, i) as.double(t(m[i, , drop = FALSE]))")(matrix, robjects.IntVector([i + 1 for i in wanted])))
+        n = len(columns)
+        values = {i: flat[k * n:(k + 1) * n] for k, i in enumerate(wanted)}
+
+    return gene_matrix(symbols, columns, lambda symbol: values[found[symbol]] if symbol in found else None)
+
+
+def _read_labels(path):
+    with open(path) as reader:
+        return [line.rstrip("\n") for line in reader]
+
+
+class Matrix(object):
+
+    def __init__(self, prefix, nrow, ncol):
+        self.rows = _read_labels(prefix + ".rows")
+        self.columns = _read_labels(prefix + ".columns")
+        self.nrow = nrow
+        self.ncol = ncol
+        self.index = {}
+        for i, label in enumerate(self.rows):
+            self.index.setdefault(label, i)
+
+        self._mmap = None
+        if nrow * ncol == 0:
+            self._values = array("d")
+        elif sys.byteorder == "little":
+            with open(prefix + ".f64", "rb") as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._values = memoryview(self._mmap).cast("d")
+        else:
+            self._values = array("d")
+            with open(prefix + ".f64", "rb") as file:
+                self._values.fromfile(file, nrow * ncol)
+            self._values.byteswap()
+
+    def row(self, i):
+        return self._values[i * self.ncol:(i + 1) * self.ncol].tolist()
+
+    def row_by_label(self, label):
+        i = self.index.get(label)
+        if i is None: return None
+        return self.row(i)
+
+
+class ExpressionStore(object):
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "manifest.json")) as reader:
+            manifest = json.loads(reader.read())
+
+        self.matrices = {}
+        for name, shape in manifest["matrices"].items():
+            self.matrices[name] = Matrix(os.path.join(directory, name), shape["rows"], shape["columns"])
+
+        self.symbol2genes = {}
+        for line in _read_labels(os.path.join(directory, "gene_names.tsv")):
+            gene_name, gene_id = line.split("\t")
+            self.symbol2genes.setdefault(gene_name, []).append(gene_id)
+
+    def gene_ids(self, symbol):
+        if symbol in self.matrices["gene_fpkm"].index:
+            return [symbol]
+        return self.symbol2genes.get(symbol, [])
+
+    def search_by_gene(self, symbol, measure="gene_fpkm"):
+        # Same shape as the R SearchByGene result: one value per sample,
+        # named after the matrix column.
+        matrix = self.matrices[measure]
+        for gene_id in self.gene_ids(symbol):
+            values = matrix.row_by_label(gene_id)
+            if values is not None:
+                return RVector(values, matrix.columns)
+
+        return RVector([], [])
+
+    def search_by_genes(self, symbols, measure="gene_fpkm"):
+        # Gene x sample table (see gene_matrix), one row slice per symbol
+        matrix = self.matrices[measure]
+
+        def values_of(symbol):
+            for gene_id in self.gene_ids(symbol):
+                values = matrix.row_by_label(gene_id)
+                if values is not None: return values
+            return None
+
+        return gene_matrix(symbols, matrix.columns, values_of)
+
+
+_stores = FileBackedCache()
+
+
+def get_store(directory):
+    # Returns None when the bioproject has not been exported yet
+    manifest = os.path.join(directory, "manifest.json")
+    if not os.path.exists(manifest): return None
+
+    return _stores.get(directory, [manifest], lambda: ExpressionStore(directory))
@@ -0,0 +1,64 @@
+"""
+Faceted index over the configurations of data/configurations.tsv.
+
+For each bioproject, every clause (key=="value") is mapped to a bitset
+(a Python int) of the configurations containing it. A filter made of
+several clauses is the AND of their bitsets, and the number of matching
+configurations having any other clause is the popcount of its bitset
+ANDed with the filter. The configurations are read with the selector,
+imported when an index is built, so that the module (and the views
+importing it) load where utils/selector.py is missing.
+"""
+from stress_mice.datacache import FileBackedCache
+
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+
+class FacetIndex(object):
+
+    def __init__(self, conditions):
+        # conditions: one list of clauses per configuration
+        self.size = len(conditions)
+        self.all = (1 << self.size) - 1
+
+        members = {}
+        for i, condition in enumerate(conditions):
+            for clause in condition:
+                members.setdefault(clause, []).append(i)
+
+        self.bits = {}
+        for clause, configurations in members.items():
+            bitmap = bytearray((self.size + 7) // 8)
+            for i in configurations:
+                bitmap[i >> 3] |= 1 << (i & 7)
+            self.bits[clause] = int.from_bytes(bytes(bitmap), "little")
+
+    def select(self, clauses):
+        mask = self.all
+        for clause in clauses:
+            mask &= self.bits.get(clause, 0)
+        return mask
+
+    def counts(self, mask, exclude=()):
+        # Number of selected configurations having each clause
+        exclude = set(exclude)
+        counts = {}
+        for clause, bits in self.bits.items():
+            if clause in exclude: continue
+            n = popcount(bits & mask)
+            if n: counts[clause] = n
+        return counts
+
+
+_indexes = FileBackedCache()
+
+
+def get_index(path, bioproject):
+    def build():
+        from stress_mice.utils import selector
+        conditions = selector.select(path, None, bioproject, only_leaves=False, output_other_clauses_only=True)
+        return FacetIndex(conditions)
+
+    return _indexes.get((path, bioproject), [path], build)
@@ -0,0 +1,46 @@
+"""
+Parallel evaluation of a query over several bioprojects.
+
+run() calls a function once per bioproject on the threads of a shared
+pool and returns the results in the order of the bioprojects, so a query
+over every study takes about as long as its slowest bioproject rather
+than the sum of all of them. The threads mostly wait: R calls run in the
+R worker processes (stress_mice/rpool.py), which serve different
+bioprojects in parallel, and the expression matrices and DEG tables are
+memory-mapped or cached. The exception raised for a bioproject is
+returned in place of its result, so one broken dataset does not fail the
+whole query. The tasks record their timings for the request running the
+query (see metrics.bind).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from stress_mice import metrics
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            threads = getattr(settings, "FANOUT_THREADS", None) or getattr(settings, "R_WORKERS", 4)
+            _executor = ThreadPoolExecutor(max_workers=threads)
+        return _executor
+
+
+def run(function, bioprojects, *args):
+    # [(bioproject, result, exception)] with exactly one of result and exception set
+    function = metrics.bind(function)
+    futures = [(bioproject, get_executor().submit(function, bioproject, *args)) for bioproject in bioprojects]
+
+    results = []
+    for bioproject, future in futures:
+        try:
+            results.append((bioproject, future.result(), None))
+        except Exception as e:
+            results.append((bioproject, None, e))
+    return results
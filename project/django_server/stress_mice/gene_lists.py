@@ -0,0 +1,60 @@
+"""
+Gene lists sent to the batch endpoints (search_by_gene_list/, search_degs_by_gene_list/).
+
+A list comes either in the request data, as "genes": a list of symbols or
+a single string, or as a text file uploaded in a multipart form (one
+symbol per line, or separated by commas, semicolons, tabs or spaces, as
+copied from the supplementary table of a paper). Quotes are stripped and
+the symbols are deduplicated in their order of first appearance.
+"""
+import json
+import re
+
+from django.conf import settings
+
+SEPARATORS = re.compile(r"[\s,;]+")
+
+
+class GeneListError(ValueError):
+    pass
+
+
+def parse(value):
+    if isinstance(value, str):
+        value = SEPARATORS.split(value)
+    elif not isinstance(value, list):
+        raise GeneListError("The gene list must be a list of symbols or a string")
+
+    symbols = []
+    seen = set()
+    for symbol in value:
+        symbol = str(symbol).strip().strip("'\"")
+        if not symbol or symbol in seen: continue
+        seen.add(symbol)
+        symbols.append(symbol)
+
+    if not symbols:
+        raise GeneListError("The gene list is empty")
+
+    limit = getattr(settings, "GENE_LIST_MAX", None)
+    if limit is not None and len(symbols) > limit:
+        raise GeneListError("The gene list holds {} symbols, more than the limit of {}".format(len(symbols), limit))
+
+    return symbols
+
+
+def from_request(request):
+    # (request data, symbols); the data of a multipart form are its other fields
+    if request.FILES:
+        upload = request.FILES.get("file") or next(iter(request.FILES.values()))
+        text = b"".join(upload.chunks()).decode("utf-8", "replace")
+        return request.POST.dict(), parse(text)
+
+    if request.method in ("GET", "HEAD"):
+        data = request.GET.dict()
+    else:
+        data = json.loads(request.body.decode('utf-8'))
+
+    if "genes" not in data:
+        raise GeneListError("No gene list: send \"genes\" or upload a file")
+    return data, parse(data["genes"])
@@ -0,0 +1,209 @@
+"""
+Asynchronous jobs for the slow endpoints.
+
+submit() records a Job row and runs the compute function of its kind
+(e.g. views.compute_gene_plotter) on a thread of a local pool, so the
+request returns at once with the job id; the R work itself happens in
+the R worker processes (stress_mice/rpool.py), the thread only waits for
+it. A job with the same kind and parameters as one still queued or
+running is not submitted again: that job is returned instead. Jobs left
+queued or running by a server process which no longer exists are marked
+as failed when the pool starts, and again whenever such a job would be
+returned by submit() or polled through get_job(), since another process
+sharing the database may die after this one started.
+
+Finished jobs are deleted with their results JOB_RETENTION_SECONDS after
+they end, by a sweep run on submission at most once per CLEANUP_INTERVAL
+seconds; polling a deleted job answers 404, like an unknown id.
+
+The compute function is called with the request data and a progress
+callback, which it calls with the fraction of the work done after each
+of its steps; the fraction is saved on the Job row for the pollers.
+"""
+import hashlib
+import importlib
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from stress_mice import metrics
+from stress_mice.models import Job
+
+# Kind -> function(request data, progress) computing the response
+KINDS = {
+    "gene_plotter": "stress_mice.views.compute_gene_plotter",
+    "search_by_condition": "stress_mice.views.compute_search_by_condition",
+    "see_gene_isoforms": "stress_mice.views.compute_see_gene_isoforms",
+}
+
+OWNER = socket.gethostname() + ":" + str(os.getpid())
+
+# Seconds between two sweeps of the expired jobs
+CLEANUP_INTERVAL = 600
+
+_executor = None
+_executor_lock = threading.Lock()
+_submit_lock = threading.Lock()
+_last_cleanup = None
+
+
+def job_key(kind, params):
+    return hashlib.sha1((kind + "\t" + json.dumps(params, sort_keys=True)).encode("utf-8")).hexdigest()
+
+
+def is_alive(owner):
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname(): return True
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_orphan(job):
+    # Queued or running in a server process which no longer exists
+    if job.status not in (Job.QUEUED, Job.RUNNING): return False
+    return job.owner != OWNER and not is_alive(job.owner)
+
+
+def mark_failed(job_ids):
+    Job.objects.filter(id__in=job_ids, status__in=[Job.QUEUED, Job.RUNNING]).update(
+        status=Job.FAILED, error="Interrupted by a server restart", finished_at=timezone.now())
+
+
+def fail_orphans():
+    # Jobs whose server process died before finishing them
+    orphans = [job.id for job in Job.objects.filter(status__in=[Job.QUEUED, Job.RUNNING]) if is_orphan(job)]
+    if orphans:
+        mark_failed(orphans)
+    return len(orphans)
+
+
+def delete_expired():
+    # Finished jobs older than JOB_RETENTION_SECONDS, with their results
+    retention = getattr(settings, "JOB_RETENTION_SECONDS", None)
+    if retention is None: return 0
+    limit = timezone.now() - timedelta(seconds=retention)
+    deleted, _ = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=limit).delete()
+    return deleted
+
+
+def cleanup():
+    # delete_expired(), at most once per CLEANUP_INTERVAL
+    global _last_cleanup
+    with _executor_lock:
+        now = time.time()
+        if _last_cleanup is not None and now - _last_cleanup < CLEANUP_INTERVAL: return
+        _last_cleanup = now
+    delete_expired()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            fail_orphans()
+            threads = getattr(settings, "JOB_THREADS", None) or getattr(settings, "R_WORKERS", 4)
+            _executor = ThreadPoolExecutor(max_workers=threads)
+        return _executor
+
+
+def get_function(kind):
+    module_name, function_name = KINDS[kind].rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run(job_id):
+    close_old_connections()
+    try:
+        job = Job.objects.get(id=job_id)
+        Job.objects.filter(id=job_id).update(status=Job.RUNNING, started_at=timezone.now())
+
+        def progress(fraction):
+            Job.objects.filter(id=job_id, status=Job.RUNNING).update(progress=min(max(fraction, 0), 1))
+
+        # Timed under its own endpoint, see metrics.py
+        timer = metrics.TaskTimer("job_" + job.kind)
+        try:
+            result = metrics.bind(get_function(job.kind), timer)(json.loads(job.params), progress)
+        except Exception:
+            Job.objects.filter(id=job_id).update(status=Job.FAILED, error=traceback.format_exc(), finished_at=timezone.now())
+            return
+        finally:
+            timer.finish()
+
+        Job.objects.filter(id=job_id).update(status=Job.DONE, progress=1, result=json.dumps(result), finished_at=timezone.now())
+    finally:
+        close_old_connections()
+
+
+def submit(kind, params):
+    # Returns the job computing kind(params), creating it if needed
+    if kind not in KINDS:
+        raise ValueError("Unknown job kind: " + str(kind))
+
+    executor = get_executor()
+    cleanup()
+    key = job_key(kind, params)
+
+    with _submit_lock:
+        with transaction.atomic():
+            pending = Job.objects.filter(key=key, status__in=[Job.QUEUED, Job.RUNNING]).order_by("created_at")
+            orphans = [job.id for job in pending if is_orphan(job)]
+            if orphans:
+                mark_failed(orphans)
+            job = next((job for job in pending if job.id not in orphans), None)
+            if job is not None: return job
+
+            job = Job.objects.create(id=uuid.uuid4().hex, kind=kind, params=json.dumps(params), key=key, owner=OWNER)
+
+        executor.submit(run, job.id)
+
+    return job
+
+
+def get_job(job_id):
+    get_executor()
+    job = Job.objects.filter(id=job_id).first()
+    if job is not None and is_orphan(job):
+        mark_failed([job.id])
+        job.refresh_from_db()
+    return job
+
+
+def queue_position(job):
+    # Number of jobs of this process queued before this one
+    if job.status != Job.QUEUED: return 0
+    return Job.objects.filter(status=Job.QUEUED, owner=job.owner, created_at__lt=job.created_at).count()
+
+
+def describe(job):
+    description = {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+    if job.status == Job.QUEUED:
+        description["queue_position"] = queue_position(job)
+    if job.status == Job.FAILED:
+        description["error"] = job.error
+
+    return description
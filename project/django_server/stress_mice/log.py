@@ -0,0 +1,39 @@
+"""
+Rate limiting for the log records of stress_mice.
+
+RateLimitFilter lets at most `rate` records with the same logger, level
+and message template through every `per` seconds; the next record let
+through after a burst reports how many similar ones were dropped.
+"""
+import logging
+import threading
+import time
+
+
+class RateLimitFilter(logging.Filter):
+
+    def __init__(self, rate=10, per=60):
+        logging.Filter.__init__(self)
+        self.rate = rate
+        self.per = per
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.time()
+
+        with self.lock:
+            start, count, suppressed = self.windows.get(key, (now, 0, 0))
+            if now - start >= self.per:
+                start, count = now, 0
+
+            if count >= self.rate:
+                self.windows[key] = (start, count, suppressed + 1)
+                return False
+
+            self.windows[key] = (start, count + 1, 0)
+
+        if suppressed:
+            record.msg = str(record.msg) + " [" + str(suppressed) + " similar messages suppressed]"
+        return True
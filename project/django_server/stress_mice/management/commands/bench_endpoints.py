@@ -0,0 +1,82 @@
+import json
+import platform
+import subprocess
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from stress_mice import views
+from stress_mice.bench import endpoints, fixtures
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Measures the latency and memory allocations of every endpoint on a synthetic data tree (see stress_mice/bench/)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--generate", action="store_true", help="write the synthetic data tree first")
+        parser.add_argument("--bioprojects", type=int, default=3)
+        parser.add_argument("--genes", type=int, default=2000)
+        parser.add_argument("--samples", type=int, default=12)
+        parser.add_argument("--configurations", type=int, default=4, help="configurations per bioproject")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=20, help="timed requests per endpoint")
+        parser.add_argument("--cold", type=int, default=1, help="requests per endpoint before the timed ones")
+        parser.add_argument("--no-allocations", action="store_true", help="skip the tracemalloc pass")
+        parser.add_argument("--only", nargs="*", help="endpoints to measure (default: all of them)")
+        parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+        parser.add_argument("--compare", help="JSON report of a previous run to compare the p50 latencies with")
+
+    def handle(self, *args, **options):
+        data_dir = views.BASE_DATA_DIR
+
+        if options["generate"]:
+            try:
+                fixtures.generate(data_dir, options["bioprojects"], options["genes"], options["samples"], options["configurations"], options["seed"])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        manifest = fixtures.load_manifest(data_dir)
+        if manifest is None:
+            raise CommandError("No benchmark fixture in {}: run with --generate (and DJANGO_SETTINGS_MODULE=stress_mice.bench.settings)".format(data_dir))
+
+        # The jobs endpoints need their table
+        call_command("migrate", "stress_mice", verbosity=0, interactive=False)
+
+        results = endpoints.measure(Client(), endpoints.cases(manifest), options["repeat"], options["cold"],
+                                    not options["no_allocations"], options["only"])
+
+        report = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "r_backend": getattr(settings, "R_BACKEND", None),
+            "r_workers": getattr(settings, "R_WORKERS", None),
+            "fixture": manifest,
+            "repeat": options["repeat"],
+            "endpoints": results,
+        }
+
+        output = json.dumps(report, indent=1, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as writer:
+                writer.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        for name, entry in sorted(results.items()):
+            if "error" in entry:
+                self.stderr.write("{}: {}".format(name, entry["error"]))
+
+        if options["compare"]:
+            with open(options["compare"]) as reader:
+                previous = json.load(reader)
+            for line in endpoints.compare(previous["endpoints"], results):
+                self.stderr.write(line)
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from stress_mice import views
+
+
+class Command(BaseCommand):
+    help = "Exports the expression matrices of each bioproject's Ballgown object into memory-mappable files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("bioprojects", nargs="*", help="Bioprojects to export (default: all of them)")
+
+    def handle(self, *args, **options):
+        bioprojects = options["bioprojects"] or sorted(views.load_dataset_info().keys())
+
+        pool = views.get_r_pool()
+        for bioproject in bioprojects:
+            start = time.time()
+            path = views.BASE_DATA_DIR + bioproject + "/bg.RData"
+            directory = views.BASE_DATA_DIR + bioproject + "/expression/"
+            manifest = pool.run(bioproject, path, "stress_mice.expression_store.export_from_ballgown", directory)
+
+            shapes = ", ".join("{} {}x{}".format(name, shape["rows"], shape["columns"]) for name, shape in sorted(manifest["matrices"].items()))
+            self.stdout.write("{}: {} ({:.1f}s)".format(bioproject, shapes, time.time() - start))
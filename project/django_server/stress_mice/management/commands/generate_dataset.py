@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from stress_mice import views
+from stress_mice.bench import fixtures
+
+
+class Command(BaseCommand):
+    help = "Writes a synthetic data/ tree of a chosen size (see stress_mice/bench/fixtures.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", default=views.BASE_DATA_DIR, help="where to write the tree (default: the data directory of the settings)")
+        parser.add_argument("--bioprojects", type=int, default=3)
+        parser.add_argument("--genes", type=int, default=2000)
+        parser.add_argument("--samples", type=int, default=12, help="samples per bioproject")
+        parser.add_argument("--configurations", type=int, default=4, help="configurations per bioproject")
+        parser.add_argument("--scale", type=float, default=1, help="multiplies every size above")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        sizes = [max(1, int(round(options[axis] * options["scale"]))) for axis in ["bioprojects", "genes", "samples", "configurations"]]
+
+        try:
+            manifest = fixtures.generate(options["directory"], *sizes, seed=options["seed"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write("{}: {} bioprojects, {} genes, {} samples, {} configurations ({:.1f} MB)".format(
+            options["directory"], manifest["bioprojects"], manifest["genes"], manifest["samples"], manifest["configurations"],
+            fixtures.tree_size(options["directory"]) / 1e6))
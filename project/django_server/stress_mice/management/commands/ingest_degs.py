@@ -0,0 +1,25 @@
+import glob
+import time
+
+from django.core.management.base import BaseCommand
+
+from stress_mice import deg_store
+from stress_mice import views
+
+
+class Command(BaseCommand):
+    help = "Converts data/degs/<bioproject>/sorted.DEG.csv files into their binary columnar form"
+
+    def add_arguments(self, parser):
+        parser.add_argument("bioprojects", nargs="*", help="Bioprojects to convert (default: all of them)")
+
+    def handle(self, *args, **options):
+        if options["bioprojects"]:
+            paths = [views.BASE_DATA_DIR + "degs/" + x + "/sorted.DEG.csv" for x in options["bioprojects"]]
+        else:
+            paths = sorted(glob.glob(views.BASE_DATA_DIR + "degs/*/sorted.DEG.csv"))
+
+        for path in paths:
+            start = time.time()
+            table = deg_store.load_table(path)
+            self.stdout.write("{}: {} genes ({:.2f}s)".format(path, len(table), time.time() - start))
@@ -0,0 +1,69 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from stress_mice import views
+from stress_mice.bench import endpoints, fixtures, loadtest
+
+FRONTEND_CONFIG = os.path.join(os.path.dirname(settings.BASE_DIR), "material", "config.json")
+
+
+class Command(BaseCommand):
+    help = "Sends the requests of the frontend concurrently and reports the throughput and latency percentiles of every endpoint (see stress_mice/bench/loadtest.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="base URL of a running server (default: in process, through Django's test client)")
+        parser.add_argument("--api-prefix", default=endpoints.API, help="path the API is mounted on at --url")
+        parser.add_argument("--config", default=FRONTEND_CONFIG, help="frontend configuration the request templates come from")
+        parser.add_argument("--access-log", help="replay the requests of this access log instead")
+        parser.add_argument("--bioprojects", nargs="*", help="bioprojects to query (default: those of the benchmark fixture)")
+        parser.add_argument("--concurrency", type=int, default=8, help="virtual users")
+        parser.add_argument("--duration", type=float, default=30, help="seconds to run for (0: until --requests are sent)")
+        parser.add_argument("--requests", type=int, help="stop after this many requests")
+        parser.add_argument("--think", type=float, default=0.5, help="mean think time between two requests of a user, in seconds")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if not options["duration"] and options["requests"] is None:
+            raise CommandError("Give a --duration or a number of --requests")
+
+        manifest = fixtures.load_manifest(views.BASE_DATA_DIR)
+        if options["bioprojects"]:
+            # Querying a remote server: the other names come from a fixture only if there is one
+            manifest = dict(manifest or {"gene": "Gsyn00001", "transcript": "Gsyn00001.t1", "region": fixtures.COVARIATES[0][1][0]},
+                            bioproject_ids=options["bioprojects"])
+        elif manifest is None:
+            raise CommandError("No benchmark fixture in {}: generate one with bench_endpoints --generate or give --bioprojects".format(views.BASE_DATA_DIR))
+
+        if options["access_log"]:
+            templates = loadtest.from_access_log(options["access_log"], manifest)
+        else:
+            templates = loadtest.from_config(options["config"], manifest)
+        if not templates:
+            raise CommandError("No request to send")
+
+        if options["url"]:
+            send = loadtest.HttpSender(options["url"])
+        else:
+            call_command("migrate", "stress_mice", verbosity=0, interactive=False)
+            send = loadtest.ClientSender()
+
+        report = loadtest.run(templates, send, manifest, options["concurrency"], options["duration"], options["requests"],
+                              options["think"], bool(options["access_log"]), options["api_prefix"], options["seed"])
+        report.update({
+            "url": options["url"],
+            "r_backend": getattr(settings, "R_BACKEND", None),
+            "r_workers": getattr(settings, "R_WORKERS", None),
+            "source": options["access_log"] or options["config"],
+        })
+
+        if options["output"]:
+            with open(options["output"], "w") as writer:
+                writer.write(json.dumps(report, indent=1, sort_keys=True) + "\n")
+
+        for line in loadtest.format_report(report):
+            self.stdout.write(line)
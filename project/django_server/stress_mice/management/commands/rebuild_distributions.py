@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from stress_mice import views
+from stress_mice.utils import distribution
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the consensus distribution.txt (and its index) of every diff/<key>=<value> directory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-fold-change", type=float, default=0, help="minimum absolute fold change")
+        parser.add_argument("--max-pvalue", type=float, default=None)
+        parser.add_argument("--max-qvalue", type=float, default=None)
+        parser.add_argument("--processes", type=int, default=None, help="size of the process pool (default: number of cores)")
+
+    def handle(self, *args, **options):
+        outputs = distribution.rebuild_all(
+            views.BASE_DATA_DIR + "diff/",
+            min_fold_change=options["min_fold_change"],
+            max_pvalue=options["max_pvalue"],
+            max_qvalue=options["max_qvalue"],
+            processes=options["processes"])
+
+        for output in outputs:
+            self.stdout.write(output)
@@ -0,0 +1,37 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from stress_mice.bench import scaling
+
+
+class Command(BaseCommand):
+    help = "Measures how the latency and allocations of every endpoint grow with the bioprojects, genes, samples and configurations (see stress_mice/bench/scaling.py)"
+
+    def add_arguments(self, parser):
+        for axis in scaling.AXES:
+            parser.add_argument("--" + axis, type=int, default=scaling.BASE[axis], help="base number of " + axis)
+        parser.add_argument("--factors", type=float, nargs="+", default=[1, 2, 5, 10], help="multipliers of each axis")
+        parser.add_argument("--axes", nargs="+", choices=scaling.AXES, default=scaling.AXES)
+        parser.add_argument("--repeat", type=int, default=5, help="timed requests per endpoint and scale point")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--only", nargs="*", help="endpoints to measure (default: all of them)")
+        parser.add_argument("--work-dir", help="where to generate the scale points (default: a temporary directory)")
+        parser.add_argument("--keep", action="store_true", help="keep the generated trees")
+        parser.add_argument("--sort-by", default="p50_ms", choices=scaling.KEYS, help="growth the endpoints are ordered by")
+        parser.add_argument("--output", help="write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        work_dir = options["work_dir"] or tempfile.mkdtemp(prefix="stress_mice_scaling_")
+        base = {axis: options[axis] for axis in scaling.AXES}
+
+        report = scaling.run(work_dir, base, options["factors"], options["axes"], options["repeat"], options["seed"],
+                             options["only"], options["keep"], self.stderr.write)
+
+        if options["output"]:
+            with open(options["output"], "w") as writer:
+                writer.write(json.dumps(report, indent=1, sort_keys=True) + "\n")
+
+        for line in scaling.format_report(report, options["sort_by"]):
+            self.stdout.write(line)
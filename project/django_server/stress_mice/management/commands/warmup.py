@@ -0,0 +1,40 @@
+"""
+Dry run of the warm-up, for its timings and memory.
+
+The command loads the bioprojects in its own process and R workers,
+which exit with it: it does not warm up a running server. To preload a
+server, start it with STRESS_MICE_WARMUP=1 (WARMUP_ON_STARTUP) and wait
+for its ready/ endpoint to answer 200.
+"""
+from django.core.management.base import BaseCommand
+
+from stress_mice import warmup
+
+
+class Command(BaseCommand):
+    help = "Loads bioprojects and builds their derived indexes in this process, reporting load time and memory (does not warm up a running server)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("bioprojects", nargs="*", help="Bioprojects to preload (default: WARMUP_BIOPROJECTS or all of them)")
+        parser.add_argument("--parallel", type=int, default=None, help="Number of bioprojects loaded at the same time (default: R_WORKERS)")
+
+    def handle(self, *args, **options):
+        shared, report = warmup.warm_up(options["bioprojects"] or None, options["parallel"])
+
+        for name, seconds in sorted(shared.items()):
+            self.stdout.write("{:<20} {:>8.2f}s".format(name, seconds))
+
+        for entry in report:
+            size = entry.get("size")
+            line = "{:<20} {:>8.2f}s {:>12} {}".format(
+                entry["bioproject"],
+                entry["seconds"],
+                "{:.1f} MB".format(size / 1024.0 / 1024.0) if size is not None else "-",
+                " ".join("{}={:.2f}s".format(k, v) for k, v in sorted(entry["steps"].items())))
+            self.stdout.write(line)
+            if "error" in entry:
+                self.stderr.write(entry["error"])
+
+        state = warmup.get_state()
+        if state["error"]:
+            self.stderr.write(state["error"])
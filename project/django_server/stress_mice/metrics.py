@@ -0,0 +1,245 @@
+"""
+In-process request metrics, rendered in the Prometheus text format by the metrics/ endpoint.
+
+MetricsMiddleware times every request and counts the requests in flight
+per endpoint (the name of the view). While a request is served, the time
+it spends in each phase (waiting for its R worker, loading the dataset,
+running R, converting the result, serializing the JSON) is added up with
+add_phase() and recorded when it finishes; the R workers send their own
+timings along with each reply (see rpool.py).
+
+Phases are attributed through a per-thread timer. Work a request hands
+to a thread pool (the per-bioproject queries of fanout.py) is wrapped
+with bind(), so its phases count for that request; since those tasks
+run in parallel, the phases of a request may then add up to more than
+its latency. A job is timed on its own, under the endpoint
+"job_<kind>", as it usually ends after the request that submitted it.
+Other work done outside of a request (warm-up) is recorded under the
+endpoint "background". Metrics are kept per process.
+"""
+import functools
+import threading
+import time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+METRICS = {
+    "stress_mice_request_seconds": ("histogram", "Latency of the requests, by endpoint."),
+    "stress_mice_phase_seconds": ("histogram", "Time spent by the requests in each phase, by endpoint."),
+    "stress_mice_requests_total": ("counter", "Requests served, by endpoint and status code."),
+    "stress_mice_requests_in_flight": ("gauge", "Requests being served, by endpoint."),
+    "stress_mice_dataset_cache_total": ("counter", "Lookups of Ballgown objects in the R workers, by result."),
+}
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+_local = threading.local()
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, labels, value):
+    key = (name, _labels_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+def increment(name, labels, value=1):
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def add_gauge(name, labels, value):
+    key = (name, _labels_key(labels))
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + value
+
+
+class RequestTimer(object):
+
+    def __init__(self):
+        self.start = time.time()
+        self.endpoint = None
+        self.phases = {}
+        # Pool threads may add phases concurrently (see bind())
+        self._lock = threading.Lock()
+
+    def add_phase(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def observe_phases(self, endpoint):
+        with self._lock:
+            phases = list(self.phases.items())
+        for phase, seconds in phases:
+            observe("stress_mice_phase_seconds", {"endpoint": endpoint, "phase": phase}, seconds)
+
+    def set_endpoint(self, endpoint):
+        if self.endpoint is None:
+            add_gauge("stress_mice_requests_in_flight", {"endpoint": endpoint}, 1)
+        self.endpoint = endpoint
+
+    def finish(self, status):
+        endpoint = self.endpoint or "unmatched"
+        if self.endpoint is not None:
+            add_gauge("stress_mice_requests_in_flight", {"endpoint": endpoint}, -1)
+
+        observe("stress_mice_request_seconds", {"endpoint": endpoint}, time.time() - self.start)
+        increment("stress_mice_requests_total", {"endpoint": endpoint, "status": str(status)})
+        self.observe_phases(endpoint)
+
+        if getattr(_local, "timer", None) is self:
+            _local.timer = None
+
+    def wrap(self, content, status):
+        # Streamed responses finish when their last chunk has been sent
+        _local.timer = self
+        try:
+            for chunk in content:
+                yield chunk
+                _local.timer = self
+        finally:
+            self.finish(status)
+
+
+class TaskTimer(RequestTimer):
+    """Phases of a task run outside of any request (e.g. a job), recorded under its own endpoint."""
+
+    def __init__(self, endpoint):
+        super().__init__()
+        self.endpoint = endpoint
+
+    def finish(self):
+        self.observe_phases(self.endpoint)
+
+
+def bind(function, timer=None):
+    # `function`, recording its phases in `timer` (default: the timer of
+    # the calling thread) whichever thread it runs on
+    timer = timer or getattr(_local, "timer", None)
+    if timer is None: return function
+
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        previous = getattr(_local, "timer", None)
+        _local.timer = timer
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.timer = previous
+
+    return bound
+
+
+def add_phase(phase, seconds):
+    timer = getattr(_local, "timer", None)
+    if timer is None:
+        observe("stress_mice_phase_seconds", {"endpoint": "background", "phase": phase}, seconds)
+    else:
+        timer.add_phase(phase, seconds)
+
+
+def add_worker_timings(timings):
+    # Timings sent by an R worker along with its reply
+    for phase in ["dataset_load", "r_call", "conversion"]:
+        if phase in timings:
+            add_phase(phase, timings[phase])
+    if "cache_hit" in timings:
+        increment("stress_mice_dataset_cache_total", {"result": "hit" if timings["cache_hit"] else "miss"})
+
+
+class MetricsMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = RequestTimer()
+        _local.timer = timer
+
+        try:
+            response = self.get_response(request)
+        except Exception:
+            timer.finish(500)
+            raise
+
+        if response.streaming:
+            response.streaming_content = timer.wrap(response.streaming_content, response.status_code)
+        else:
+            timer.finish(response.status_code)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = getattr(_local, "timer", None)
+        if timer is not None:
+            timer.set_endpoint(view_func.__name__)
+
+
+def _format_labels(labels):
+    if not labels: return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(extra=()):
+    # `extra`: (name, kind, help, labels, value) samples computed by the caller
+    with _lock:
+        histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in _histograms.items()]
+        samples = list(_counters.items()) + list(_gauges.items())
+
+    lines = []
+    described = set()
+
+    def describe(name, kind, help):
+        if name in described: return
+        described.add(name)
+        lines.append("# HELP {} {}".format(name, help))
+        lines.append("# TYPE {} {}".format(name, kind))
+
+    for (name, labels), counts, total, count, buckets in sorted(histograms):
+        describe(name, *METRICS[name])
+        cumulative = 0
+        for bound, n in zip(list(buckets) + ["+Inf"], counts):
+            cumulative += n
+            lines.append(name + "_bucket" + _format_labels(labels + (("le", str(bound)),)) + " " + str(cumulative))
+        lines.append(name + "_sum" + _format_labels(labels) + " " + _format_value(total))
+        lines.append(name + "_count" + _format_labels(labels) + " " + str(count))
+
+    for (name, labels), value in sorted(samples):
+        describe(name, *METRICS[name])
+        lines.append(name + _format_labels(labels) + " " + _format_value(value))
+
+    for name, kind, help, labels, value in extra:
+        describe(name, kind, help)
+        lines.append(name + _format_labels(_labels_key(labels)) + " " + _format_value(value))
+
+    return "\n".join(lines) + "\n"
@@ -1,3 +1,37 @@
 from django.db import models
 
 # Create your models here.
+
+
+class Job(models.Model):
+    """An asynchronous computation submitted through jobs/submit/ (see stress_mice/jobs.py)."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    STATUSES = (
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    id = models.CharField(max_length=32, primary_key=True)
+    kind = models.CharField(max_length=64)
+    params = models.TextField()
+    # sha1 of kind and params, used to share identical in-flight jobs
+    key = models.CharField(max_length=40, db_index=True)
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED, db_index=True)
+    progress = models.FloatField(default=0)
+    result = models.TextField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    # host:pid of the server process running the job
+    owner = models.CharField(max_length=128, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.kind + " " + self.id + " (" + self.status + ")"
@@ -0,0 +1,88 @@
+"""
+Per-bioproject index of the phenodata (covariates) of its samples.
+
+For every column it keeps the distinct values, in order of first
+appearance, with the ids of the samples having each value, so the
+covariate lists, their values and the per-value counts are plain
+lookups. It is built from data/phenodata/<id>/phenodata.csv, or from
+the Ballgown object's phenodata when there is no such file.
+
+The covariate names and values are sent back to R in the condition
+strings of the queries, so they must be those of pData(bg): when the
+Ballgown object exists, the CSV is only used if its covariates are the
+ones R reports, and the R phenodata is used otherwise.
+"""
+import collections
+import csv
+import logging
+import os
+
+from stress_mice.datacache import FileBackedCache
+
+logger = logging.getLogger(__name__)
+
+
+class PhenodataIndex(object):
+
+    def __init__(self, colnames, rows, id_column=0):
+        self.id_column = colnames[id_column]
+        self.columns = [x for i, x in enumerate(colnames) if i != id_column]
+        self.samples = [row[id_column] for row in rows]
+
+        self.values = {}
+        for i, column in enumerate(colnames):
+            if i == id_column: continue
+
+            values = collections.OrderedDict()
+            for row in rows:
+                values.setdefault(row[i], []).append(row[id_column])
+            self.values[column] = values
+
+    def __contains__(self, column):
+        return column in self.values
+
+    def distinct(self, column):
+        return list(self.values[column].keys())
+
+    def counts(self, column):
+        return [(value, len(samples)) for value, samples in self.values[column].items()]
+
+    def samples_with(self, column, value):
+        return self.values[column].get(value, [])
+
+
+def from_csv(path):
+    # Quoted fields may contain commas
+    with open(path, "r", newline="") as reader:
+        records = csv.reader(reader)
+        header = [x.strip() for x in next(records, [])]
+        rows = [[x.strip() for x in row] for row in records if any(x.strip() for x in row)]
+
+    return PhenodataIndex(header, rows)
+
+
+def from_table(results):
+    # results: the getCovariates data.frame, as converted by the R worker
+    id_column = results.colnames.index("ids") if "ids" in results.colnames else 0
+    return PhenodataIndex(results.colnames, results.rows, id_column)
+
+
+_indexes = FileBackedCache()
+
+
+def get_index(bioproject, csv_path, bg_path, load_from_r):
+    def build():
+        if not os.path.exists(csv_path):
+            return from_table(load_from_r())
+
+        index = from_csv(csv_path)
+        if not os.path.exists(bg_path): return index
+
+        reference = from_table(load_from_r())
+        if index.columns != reference.columns:
+            logger.warning("The covariates of %s (%s) are not those of the Ballgown object (%s): using the latter",
+                           csv_path, ", ".join(index.columns), ", ".join(reference.columns))
+            return reference
+        return index
+
+    return _indexes.get(bioproject, [csv_path, bg_path], build)
@@ -0,0 +1,93 @@
+"""
+Content-addressed cache of the images rendered by gene_plotter.
+
+An image is stored as <sha1 of its parameters and dataset version><ext>
+in the temp images directory, so a repeated request is answered with a
+file lookup instead of an R render. Hits refresh the file's mtime, and
+once the directory grows beyond its size budget the files with the
+oldest mtime are deleted.
+"""
+import glob
+import hashlib
+import os
+import threading
+
+
+class PlotCache(object):
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def key(self, *parts):
+        return hashlib.sha1("\t".join(str(x) for x in parts).encode("utf-8")).hexdigest()
+
+    def lookup(self, key):
+        # Returns the file name of the cached image, if any
+        matches = glob.glob(os.path.join(self.directory, key + ".*"))
+        with self._lock:
+            if not matches:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        try:
+            os.utime(matches[0])
+        except OSError:
+            pass
+        return os.path.basename(matches[0])
+
+    def store(self, key, path):
+        # Moves a freshly rendered image into the cache
+        filename = key + os.path.splitext(path)[1]
+        os.replace(path, os.path.join(self.directory, filename))
+        self.evict()
+        return filename
+
+    def evict(self):
+        if self.max_bytes is None: return
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+
+        used = sum(x[1] for x in entries)
+        for mtime, size, path in sorted(entries):
+            if used <= self.max_bytes: break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            used -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self):
+        files = [x for x in os.scandir(self.directory) if x.is_file()]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "files": len(files),
+            "bytes": sum(x.stat().st_size for x in files),
+            "max_bytes": self.max_bytes,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(directory, max_bytes=None):
+    with _caches_lock:
+        if directory not in _caches:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            _caches[directory] = PlotCache(directory, max_bytes)
+        return _caches[directory]
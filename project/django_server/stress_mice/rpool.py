@@ -0,0 +1,323 @@
+"""
+Pool of out-of-process R workers.
+
+Every worker is a separate Python process with its own embedded R
+interpreter, its own copy of definitions.R and its own set of loaded
+Ballgown objects. Requests are routed to a worker by bioproject, so a
+dataset is always served by the same process while queries on different
+bioprojects run in parallel on different cores.
+
+R objects cannot cross process boundaries, so results are converted in
+the worker into the plain Python types defined below (RVector and
+RDataFrame) before being sent back. Python code that needs direct access
+to a Ballgown object (e.g. exporting it) is run inside the worker with
+RPool.run().
+"""
+import atexit
+import gc
+import importlib
+import multiprocessing
+import resource
+import threading
+import time
+import traceback
+import zlib
+
+from django.conf import settings
+
+from stress_mice import metrics
+from stress_mice.dataset_cache import DatasetCache
+
+
+class RWorkerError(Exception):
+    pass
+
+
+class RVector(list):
+    """An R vector or list converted to Python; `names` mirrors names(x)."""
+
+    def __init__(self, values=(), names=None):
+        list.__init__(self, values)
+        self.names = names
+
+
+class RDataFrame(object):
+    """
+    An R data.frame converted to Python, stored row by row.
+
+    It may hold only a window of the original data.frame: `rows` are then
+    rows offset..offset+len(rows) of a data.frame with `total` rows.
+    """
+
+    def __init__(self, colnames, rows, offset=0, total=None):
+        self.colnames = colnames
+        self.rows = rows
+        self.nrow = len(rows)
+        self.ncol = len(colnames)
+        self.offset = offset
+        self.total = total if total is not None else len(rows)
+
+
+def _scalar(value, rinterface):
+    # NA values are rpy2 singletons which the web process cannot unpickle
+    if value is rinterface.NA_Character:
+        return "N/A"
+    if value is rinterface.NA_Real or value is rinterface.NA_Integer or value is rinterface.NA_Logical:
+        return None
+    return value
+
+
+def _convert_column(column, rinterface):
+    # One rpy2 call per column; factor levels are decoded once per column
+    if hasattr(column, 'levels'):
+        levels = [str(x) for x in column.levels]
+        return ["N/A" if code is rinterface.NA_Integer else levels[code-1] for code in column]
+
+    return [_scalar(value, rinterface) for value in column]
+
+
+def _convert_data_frame(df, rinterface, offset=0, total=None):
+    columns = [_convert_column(column, rinterface) for column in df]
+    rows = [list(row) for row in zip(*columns)]
+
+    return RDataFrame([str(x) for x in df.colnames], rows, offset, total)
+
+
+def _convert(value, robjects, rinterface):
+    if value is rinterface.NULL:
+        return None
+
+    if isinstance(value, robjects.DataFrame):
+        return _convert_data_frame(value, rinterface)
+
+    if isinstance(value, robjects.FactorVector):
+        levels = value.levels
+        values = [str(levels[x-1]) for x in value]
+    elif isinstance(value, robjects.ListVector):
+        values = [_convert(x, robjects, rinterface) for x in value]
+    elif isinstance(value, robjects.Vector):
+        values = [_scalar(x, rinterface) for x in value]
+    else:
+        return value
+
+    names = value.names
+    if names is rinterface.NULL:
+        names = None
+    else:
+        names = [str(x) for x in names]
+
+    return RVector(values, names)
+
+
+def _worker_main(connection, definitions, budget, pinned):
+    # R is imported here, and only here, so that the web process never
+    # embeds an interpreter of its own.
+    import rpy2.rinterface as rinterface
+    import rpy2.robjects as robjects
+    import rpy2.robjects.packages as rpackages
+
+    base = rpackages.importr("base")
+    base.source(definitions)
+
+    window = robjects.r("function(df, first, last) df[seq_len(last - first + 1) + first - 1, , drop = FALSE]")
+
+    def to_window(result, offset, limit):
+        # Slices a data.frame in R, so that only the requested page is
+        # converted and sent back, with the size of the full result
+        if not isinstance(result, robjects.DataFrame):
+            return _convert(result, robjects, rinterface)
+
+        total = result.nrow
+        first = min(offset, total)
+        last = min(offset + limit, total)
+        return _convert_data_frame(window(result, first + 1, last), rinterface, first, total)
+
+    def load(path):
+        base.load(path)
+        bg = robjects.r("bg")
+        # The cache holds the only reference: without the global binding,
+        # an evicted dataset is freed by the next gc()
+        robjects.r("rm(bg, envir = globalenv())")
+        return bg
+
+    def release():
+        # Drop the Python proxies of the evicted objects, then free them in R
+        gc.collect()
+        robjects.r("gc()")
+
+    datasets = DatasetCache(
+        load,
+        size_of=lambda bg: int(robjects.r("function(x) as.numeric(object.size(x))")(bg)[0]),
+        budget=budget,
+        pinned=pinned,
+        release=release)
+    def get_ballgown_object(path, timings):
+        start = time.time()
+        misses = datasets.misses
+        bg = datasets.get(path)
+        timings["dataset_load"] = time.time() - start
+        timings["cache_hit"] = datasets.misses == misses
+        return bg
+
+    def timed(timings, phase, fx, *args):
+        start = time.time()
+        result = fx(*args)
+        timings[phase] = time.time() - start
+        return result
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+
+        command = message[0]
+        if command == "stop":
+            break
+
+        # Phase timings sent back with the reply (see metrics.py)
+        timings = {}
+        try:
+            if command == "call":
+                path, function, args = message[1:]
+                bg = get_ballgown_object(path, timings)
+                result = timed(timings, "r_call", robjects.r(function), *(list(args) + [bg]))
+                reply = ("ok", timed(timings, "conversion", _convert, result, robjects, rinterface))
+            elif command == "table":
+                path, function, args, offset, limit = message[1:]
+                bg = get_ballgown_object(path, timings)
+                result = timed(timings, "r_call", robjects.r(function), *(list(args) + [bg]))
+                reply = ("ok", timed(timings, "conversion", to_window, result, offset, limit))
+            elif command == "run":
+                path, function, args = message[1:]
+                module_name, function_name = function.rsplit(".", 1)
+                fx = getattr(importlib.import_module(module_name), function_name)
+                bg = get_ballgown_object(path, timings)
+                reply = ("ok", timed(timings, "r_call", fx, bg, *args))
+            elif command == "clear":
+                datasets.clear()
+                reply = ("ok", None)
+            elif command == "load":
+                path = message[1]
+                datasets.get(path)
+                entry = datasets.entries[path]
+                reply = ("ok", {
+                    "size": entry["size"],
+                    "load_seconds": entry["load_seconds"],
+                    "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                })
+            elif command == "stats":
+                reply = ("ok", datasets.stats())
+            else:
+                reply = ("error", "Unknown command '{}'".format(command))
+        except Exception:
+            reply = ("error", traceback.format_exc())
+
+        connection.send(reply + (timings,))
+
+
+class RWorker(object):
+
+    def __init__(self, index, context, definitions, budget=None, pinned=()):
+        self.index = index
+        self.context = context
+        self.definitions = definitions
+        self.budget = budget
+        self.pinned = list(pinned)
+        self.lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        self.connection, child = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(child, self.definitions, self.budget, self.pinned),
+            name="r-worker-{}".format(self.index))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    def request(self, message):
+        wait_start = time.time()
+        with self.lock:
+            metrics.add_phase("lock_wait", time.time() - wait_start)
+            try:
+                self.connection.send(message)
+                status, payload, timings = self.connection.recv()
+            except (EOFError, OSError):
+                # The R process died (e.g. a crash inside a package): replace
+                # it so that the next request for these bioprojects works.
+                self.connection.close()
+                self.start()
+                raise RWorkerError("R worker {} died and has been restarted".format(self.index))
+
+        metrics.add_worker_timings(timings)
+        if status == "error":
+            raise RWorkerError(payload)
+
+        return payload
+
+    def stop(self):
+        with self.lock:
+            try:
+                self.connection.send(("stop",))
+            except (EOFError, OSError):
+                pass
+        self.process.join(5)
+
+
+class RPool(object):
+
+    def __init__(self, size, definitions, budget=None, pinned=()):
+        # R must be started in a fresh interpreter, never forked from a
+        # process which may already hold threads or an R instance.
+        # `budget` is the memory budget of each worker's dataset cache.
+        context = multiprocessing.get_context("spawn")
+        self.workers = [RWorker(i, context, definitions, budget, pinned) for i in range(max(1, size))]
+
+    def worker_for(self, bioproject):
+        return self.workers[zlib.crc32(bioproject.encode("utf-8")) % len(self.workers)]
+
+    def call(self, bioproject, path, function, *args):
+        return self.worker_for(bioproject).request(("call", path, function, args))
+
+    def table(self, bioproject, path, offset, limit, function, *args):
+        # Like call(), but a data.frame result only carries rows
+        # offset..offset+limit (see RDataFrame)
+        return self.worker_for(bioproject).request(("table", path, function, args, offset, limit))
+
+    def run(self, bioproject, path, function, *args):
+        # `function` is the dotted name of a Python function, called in the
+        # worker as function(bg, *args); its result must be picklable.
+        return self.worker_for(bioproject).request(("run", path, function, args))
+
+    def clear(self):
+        for worker in self.workers:
+            worker.request(("clear",))
+
+    def preload(self, bioproject, path):
+        return self.worker_for(bioproject).request(("load", path))
+
+    def stats(self):
+        return [dict(worker.request(("stats",)), worker=worker.index) for worker in self.workers]
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(definitions, pinned=()):
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RPool(getattr(settings, "R_WORKERS", 4), definitions,
+                              getattr(settings, "R_WORKER_DATASET_BYTES", None), pinned)
+                atexit.register(_pool.stop)
+
+    return _pool
@@ -0,0 +1,124 @@
+"""
+Streaming writer for the paginated-table responses.
+
+table_response() serializes the {"structure", "total", "hits"} envelope
+one row at a time, so a request holds at most a small buffer of JSON
+instead of the whole document. The first GZIP_THRESHOLD bytes are
+buffered before the response is built: a table smaller than that is sent
+as a plain HttpResponse with its Content-Length, a larger one as a
+StreamingHttpResponse, compressed on the fly when the client accepts
+gzip.
+
+An exception raised while that first part is built (invalid query,
+missing dataset, first rows) propagates to the view as usual, so its
+decorators can still answer with an error status. Once a streamed
+response has started, its status can no longer change: an exception
+raised by a later row is logged and ends the document early, as
+{..., "hits": [<rows sent so far>], "error": <message>}, which clients
+must check for.
+"""
+import json
+import logging
+import re
+import time
+import zlib
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+from stress_mice import metrics
+
+BUFFER_SIZE = 64 * 1024
+
+ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+
+logger = logging.getLogger(__name__)
+
+
+def table_chunks(header, total, rows, buffer_size=BUFFER_SIZE):
+    # The JSON document of the table, in chunks of about buffer_size bytes
+    buffer = [b'{"structure": {"field_list": ', json.dumps(header).encode("utf-8"), b'}, "total": ', json.dumps(total).encode("utf-8"), b', "hits": [']
+    size = sum(len(x) for x in buffer)
+
+    # Rows are usually built lazily: the time spent getting the next row
+    # is conversion, the time spent in json.dumps serialization
+    conversion = 0.0
+    serialization = 0.0
+    rows = iter(rows)
+    separator = b""
+    try:
+        while True:
+            start = time.time()
+            try:
+                row = next(rows)
+            except StopIteration:
+                break
+            converted = time.time()
+            chunk = separator + json.dumps(row).encode("utf-8")
+            conversion += converted - start
+            serialization += time.time() - converted
+
+            separator = b", "
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                yield b"".join(buffer)
+                buffer = []
+                size = 0
+    finally:
+        metrics.add_phase("conversion", conversion)
+        metrics.add_phase("serialization", serialization)
+
+    buffer.append(b"]}")
+    yield b"".join(buffer)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data: yield data
+    yield compressor.flush()
+
+
+def table_response(request, header, total, rows, status=200):
+    threshold = getattr(settings, "GZIP_THRESHOLD", BUFFER_SIZE)
+    chunks = table_chunks(header, total, rows)
+
+    # Read ahead until the table is known to be small or large
+    head = []
+    size = 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size >= threshold: break
+    else:
+        response = HttpResponse(b"".join(head), status=status)
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+    def body():
+        for chunk in head:
+            yield chunk
+        try:
+            for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            # Every chunk ends with a whole row: close the list and flag the error
+            logger.exception("Table response interrupted after its first %d bytes", size)
+            yield b'], "error": ' + json.dumps(str(e) or type(e).__name__).encode("utf-8") + b'}'
+
+    if ACCEPTS_GZIP.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+        response = StreamingHttpResponse(gzip_chunks(body()), status=status)
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = StreamingHttpResponse(body(), status=status)
+
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def dict_response(request, table, status=200):
+    # Same, for a table already built as a dict (e.g. by a compute_* function)
+    return table_response(request, table["structure"]["field_list"], table["total"], table["hits"], status)
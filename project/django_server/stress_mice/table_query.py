@@ -0,0 +1,200 @@
+"""
+Server-side filters and sorting of the table endpoints.
+
+Every table header advertises a filter per column; a request may carry
+
+    "filters": [{"key": <column>, "value": <text>},
+                {"key": <column>, "min": <number>, "max": <number>}, ...]
+    "sort": <column>, "order": "asc" or "desc"
+
+("filters" may also be sent as a JSON string, e.g. in a query string).
+A "value" keeps the rows whose cell contains it, ignoring case; "min" and
+"max" keep the rows whose cell is a number within the bounds (included,
+either may be left out). Filters are combined with AND. Sorting compares
+numbers as numbers and anything else as text, and puts missing values
+(None, NaN, "N/A", "NA", "") last in both directions.
+
+Table holds a table by column and answers a query with the row numbers
+that match it, in the requested order. The sort order of a column is
+computed once, on first use, as the rank of every row: sorting a
+selection is then a sort of integers, whatever the values are. Tables
+kept in memory (e.g. the DEG tables of deg_store.py) thus sort without
+reparsing or comparing the values again.
+"""
+import json
+import threading
+from array import array
+
+MISSING = ("", "N/A", "NA")
+
+
+class TableQueryError(ValueError):
+    pass
+
+
+def is_missing(value):
+    if value is None: return True
+    if isinstance(value, float): return value != value
+    return isinstance(value, str) and value.strip() in MISSING
+
+
+def to_number(value):
+    # float of a number or of a numeric string, None otherwise
+    if isinstance(value, bool) or is_missing(value): return None
+    if isinstance(value, (int, float)): return float(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number == number else None
+
+
+def sort_key(value):
+    number = to_number(value)
+    if number is not None: return (0, number, "")
+    return (1, 0, str(value).lower())
+
+
+class Filter(object):
+
+    def __init__(self, key, value=None, min=None, max=None):
+        self.key = key
+        self.value = None if value is None else str(value).lower()
+        self.min = min
+        self.max = max
+
+    def matches(self, cell):
+        if self.value is not None:
+            if is_missing(cell) or self.value not in str(cell).lower(): return False
+        if self.min is not None or self.max is not None:
+            number = to_number(cell)
+            if number is None: return False
+            if self.min is not None and number < self.min: return False
+            if self.max is not None and number > self.max: return False
+        return True
+
+    def key_tuple(self):
+        return (self.key, self.value, self.min, self.max)
+
+
+class Query(object):
+
+    def __init__(self, filters=(), sort=None, descending=False):
+        self.filters = list(filters)
+        self.sort = sort
+        self.descending = descending
+
+    def __bool__(self):
+        return bool(self.filters) or self.sort is not None
+
+    def columns(self):
+        names = [f.key for f in self.filters]
+        if self.sort is not None: names.append(self.sort)
+        return names
+
+    def key(self):
+        # Hashable description, for the caches of query results
+        return (tuple(f.key_tuple() for f in self.filters), self.sort, self.descending)
+
+
+def _bound(entry, name):
+    if entry.get(name) in (None, ""): return None
+    number = to_number(entry[name])
+    if number is None:
+        raise TableQueryError("The {} of the filter on '{}' is not a number: {}".format(name, entry.get("key"), entry[name]))
+    return number
+
+
+def from_data(data):
+    filters = data.get("filters") or []
+    if isinstance(filters, str):
+        try:
+            filters = json.loads(filters)
+        except ValueError:
+            raise TableQueryError("The filters are not valid JSON")
+    if isinstance(filters, dict):
+        # {column: text} shorthand
+        filters = [{"key": key, "value": value} for key, value in filters.items()]
+    if not isinstance(filters, list):
+        raise TableQueryError("The filters must be a list")
+
+    parsed = []
+    for entry in filters:
+        if not isinstance(entry, dict) or not entry.get("key"):
+            raise TableQueryError("Every filter needs a column \"key\"")
+        value = entry.get("value", entry.get("chosen_value"))
+        value = None if value in (None, "") else value
+        minimum, maximum = _bound(entry, "min"), _bound(entry, "max")
+        if value is None and minimum is None and maximum is None: continue
+        parsed.append(Filter(entry["key"], value, minimum, maximum))
+
+    order = str(data.get("order") or "asc").lower()
+    if order not in ("asc", "desc"):
+        raise TableQueryError("The order must be 'asc' or 'desc'")
+
+    return Query(parsed, data.get("sort") or None, order == "desc")
+
+
+class Table(object):
+
+    def __init__(self, columns, size, lazy=None):
+        # columns: name -> sequence of `size` values; lazy: name -> function
+        # returning such a sequence, called the first time the column is used
+        self.columns = dict(columns)
+        self.size = size
+        self.lazy = dict(lazy or {})
+        self._ranks = {}
+        self._lock = threading.Lock()
+
+    def column(self, name):
+        with self._lock:
+            if name in self.columns: return self.columns[name]
+            function = self.lazy.get(name)
+        if function is None:
+            raise TableQueryError("Unknown column: " + str(name))
+
+        values = function()
+        with self._lock:
+            return self.columns.setdefault(name, values)
+
+    def ranks(self, name, descending=False):
+        # Position of every row in the sorted column, missing values last
+        key = (name, descending)
+        with self._lock:
+            ranks = self._ranks.get(key)
+        if ranks is not None: return ranks
+
+        values = self.column(name)
+        present = [i for i in range(self.size) if not is_missing(values[i])]
+        missing = [i for i in range(self.size) if is_missing(values[i])]
+        present.sort(key=lambda i: sort_key(values[i]), reverse=descending)
+
+        ranks = array("l", [0]) * self.size
+        for rank, i in enumerate(present + missing):
+            ranks[i] = rank
+
+        with self._lock:
+            return self._ranks.setdefault(key, ranks)
+
+    def select(self, query, rows=None):
+        # Row numbers matching the query, among `rows` (default: all of them), in the requested order
+        for name in query.columns():
+            self.column(name)
+
+        selection = range(self.size) if rows is None else rows
+        for f in query.filters:
+            values = self.column(f.key)
+            selection = [i for i in selection if f.matches(values[i])]
+
+        if query.sort is not None:
+            ranks = self.ranks(query.sort, query.descending)
+            selection = sorted(selection, key=ranks.__getitem__)
+
+        return array("l", selection)
+
+
+def query_rows(query, colnames, rows):
+    # Filters and sorts a list of rows (lists of values in the order of colnames)
+    if not query: return rows
+    columns = {name: [row[j] for row in rows] for j, name in enumerate(colnames)}
+    return [rows[i] for i in Table(columns, len(rows)).select(query)]
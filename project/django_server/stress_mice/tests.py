@@ -1,3 +1,269 @@
-from django.test import TestCase
+import math
+import os
+import shutil
+import tempfile
+from array import array
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from stress_mice import autocomplete, deg_store, distribution_index, fanout, gene_lists, metrics, phenodata, rpool, table_query
+from stress_mice.datacache import file_stamp
+from stress_mice.utils import distribution
+
+
+class TableQueryTests(SimpleTestCase):
+
+    COLUMNS = ["gene", "fc", "padj"]
+    ROWS = [
+        ["Fkbp5", 2.5, 0.001],
+        ["Sgk1", -1.0, None],
+        ["Nr3c1", 0.5, 0.2],
+        ["fkbp4", -3.0, float("nan")],
+        ["Per1", 1.5, "0.01"],
+    ]
+
+    def query(self, **data):
+        return [row[0] for row in table_query.query_rows(table_query.from_data(data), self.COLUMNS, self.ROWS)]
+
+    def test_no_query_keeps_the_rows(self):
+        self.assertFalse(table_query.from_data({}))
+        self.assertEqual(self.query(), ["Fkbp5", "Sgk1", "Nr3c1", "fkbp4", "Per1"])
+
+    def test_substring_filter_ignores_case(self):
+        self.assertEqual(self.query(filters=[{"key": "gene", "value": "FKBP"}]), ["Fkbp5", "fkbp4"])
+
+    def test_numeric_range_includes_bounds(self):
+        self.assertEqual(self.query(filters=[{"key": "fc", "min": -1, "max": 1.5}]), ["Sgk1", "Nr3c1", "Per1"])
+
+    def test_range_skips_missing_values(self):
+        self.assertEqual(self.query(filters=[{"key": "padj", "max": "0.05"}]), ["Fkbp5", "Per1"])
+
+    def test_filters_are_combined_with_and(self):
+        filters = [{"key": "gene", "value": "k"}, {"key": "fc", "min": 0}]
+        self.assertEqual(self.query(filters=filters), ["Fkbp5"])
+
+    def test_sort_puts_missing_values_last_in_both_directions(self):
+        self.assertEqual(self.query(sort="padj"), ["Fkbp5", "Per1", "Nr3c1", "Sgk1", "fkbp4"])
+        self.assertEqual(self.query(sort="padj", order="desc"), ["Nr3c1", "Per1", "Fkbp5", "Sgk1", "fkbp4"])
+
+    def test_sort_is_numeric_for_numbers(self):
+        self.assertEqual(self.query(sort="fc", order="desc"), ["Fkbp5", "Per1", "Nr3c1", "Sgk1", "fkbp4"])
+
+    def test_filters_as_json_string_and_shorthand(self):
+        self.assertEqual(self.query(filters='[{"key": "gene", "value": "per"}]'), ["Per1"])
+        self.assertEqual(self.query(filters={"gene": "sgk"}), ["Sgk1"])
+
+    def test_select_among_candidate_rows(self):
+        table = table_query.Table({name: [row[j] for row in self.ROWS] for j, name in enumerate(self.COLUMNS)}, len(self.ROWS))
+        query = table_query.from_data({"sort": "fc"})
+        self.assertEqual(list(table.select(query, [0, 2, 4])), [2, 4, 0])
+
+    def deg_table(self):
+        columns = {name: array("d", values) for name, values in zip(deg_store.COLUMNS, [
+            [120.5, 80, 15.25], [2.1, -1.2, 0.4], [0.3, 0.2, 0.5], [7.0, -6.0, 0.8], [1e-05, 0.001, 0.42], [0.0004, float("nan"), 0.9]])}
+        na = {name: b"\x00\x01\x00" if name == "padj" else bytes(3) for name in deg_store.COLUMNS}
+        return deg_store.DegTable(["gene"] + deg_store.COLUMNS, ["Fkbp5", "Sgk1", "Per1"], columns, na)
+
+    def test_deg_table_applies_the_query_to_the_thresholded_rows(self):
+        table = self.deg_table()
+        everything = (float("inf"), float("inf"), -float("inf"))
+        self.assertEqual(list(table.select(*everything, query=table_query.from_data({"sort": "log2FoldChange"}))), [2, 0])
+        query = table_query.from_data({"filters": [{"key": "gene", "value": "p"}]})
+        self.assertEqual(list(table.select(*everything, query=query)), [0, 2])
+
+    def test_deg_table_extra_columns(self):
+        table = self.deg_table()
+        extra = {"symbol length": lambda genes: [len(x) for x in genes]}
+        query = table_query.from_data({"sort": "symbol length", "order": "desc"})
+        self.assertEqual(list(table.select(float("inf"), float("inf"), -float("inf"), query=query, extra_columns=extra)), [0, 2])
+
+    def test_invalid_queries(self):
+        for data in [{"filters": "[x"}, {"filters": [{"value": "a"}]}, {"order": "up"},
+                     {"filters": [{"key": "fc", "min": "high"}]}]:
+            with self.assertRaises(table_query.TableQueryError):
+                table_query.from_data(data)
+        with self.assertRaises(table_query.TableQueryError):
+            self.query(sort="unknown")
+
+
+class DegStoreTests(SimpleTestCase):
+
+    CSV = ("gene baseMean log2FoldChange lfcSE stat pvalue padj\n"
+           "Fkbp5 120.5 2.1 0.3 7.0 1e-05 0.0004\n"
+           "Sgk1 80 -1.2 0.2 -6.0 0.001 NA\n"
+           "Per1 15.25 0.4 0.5 0.8 0.42 0.9\n")
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.directory, "sorted.DEG.csv")
+        with open(self.csv_path, "w") as writer:
+            writer.write(self.CSV)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameTable(self, a, b):
+        self.assertEqual(a.header, b.header)
+        self.assertEqual(a.genes, b.genes)
+        self.assertEqual(a.na, b.na)
+        for i in range(len(a)):
+            for x, y in zip(a.fields(i)[1:], b.fields(i)[1:]):
+                self.assertTrue(x == y or (math.isnan(x) and math.isnan(y)))
+
+    def test_binary_round_trip(self):
+        table = deg_store.parse_csv(self.csv_path)
+        sources = file_stamp([self.csv_path])
+        bin_path = os.path.join(self.directory, "sorted.DEG.bin")
+
+        deg_store.write_binary(table, bin_path, sources)
+        self.assertSameTable(table, deg_store.read_binary(bin_path, sources))
+
+        self.assertEqual(table.fields(0), ["Fkbp5", 120.5, 2.1, 0.3, 7.0, 1e-05, 0.0004])
+        self.assertTrue(math.isnan(table.fields(1)[6]))
+        self.assertEqual(table.na["padj"], b"\x00\x01\x00")
+
+    def test_binary_from_other_sources_is_ignored(self):
+        table = deg_store.parse_csv(self.csv_path)
+        bin_path = os.path.join(self.directory, "sorted.DEG.bin")
+        deg_store.write_binary(table, bin_path, file_stamp([self.csv_path]))
+        self.assertIsNone(deg_store.read_binary(bin_path, [(self.csv_path, 0, 0)]))
+
+    def test_load_table_writes_the_binary_and_selects_without_na(self):
+        table = deg_store.load_table(self.csv_path)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "sorted.DEG.bin")))
+        self.assertEqual(list(table.select(0.01, 0.01, -10)), [0])
+        self.assertEqual(list(table.select(float("inf"), float("inf"), -float("inf"))), [0, 2])
+        self.assertEqual(len(deg_store.load_table(self.csv_path)), 3)
+
+
+class DistributionIndexTests(SimpleTestCase):
+
+    RECORDS = [("G{}".format(i), i % 3, i % 2, ["cfg{}".format(j) for j in range(i % 4 + 1)]) for i in range(10)]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "distribution.txt")
+        with open(self.path, "w") as writer:
+            for label, up, down, who in self.RECORDS:
+                writer.write("{}\t{}+{}-\t{}\n".format(label, up, down, "|".join(who)))
+
+    def test_pages_from_the_line_index(self):
+        distribution_index.write_index(self.path, distribution_index.scan(self.path, stride=3))
+
+        index = distribution_index.read_index(self.path)
+        self.assertEqual(index.lines, 10)
+        self.assertEqual(index.read(self.path, 4, 3), ["G4\t1+0-\tcfg0", "G5\t2+1-\tcfg0|cfg1", "G6\t0+0-\tcfg0|cfg1|cfg2"])
+        self.assertEqual(index.read(self.path, 9, 5), ["G9\t0+1-\tcfg0|cfg1"])
+        self.assertEqual(index.read(self.path, 10, 5), [])
+
+    def test_index_of_a_changed_file_is_ignored(self):
+        distribution_index.write_index(self.path, distribution_index.scan(self.path))
+        with open(self.path, "a") as writer:
+            writer.write("G10\t1+0-\tcfg0\n")
+        self.assertIsNone(distribution_index.read_index(self.path))
+        self.assertEqual(distribution_index.load_index(self.path).lines, 11)
+
+
+class DistributionRebuildTests(SimpleTestCase):
+
+    FILES = {
+        "a.csv": ["x,x,x,2.0,0.01,0.02,Fkbp5", "x,x,x,-1.0,NA,NA,Sgk1", "x,x,x,-0.5,0.01,0.01,Per1", "x,x,x,3.0,0.01,0.01,Fkbp5"],
+        "b.csv": ["x,x,x,0.8,0.01,0.01,Per1", "x,x,x,1.0,0.01,NA,Nr3c1", "x,x,x,1.5,0.001,0.01,Fkbp5"],
+    }
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name, lines in self.FILES.items():
+            with open(os.path.join(self.directory, name), "w") as writer:
+                writer.write("\n".join(["a,b,c,fc,pval,qval,gene"] + lines) + "\n")
+
+    def test_rebuild_skips_na_and_writes_the_binary_form(self):
+        records = list(distribution.compute(self.directory, "gene", max_pvalue=0.05, max_qvalue=0.05, processes=1, run_records=1))
+        self.assertEqual(records, [
+            ("Fkbp5", {"group1": 2, "group2": 0, "who": ["a", "b"]}),
+            ("Per1", {"group1": 1, "group2": 1, "who": ["a", "b"]}),
+        ])
+
+        output = os.path.join(self.directory, "distribution.txt")
+        distribution.write(iter(records), output)
+        with open(output) as reader:
+            self.assertEqual(reader.read(), "Fkbp5\t2+0-\ta|b\nPer1\t1+1-\ta|b\n")
+        self.assertEqual(distribution_index.read_index(output).lines, 2)
+        self.assertEqual(distribution_index.read_binary(output).read(0, 5), [("Fkbp5", 2, 0, ["a", "b"]), ("Per1", 1, 1, ["a", "b"])])
+        self.assertEqual(distribution_index.read_binary(output).read(1, 1), [("Per1", 1, 1, ["a", "b"])])
+
+        # The binary form of a changed file is ignored
+        with open(output, "a") as writer:
+            writer.write("Nr3c1\t1+0-\tb\n")
+        self.assertIsNone(distribution_index.read_binary(output))
+
+
+class AutocompleteTests(SimpleTestCase):
+
+    def test_prefix_matches_are_ranked_before_truncation(self):
+        index = autocomplete.AutocompleteIndex(["Fkbp5{:03d}".format(i) for i in range(200)] + ["Fkbp5", "Fkbp51", "xFkbp5"])
+        self.assertEqual(index.search("Fkbp5", limit=3), ["Fkbp5", "Fkbp51", "Fkbp5000"])
+
+    def test_substring_matches_come_after_prefix_matches(self):
+        index = autocomplete.AutocompleteIndex(["Per1", "Per2", "Xper", "Sgk1", "aPer3"])
+        self.assertEqual(index.search("Per"), ["Per1", "Per2", "aPer3"])
+        self.assertEqual(index.search("Per", substring=False), ["Per1", "Per2"])
+        self.assertEqual(index.search("", limit=2), ["Per1", "Per2"])
+
+
+class PhenodataTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.csv_path = os.path.join(self.directory, "phenodata.csv")
+        self.bg_path = os.path.join(self.directory, "bg.RData")
+        with open(self.csv_path, "w") as writer:
+            writer.write('ids,"treatment, dose",time_h\nS1,"cort, high",24\nS2,vehicle,24\n\n')
+
+    def test_csv_fields_may_be_quoted(self):
+        index = phenodata.from_csv(self.csv_path)
+        self.assertEqual(index.columns, ["treatment, dose", "time_h"])
+        self.assertEqual(index.distinct("treatment, dose"), ["cort, high", "vehicle"])
+        self.assertEqual(index.counts("time_h"), [("24", 2)])
+
+    def test_r_phenodata_is_used_when_the_csv_covariates_differ(self):
+        open(self.bg_path, "w").close()
+        r_table = rpool.RDataFrame(["ids", "treatment", "time_h"], [["S1", "cort", 24], ["S2", "vehicle", 24]])
+        index = phenodata.get_index("PRJ_TEST_R", self.csv_path, self.bg_path, lambda: r_table)
+        self.assertEqual(index.columns, ["treatment", "time_h"])
+
+        matching = rpool.RDataFrame(["ids", "treatment, dose", "time_h"], r_table.rows)
+        index = phenodata.get_index("PRJ_TEST_CSV", self.csv_path, self.bg_path, lambda: matching)
+        self.assertEqual(index.distinct("treatment, dose"), ["cort, high", "vehicle"])
+
+
+class MetricsTests(SimpleTestCase):
+
+    def test_fanout_tasks_record_their_phases_for_the_request(self):
+        timer = metrics.RequestTimer()
+        def task(bioproject):
+            metrics.add_phase("r_call", 0.5)
+            return bioproject
+
+        results = metrics.bind(fanout.run, timer)(task, ["PRJ1", "PRJ2", "PRJ3"])
+        self.assertEqual([x[1] for x in results], ["PRJ1", "PRJ2", "PRJ3"])
+        self.assertEqual(timer.phases, {"r_call": 1.5})
+
+
+class GeneListTests(SimpleTestCase):
+
+    def test_parse_splits_strips_and_deduplicates(self):
+        self.assertEqual(gene_lists.parse('"Fkbp5", Nr3c1;\tFkbp5\nSgk1 \n'), ["Fkbp5", "Nr3c1", "Sgk1"])
+        self.assertEqual(gene_lists.parse(["Per1", " Per1", "Per2"]), ["Per1", "Per2"])
+
+    def test_parse_rejects_empty_and_oversized_lists(self):
+        with self.assertRaises(gene_lists.GeneListError):
+            gene_lists.parse(" ,\n")
+        with self.assertRaises(gene_lists.GeneListError):
+            gene_lists.parse(42)
+        with self.settings(GENE_LIST_MAX=2):
+            with self.assertRaises(gene_lists.GeneListError):
+                gene_lists.parse("A B C")
@@ -20,12 +20,21 @@ from stress_mice import views
 
 urlpatterns = [
     url(r'^clear_cache/', views.clear_cache),
+    url(r'^cache_stats/', views.cache_stats),
+    url(r'^metrics/?$', views.metrics_view),
+    url(r'^ready/', views.ready),
+    url(r'^jobs/submit/', views.submit_job),
+    url(r'^jobs/([^/]*)/result/', views.job_result),
+    url(r'^jobs/([^/]*)/', views.job_status),
     url(r'^get_projects/', views.get_projects),
     url(r"dataset_overview/", views.dataset_overview),
     url("^genes/([^/]*)/?(.*)", views.genes),
     url("^genes/", views.simple_genes),
     url(r"search_by_gene_symbol/", views.search_by_gene_symbol),
     url(r"see_gene_isoforms/", views.see_gene_isoforms),
+    url(r"^gene_across_bioprojects/", views.gene_across_bioprojects),
+    url(r"^search_by_gene_list/", views.search_by_gene_list),
+    url(r"^search_degs_by_gene_list/", views.search_degs_by_gene_list),
     url(r"^transcripts/([^/]*)/?(.*)", views.transcripts),
     url(r"search_by_transcript_symbol/", views.search_by_transcript_symbol),
     url(r'^features/', views.features),
@@ -1,63 +1,260 @@
 #!/usr/bin/python
+"""
+Consensus of the differentially expressed genes/transcripts of a diff/<key>=<value> directory.
+
+For every gene (or transcript) it counts in how many of the DE files of
+the directory it is up- (+) or down-regulated (-) and which files
+support it, and writes one line per label, most supported first:
+
+    label <TAB> <up>+<down>- <TAB> file1|file2|...
+
+Memory stays bounded whatever the number and size of the files. The
+files are read in parallel by a process pool, each worker writing the
+labels of its file, sorted, to a spill file. The parent merges the spill
+files label by label (a k-way merge, holding one line per file), and
+sorts the merged counts by support with an external sort: runs of at
+most RUN_RECORDS labels are sorted in memory and spilled, then merged
+again. Ties keep the order in which labels first appear in the files,
+as the sequential script did. Usage (from project/django_server):
+
+    python -m stress_mice.utils.distribution DIR MODE [--output FILE]
+    python -m stress_mice.utils.distribution --all stress_mice/data/diff/
+
+With --output (and --all, which writes DIR/distribution.txt for every
+out_gene and out_transcript directory) the line index and the binary
+form read by the server (see stress_mice/distribution_index.py) are
+written next to it.
+"""
+import argparse
 import glob
+import heapq
 import os
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
-data = {}
+from stress_mice import distribution_index
 
 group_labels = {
     "group1": "+",
     "group2": "-"
 }
 
-dir = sys.argv[1]
-mode = sys.argv[2]
-
-if mode == "gene": index = -1
-elif mode == "transcript": index = -5
-else:
-	sys.stderr.write("Please provide a mode between 'gene' and 'transcript'!\n")
-	sys.exit()
-
-files = glob.glob(dir + "*")
-for file in files:
-    separator = ""
-    if file.endswith(".tsv"): separator = "\t"
-    if file.endswith(".csv"): separator = ","
-    
-    id = os.path.splitext(os.path.basename(file))[0]
-    
+# Column positions of fold change, p-value, q-value and label in each mode
+COLUMNS = {
+    "gene": {"fc": 3, "pval": 4, "qval": 5, "label": -1},
+    "transcript": {"fc": 2, "pval": 3, "qval": 4, "label": -5},
+}
+
+# Labels sorted in memory at once by the parent before spilling them
+RUN_RECORDS = 100000
+
+
+def to_float(value):
+    # None for NA and empty cells, which pass no threshold
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def read_file(args):
+    # Writes (label, group, position) for the first occurrence of each
+    # label passing the thresholds, sorted by label, to the spill file
+    # `part`; position is the rank of the label in the file
+    file, mode, min_fold_change, max_pvalue, max_qvalue, part = args
+    columns = COLUMNS[mode]
+    index = columns["label"]
+
+    separator = "\t" if file.endswith(".tsv") else ","
+
     met = set()
-    
+    labels = []
+
     with open(file, "r") as reader:
         reader.readline()
         for line in reader:
             line = line.rstrip('\n')
             fields = line.split(separator)
 
-            if mode == "gene": fc = float(fields[3]) 
-            elif mode == "transcript": fc = float(fields[2])
-            
+            fc = to_float(fields[columns["fc"]])
+            if fc is None or abs(fc) < min_fold_change: continue
+            if max_pvalue is not None:
+                pvalue = to_float(fields[columns["pval"]])
+                if pvalue is None or not pvalue <= max_pvalue: continue
+            if max_qvalue is not None:
+                qvalue = to_float(fields[columns["qval"]])
+                if qvalue is None or not qvalue <= max_qvalue: continue
+
             group = "group1" if fc >= 0 else "group2"
             label = fields[index] if fields[index] != '"."' else fields[index-1]
             label = label.replace('"', "")
-            
+
             if label in met: continue
             met.add(label)
-            
-            if label not in data:
-                data[label] = {'group1': 0, 'group2': 0, 'who': []}
-
-            datum = data[label]
-                
-            datum[group] += 1
-            datum['who'].append(id)
-
-# Let's sort
-sorted_data = sorted(data, key=lambda x: data[x]['group1'] + data[x]['group2'], reverse=True)
-
-for label in sorted_data:
-        datum = data[label]
-        g1 = datum['group1']
-        g2 = datum['group2']
-        sys.stdout.write(label + "\t" + str(g1)+group_labels["group1"] + str(g2)+group_labels["group2"] + "\t" + "|".join([str(x) for x in datum['who']]) + "\n")
+
+            labels.append((label, group, len(labels)))
+
+    labels.sort()
+    with open(part, "w") as writer:
+        for label, group, position in labels:
+            writer.write(label + "\t" + group + "\t" + str(position) + "\n")
+
+    return part
+
+
+def read_part(path, file_number):
+    with open(path) as reader:
+        for line in reader:
+            label, group, position = line.rstrip("\n").split("\t")
+            yield label, file_number, int(position), group
+
+
+def merge_parts(parts):
+    # Yields, by label, (label, group1, group2, supporting file numbers, first file number, position)
+    merged = heapq.merge(*[read_part(path, i) for i, path in enumerate(parts)])
+
+    current = None
+    for label, file_number, position, group in merged:
+        if current is None or current[0] != label:
+            if current is not None: yield current
+            current = [label, 0, 0, [], file_number, position]
+        current[1 if group == "group1" else 2] += 1
+        current[3].append(file_number)
+    if current is not None: yield current
+
+
+def sort_key(record):
+    label, g1, g2, who, first_file, first_position = record
+    return (-(g1 + g2), first_file, first_position)
+
+
+def write_run(records, path):
+    with open(path, "w") as writer:
+        for label, g1, g2, who, first_file, first_position in records:
+            writer.write("\t".join([label, str(g1), str(g2), "|".join(str(x) for x in who), str(first_file), str(first_position)]) + "\n")
+
+
+def read_run(path):
+    with open(path) as reader:
+        for line in reader:
+            label, g1, g2, who, first_file, first_position = line.rstrip("\n").split("\t")
+            record = [label, int(g1), int(g2), [int(x) for x in who.split("|")], int(first_file), int(first_position)]
+            yield sort_key(record), record
+
+
+def compute(dir, mode, min_fold_change=0, max_pvalue=None, max_qvalue=None, processes=None, run_records=RUN_RECORDS):
+    # Generator of (label, {"group1": up, "group2": down, "who": [file ids]}), most supported first
+    if mode not in COLUMNS:
+        raise ValueError("Please provide a mode between 'gene' and 'transcript'!")
+
+    files = sorted(x for x in glob.glob(os.path.join(dir, "*")) if x.endswith(".csv") or x.endswith(".tsv"))
+    ids = [os.path.splitext(os.path.basename(file))[0] for file in files]
+
+    spill_dir = tempfile.mkdtemp(prefix="distribution_")
+    try:
+        tasks = [(file, mode, min_fold_change, max_pvalue, max_qvalue, os.path.join(spill_dir, "part{}".format(i)))
+                 for i, file in enumerate(files)]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            parts = list(executor.map(read_file, tasks))
+
+        runs = []
+        buffer = []
+        for record in merge_parts(parts):
+            buffer.append(record)
+            if len(buffer) >= run_records:
+                buffer.sort(key=sort_key)
+                runs.append(os.path.join(spill_dir, "run{}".format(len(runs))))
+                write_run(buffer, runs[-1])
+                buffer = []
+        buffer.sort(key=sort_key)
+
+        if runs:
+            runs.append(os.path.join(spill_dir, "run{}".format(len(runs))))
+            write_run(buffer, runs[-1])
+            records = (record for _, record in heapq.merge(*[read_run(path) for path in runs], key=lambda x: x[0]))
+        else:
+            records = iter(buffer)
+
+        for label, g1, g2, who, _, _ in records:
+            yield label, {'group1': g1, 'group2': g2, 'who': [ids[x] for x in who]}
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def format_line(label, datum):
+    g1 = datum['group1']
+    g2 = datum['group2']
+    return label + "\t" + str(g1)+group_labels["group1"] + str(g2)+group_labels["group2"] + "\t" + "|".join([str(x) for x in datum['who']]) + "\n"
+
+
+def write(distribution, output):
+    # distribution.txt, its line index and its binary form, in one pass
+    index = distribution_index.IndexWriter()
+    binary = distribution_index.BinaryWriter(distribution_index.binary_path(output))
+    tmp_path = output + ".tmp"
+    try:
+        with open(tmp_path, "wb") as writer:
+            for label, datum in distribution:
+                line = format_line(label, datum).encode("utf-8")
+                index.add(line)
+                binary.add(label, datum['group1'], datum['group2'], datum['who'])
+                writer.write(line)
+        os.replace(tmp_path, output)
+    except BaseException:
+        binary.abort()
+        raise
+
+    distribution_index.write_index(output, index.index())
+    binary.close(output)
+
+
+def rebuild_all(base_dir, **options):
+    # Writes distribution.txt (its index and binary form) in every <base_dir>/<key>=<value>/out_<mode>/
+    outputs = []
+    for mode in ["gene", "transcript"]:
+        for dir in sorted(glob.glob(os.path.join(base_dir, "*", "out_" + mode))):
+            output = os.path.join(dir, "distribution.txt")
+            write(compute(dir, mode, **options), output)
+            outputs.append(output)
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("dir", nargs="?")
+    parser.add_argument("mode", nargs="?", choices=sorted(COLUMNS))
+    parser.add_argument("--output", help="write to this file (and its index) instead of stdout")
+    parser.add_argument("--all", metavar="DIFF_DIR", help="rebuild every distribution.txt under DIFF_DIR")
+    parser.add_argument("--min-fold-change", type=float, default=0, help="minimum absolute fold change")
+    parser.add_argument("--max-pvalue", type=float, default=None)
+    parser.add_argument("--max-qvalue", type=float, default=None)
+    parser.add_argument("--processes", type=int, default=None, help="size of the process pool (default: number of cores)")
+    args = parser.parse_args()
+
+    options = {
+        "min_fold_change": args.min_fold_change,
+        "max_pvalue": args.max_pvalue,
+        "max_qvalue": args.max_qvalue,
+        "processes": args.processes,
+    }
+
+    if args.all:
+        for output in rebuild_all(args.all, **options):
+            sys.stderr.write(output + "\n")
+        return
+
+    if args.dir is None or args.mode is None:
+        parser.error("Please provide a directory and a mode between 'gene' and 'transcript'!")
+
+    distribution = compute(args.dir, args.mode, **options)
+    if args.output:
+        write(distribution, args.output)
+    else:
+        for label, datum in distribution:
+            sys.stdout.write(format_line(label, datum))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,25 @@
 from django.shortcuts import render
 from django.http import HttpResponse
+from django.conf import settings
 import json
 import os
 import sys
 import glob
+import importlib
+import functools
+import math
+import statistics
 
-from collections import Counter
 
 from decimal import Decimal
 
-import rpy2
-import rpy2.robjects as robjects
-import rpy2.robjects.packages as rpackages
 import datetime
+import logging
 from django.core.cache import cache
 from django.conf.locale import bg
 
+logger = logging.getLogger(__name__)
+
 def create_new_image(url, width="100px"):
     return {
             "type": "image",
@@ -233,65 +237,41 @@ def convert_bytes(number):
     return "{0:.2f}".format(s) + " " + sizes[i]
 
 BASE_BGE_DIR = os.path.dirname(__file__) + "/Ballgown_Extractor/"
-BASE_DATA_DIR = os.path.dirname(__file__) + "/data/"
-
-
-
-
-
-
-
-
+# STRESS_MICE_DATA_DIR points the views to another data/ tree (e.g. the
+# benchmark fixtures, see stress_mice/bench/)
+BASE_DATA_DIR = os.path.join(getattr(settings, "STRESS_MICE_DATA_DIR", None) or os.path.dirname(__file__) + "/data", "")
+PLOT_DIR = os.path.join(getattr(settings, "STRESS_MICE_PLOT_DIR", None) or os.path.dirname(__file__) + "/../../material/imgs/temp", "")
 
+from stress_mice import catalog
+from stress_mice.conditional import data_condition
 
+def get_request_data(request):
+    # Query parameters of a GET, JSON body of a POST
+    if request.method in ("GET", "HEAD"):
+        return request.GET.dict()
+    return json.loads(request.body.decode('utf-8'))
 
+def project_paths(request, *args):
+    return [BASE_DATA_DIR + "project.json"]
 
+def phenotypic_information_paths(request):
+    # The directory itself changes when images are added or removed
+    directory = BASE_DATA_DIR + "phenotypic_information"
+    return [directory] + sorted(glob.glob(directory + "/*"))
 
+def phenodata_paths(request, bioproject):
+    return [BASE_DATA_DIR + "phenodata/" + bioproject + "/phenodata.csv", BASE_DATA_DIR + bioproject + "/bg.RData"]
 
+def degs_paths(request):
+    bioproject = str(get_request_data(request).get("bioproject"))
+    return [BASE_DATA_DIR + "degs/" + bioproject + "/sorted.DEG.csv", annotation.GENE2ID_PATH, annotation.GTF_PATH]
 
 def load_dataset_info():
-    filename = BASE_DATA_DIR + "project.json"
-    dataset = json.loads(open(filename, "r").read())
-    
-    map = {}
-    for bioproject in dataset["projects"]:
-        bioproject_id = bioproject["id"]
-        
-        # Bioprojects skipped/removed by Arianna
-        if bioproject_id == "PRJNA341670": continue
-        if bioproject_id == "PRJNA392171": continue
-        
-        if bioproject_id not in map:
-            map[bioproject_id] = {
-                    "size": 0,
-                    "organism": None,
-                    "experiments": 0,
-                    "paper_id": set(),
-                    "platform": set(),
-                    "samples": 0,
-                }
-        data = map[bioproject_id]
-        
-        data["paper_id"] = bioproject["papers"]
-        
-        for experiment in bioproject["experiments"]:
-            data["experiments"] += 1
-            dataset = experiment["dataset"]
-            size = dataset["size"]
-            organism = dataset["genome"]
-            paper_id = dataset["paper_id"] if "paper_id" in dataset else None
-            platform = dataset["platform"]
-            samples = len(dataset["sample_ids"])
-            
-            data["size"] += size
-#             if paper_id is not None: data["paper_id"].add(paper_id)
-            data["platform"].add(platform)
-            data["samples"] += samples
-            data["organism"] = organism
-            
-    return map
+    # Parsed once and kept in memory until project.json changes (see catalog.py)
+    return catalog.get_catalog(BASE_DATA_DIR + "project.json").get()
 
 # Create your views here.
+@data_condition(project_paths)
 def dataset_overview(request):
     
     map = load_dataset_info()
@@ -299,7 +279,7 @@ def dataset_overview(request):
     rows = []
     for bioproject_id in map:
         data = map[bioproject_id]
-        print("DATA", data)
+        logger.debug("DATA %s", data)
         row = []
         
         row.append(create_new_link("https://www.ncbi.nlm.nih.gov/bioproject/" + bioproject_id, bioproject_id, tooltip="See this BioProject within NCBI ("+bioproject_id+")"))
@@ -343,17 +323,93 @@ def dataset_overview(request):
 
 def clear_cache(request):
     cache.clear()
+    catalog.refresh()
+    get_r_pool().clear()
     return HttpResponse("OK")
 
-import threading
-lock = threading.Lock()
-
-def init():
-    
-    base = rpackages.importr("base")
-    base.source(BASE_BGE_DIR + "definitions.R")
+from stress_mice import rpool
+from stress_mice import warmup
+from stress_mice import expression_store
+from stress_mice import annotation
+from stress_mice import deg_store
+from stress_mice import autocomplete
+from stress_mice import phenodata
+from stress_mice import combinations
+from stress_mice import facets
+from stress_mice import distribution_index
+from stress_mice import plot_cache
+from stress_mice import jobs
+from stress_mice import streaming
+from stress_mice import metrics
+from stress_mice import fanout
+from stress_mice import gene_lists
+from stress_mice import table_query
+
+def get_r_pool():
+    # R_BACKEND names the pool factory: the R workers of rpool.py, or a
+    # stand-in such as stress_mice.bench.fake_r.get_pool
+    pinned = [BASE_DATA_DIR + x + "/bg.RData" for x in getattr(settings, "R_PINNED_BIOPROJECTS", [])]
+    backend = getattr(settings, "R_BACKEND", "stress_mice.rpool.get_pool")
+    module_name, function_name = backend.rsplit(".", 1)
+    get_pool = getattr(importlib.import_module(module_name), function_name)
+    return get_pool(BASE_BGE_DIR + "definitions.R", pinned)
+
+def ready(request):
+    state = warmup.get_state()
+    if not warmup.is_ready():
+        return HttpResponse(json.dumps({"status": state["status"], "done": state["done"], "total": state["total"]}), status=503)
     
-    return base
+    return HttpResponse("OK")
+
+def metrics_view(request):
+    plots = get_plot_cache()
+    extra = [
+        ("stress_mice_plot_cache_total", "counter", "Lookups of gene_plotter images, by result.", {"result": "hit"}, plots.hits),
+        ("stress_mice_plot_cache_total", "counter", "Lookups of gene_plotter images, by result.", {"result": "miss"}, plots.misses),
+        ("stress_mice_plot_cache_evictions_total", "counter", "gene_plotter images deleted to stay within PLOT_CACHE_BYTES.", {}, plots.evictions),
+    ]
+    return HttpResponse(metrics.render(extra), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def cache_stats(request):
+    response = {"r_workers": get_r_pool().stats(), "plots": get_plot_cache().stats()}
+    return HttpResponse(json.dumps(response))
+
+def r_call(bioproject, function, *args):
+    # Runs an R function from definitions.R on the bioproject's Ballgown
+    # object, which is always passed as the last argument.
+    path = BASE_DATA_DIR + bioproject + "/bg.RData"
+    return get_r_pool().call(bioproject, path, function, *args)
+
+def r_table(bioproject, offset, limit, function, *args):
+    # Same as r_call, but only rows offset..offset+limit of the resulting
+    # data.frame are converted and returned
+    path = BASE_DATA_DIR + bioproject + "/bg.RData"
+    return get_r_pool().table(bioproject, path, offset, limit, function, *args)
+
+def table_query_errors(view):
+    # Invalid filters or sorting (see table_query.py) are answered with a 400
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except table_query.TableQueryError as e:
+            return HttpResponse(json.dumps({"error": str(e)}), status=400)
+    return wrapper
+
+def query_frame(data, results):
+    # The rows of an RDataFrame matching the filters of the request, in its sort order
+    query = table_query.from_data(data)
+    if not query or not isinstance(results, rpool.RDataFrame): return results
+    labels = [simplify_column(x) for x in results.colnames]
+    return rpool.RDataFrame(results.colnames, table_query.query_rows(query, labels, results.rows))
+
+def r_query_table(bioproject, data, offset, limit, function, *args):
+    # r_table, filtered and sorted as the request asks: only the requested
+    # page is converted when there is nothing to filter or sort, otherwise
+    # the whole data.frame is needed
+    if not table_query.from_data(data):
+        return r_table(bioproject, offset, limit, function, *args)
+    return query_frame(data, r_call(bioproject, function, *args))
 
 def get_header():
     return [
@@ -417,7 +473,7 @@ def get_combinations(request):
     combinations_path = BASE_DATA_DIR + "/" + "combinations.tsv"
     
     data = json.loads(request.body.decode('utf-8'))
-    print(data)
+    logger.debug("Request data: %s", data)
     
     multielement = create_new_multi_element()
 #     multielement["subtype"] = "form"
@@ -439,31 +495,12 @@ def get_combinations(request):
         add_element_to_multi_element(multielement, select)
         to_remove.add(v)
     
-    options = set()
-    options2values = {}
-    with open(combinations_path, "r") as file:
-        for line in file:
-            
-            combination_id, bioproject, condition, covariate, dimensions = line.strip().split("\t")
-                                    
-            columns = dimensions.split("|")
-            for col in columns:
-                if col in to_remove: continue
-                options.add(col)
-                if col not in options2values:
-                    options2values[col] = set()
-
-            condition_formula = selector.parse_condition(selector.tokenize(condition))
-            for leaf in condition_formula.get_leaves():
-                if selector.get_operator(leaf) is None: continue
-                key, value = leaf.split(selector.get_operator(leaf))
-                options2values[key].add(value.replace("\"", ""))
+    # Parsed once per version of the file (see combinations.py)
+    options = combinations.get_index(combinations_path).options(to_remove)
     
     if options:
-        for option in sorted(options):
-            values = list(options2values[option])
-            values.sort()
-            print("OPTION", option, "VALUES", values)
+        for option, values in options:
+            logger.debug("OPTION %s VALUES %s", option, values)
             if not values: continue
             
             option_object = create_new_text(option + " = ")
@@ -494,7 +531,7 @@ def get_combinations(request):
 
 def get_differential_expression(request):
     data = json.loads(request.body.decode('utf-8'))
-    print(data)
+    logger.debug("Request data: %s", data)
 #     data = {"Region": "hipp"}
 
     offset = 0
@@ -511,42 +548,45 @@ def get_differential_expression(request):
     add_header(result, header)
     
     for key,value in data.items():
-        print(key, value)
+        logger.debug("%s=%s", key, value)
         if value is not None:
             relative_path = "diff/{}={}/out_gene/distribution.txt".format(key, value)
             filepath = BASE_DATA_DIR + relative_path
-            print("File: ", filepath)
+            logger.debug("File: %s", filepath)
             if not os.path.exists(filepath): continue
             
-            n = 0
-            with open(filepath) as file:
-                for line in file:
-                    n += 1
-                    if n < offset: continue
-                    
-                    row = create_row(result)
-                    if get_table_length(result) > limit: continue
-                    
-                    for i,field in enumerate(line.strip().split("\t")):
-                        if i == 2:
-                            for f in field.split("|"):
-                                button = create_new_button(f, url="/stress_mice_api/stress_mice/differential_expression_file", tooltip="See the list of genes/transcripts for this configuration")
-                                button["items"] = [create_new_text(f)]
-                                button["data"]["value"] = relative_path
-                                button["data"]["onClick"] = [{
-                                        "key": "expression_file",
-                                        "action": "write",
-                                        "scope": "global"
-                                    }]
-                                
-                                row[header[i]["title"]].append(button)
-                        else:
-                            cell = create_new_text(field)
-                            row[header[i]["title"]].append(cell)
-                        
-                    add_row(result, row)
+            # The binary form gives the page with one read; without it (or
+            # when it is out of date), seek to the page with the line index
+            index = distribution_index.get_binary(filepath)
+            if index is not None:
+                lines = [[label, str(up) + "+" + str(down) + "-", "|".join(who)] for label, up, down, who in index.read(offset, limit)]
+            else:
+                index = distribution_index.get_index(filepath)
+                lines = [line.strip().split("\t") for line in index.read(filepath, offset, limit)]
+
+            for fields in lines:
+                row = create_row(result)
+                
+                for i,field in enumerate(fields):
+                    if i == 2:
+                        for f in field.split("|"):
+                            button = create_new_button(f, url="/stress_mice_api/stress_mice/differential_expression_file", tooltip="See the list of genes/transcripts for this configuration")
+                            button["items"] = [create_new_text(f)]
+                            button["data"]["value"] = relative_path
+                            button["data"]["onClick"] = [{
+                                    "key": "expression_file",
+                                    "action": "write",
+                                    "scope": "global"
+                                }]
+                            
+                            row[header[i]["title"]].append(button)
+                    else:
+                        cell = create_new_text(field)
+                        row[header[i]["title"]].append(cell)
                     
-            result["total"] = n
+                add_row(result, row)
+                
+            result["total"] = index.lines
     
     return HttpResponse(json.dumps(result))
 
@@ -554,6 +594,7 @@ def get_differential_expression_file(request):
     result = {}
     return HttpResponse(json.dumps(result))
 
+@data_condition(phenotypic_information_paths)
 def get_dataset_phenotypic_information(request):
     result = create_new_multi_element("column", "start center")
     
@@ -576,12 +617,11 @@ def get_dataset_phenotypic_information(request):
     
     return HttpResponse(json.dumps(result))
 
+@table_query_errors
 def search_by_gene_symbol(request):
-    print(str(datetime.datetime.now()))
-
     data = json.loads(request.body.decode('utf-8'))
 #     data = {}
-    print(data)
+    logger.debug("Request data: %s", data)
     
     bioproject = data["bioproject"]
     gene_symbol = data["gene_name_sy"]
@@ -593,18 +633,22 @@ def search_by_gene_symbol(request):
     if "offset" in data: offset = data["offset"]
     if "limit" in data: limit = data["limit"]
     
-    rows = []
 
-    with lock:
-        basedir = BASE_DATA_DIR + bioproject + "/"
-        bg = get_ballgown_object(basedir + "bg.RData")
-        SearchByGene = robjects.r("SearchByGene")
-        results = SearchByGene(gene_symbol, bg)
+    # Served from the exported expression matrices when available,
+    # otherwise by R (see expression_store.py and the export_expression command)
+    store = expression_store.get_store(BASE_DATA_DIR + bioproject + "/expression/")
+    if store is not None:
+        results = store.search_by_gene(gene_symbol)
+    else:
+        results = r_call(bioproject, "SearchByGene", gene_symbol)
     
     # Make the call
-    print(results, len(results), results.names, results[0])
+    logger.debug("SearchByGene returned %s values: %s", len(results), results.names)
     
-    total = len(results)
+    samples = [[name, value] for name, value in zip(results.names or [], results)]
+    samples = table_query.query_rows(table_query.from_data(data), ["Sample ID", "FPKM value"],
+                                     [[name.replace("trimmed_", ""), value] for name, value in samples])
+    total = len(samples)
     
     header = []
     for colname in ["Sample ID", "FPKM value"]:
@@ -627,38 +671,195 @@ def search_by_gene_symbol(request):
             }
         })
     
-    for i in range(total):
-        row_dict = {}
-        
-        sample_id = results.names[i].replace("FPKM.", "")
-        sample_id = results.names[i].replace("trimmed_", "")
-        value = results[i]
-        
-        row_dict["Sample ID"] = [{
-            "type": "text",
-            "label": str(sample_id),
-            "color": "black"
-        }]
-        
-        row_dict["FPKM value"] = [{
-            "type": "text",
-            "label": str(value),
-            "color": "black"
-        }]
-        
-        rows.append(row_dict)
-    
-    response = {"structure": {"field_list": header}, "total": total, "hits": rows}
-    
-    return HttpResponse(json.dumps(response))
+    def rows():
+        for sample_id, value in samples:
+            row_dict = {}
+            
+            row_dict["Sample ID"] = [{
+                "type": "text",
+                "label": str(sample_id),
+                "color": "black"
+            }]
+            
+            row_dict["FPKM value"] = [{
+                "type": "text",
+                "label": str(value),
+                "color": "black"
+            }]
+            
+            yield row_dict
+    
+    return streaming.table_response(request, header, total, rows())
+
+def across_bioprojects(data):
+    # The bioprojects asked for (a list, or comma-separated in a query string), by default all of them
+    bioprojects = data.get("bioprojects")
+    if not bioprojects: return list(load_dataset_info())
+    if isinstance(bioprojects, str): bioprojects = bioprojects.split(",")
+    return [str(x) for x in bioprojects]
+
+def gene_across_paths(request):
+    paths = [BASE_DATA_DIR + "project.json", annotation.GENE2ID_PATH]
+    for bioproject in across_bioprojects(get_request_data(request)):
+        paths += [BASE_DATA_DIR + bioproject + "/bg.RData",
+                  BASE_DATA_DIR + bioproject + "/expression/manifest.json",
+                  BASE_DATA_DIR + "degs/" + bioproject + "/sorted.DEG.csv"]
+    return paths
+
+def gene_in_bioproject(bioproject, gene_symbol):
+    # Expression summary and DESeq statistics of a gene in one bioproject,
+    # None for the parts the bioproject has no data for
+    store = expression_store.get_store(BASE_DATA_DIR + bioproject + "/expression/")
+    if store is not None:
+        values = store.search_by_gene(gene_symbol)
+    elif os.path.exists(BASE_DATA_DIR + bioproject + "/bg.RData"):
+        values = r_call(bioproject, "SearchByGene", gene_symbol)
+    else:
+        values = []
+    values = [float(x) for x in values if x is not None and not math.isnan(x)]
+
+    expression = None
+    if values:
+        expression = {
+            "Samples": len(values),
+            "Mean FPKM": statistics.mean(values),
+            "Median FPKM": statistics.median(values),
+            "Min FPKM": min(values),
+            "Max FPKM": max(values),
+        }
 
-def see_gene_isoforms(request):
-    print(str(datetime.datetime.now()))
+    degs = None
+    degs_path = BASE_DATA_DIR + "degs/" + bioproject + "/sorted.DEG.csv"
+    if os.path.exists(degs_path):
+        table = deg_store.get_table(degs_path)
+        i = table.index.get(gene_symbol)
+        if i is not None:
+            degs = dict(zip(deg_store.COLUMNS, table.fields(i)[1:]))
+
+    return {"expression": expression, "degs": degs}
+
+@table_query_errors
+@data_condition(gene_across_paths)
+def gene_across_bioprojects(request):
+    data = get_request_data(request)
+    logger.debug("Request data: %s", data)
+
+    gene_symbol = data["gene_name_sy"]
+
+    # Every bioproject is queried at the same time (see fanout.py)
+    results = fanout.run(gene_in_bioproject, across_bioprojects(data), gene_symbol)
 
+    expression_columns = ["Samples", "Mean FPKM", "Median FPKM", "Min FPKM", "Max FPKM"]
+    header = [{
+        "label": colname,
+        "title": colname,
+        "tooltip": colname,
+        "filters": {
+            "title": colname + " filters:",
+            "list": [
+                {
+                    "type": "select",
+                    "key": colname,
+                    "title": "Select a "+colname+":",
+                    "placeholder": "",
+                    "operators": "LIKE",
+                    "chosen_value": ""
+                }
+            ]
+        }
+    } for colname in ["BioProject"] + expression_columns + deg_store.COLUMNS]
+
+    def format_value(colname, value):
+        if value is None or (isinstance(value, float) and math.isnan(value)): return "N/A"
+        if colname == "Samples": return str(value)
+        if colname in ("pvalue", "padj"): return '%.2E' % Decimal(value)
+        return "{0:.2f}".format(round(value, 2))
+
+    values = []
+    for bioproject, result, error in results:
+        if error is not None:
+            logger.warning("Querying %s in %s failed: %s", gene_symbol, bioproject, error)
+            result = {"expression": None, "degs": None}
+        values.append([bioproject] +
+                      [result["expression"][colname] if result["expression"] else None for colname in expression_columns] +
+                      [result["degs"][colname] if result["degs"] else None for colname in deg_store.COLUMNS])
+
+    colnames = ["BioProject"] + expression_columns + deg_store.COLUMNS
+    values = table_query.query_rows(table_query.from_data(data), colnames, values)
+
+    def rows():
+        for value_row in values:
+            bioproject = value_row[0]
+            row = {"BioProject": [create_new_link("https://www.ncbi.nlm.nih.gov/bioproject/" + bioproject, bioproject, "See this BioProject within NCBI ("+bioproject+")")]}
+            for colname, value in zip(colnames[1:], value_row[1:]):
+                row[colname] = [{"type": "text", "label": format_value(colname, value), "color": "black"}]
+            yield row
+
+    return streaming.table_response(request, header, len(values), rows())
+
+def get_window(data):
+    offset = int(data["offset"]) if "offset" in data else 0
+    limit = int(data["limit"]) if "limit" in data else 10
+    return offset, limit
+
+@table_query_errors
+def search_by_gene_list(request):
+    # Batch search_by_gene_symbol: the gene x sample FPKM matrix of a list of genes
+    try:
+        data, gene_symbols = gene_lists.from_request(request)
+    except gene_lists.GeneListError as e:
+        return HttpResponse(json.dumps({"error": str(e)}), status=400)
+    logger.debug("Request data: %s, %s genes", data, len(gene_symbols))
+
+    bioproject = data["bioproject"]
+    offset, limit = get_window(data)
+
+    # A row slice of the exported matrix per gene, otherwise one R call for the whole list
+    store = expression_store.get_store(BASE_DATA_DIR + bioproject + "/expression/")
+    if store is not None:
+        results = store.search_by_genes(gene_symbols)
+    else:
+        path = BASE_DATA_DIR + bioproject + "/bg.RData"
+        results = get_r_pool().run(bioproject, path, "stress_mice.expression_store.search_genes_in_ballgown", gene_symbols)
+
+    return stream_table(request, query_frame(data, results), offset, limit)
+
+@table_query_errors
+def search_degs_by_gene_list(request):
+    # Batch search_by_diff_fold_expr: the DESeq statistics of a list of genes
+    try:
+        data, gene_symbols = gene_lists.from_request(request)
+    except gene_lists.GeneListError as e:
+        return HttpResponse(json.dumps({"error": str(e)}), status=400)
+    logger.debug("Request data: %s, %s genes", data, len(gene_symbols))
+
+    bioproject = data["bioproject"]
+    offset, limit = get_window(data)
+
+    table = deg_store.get_table(BASE_DATA_DIR + "degs/" + bioproject + "/sorted.DEG.csv")
+
+    rows = []
+    for gene_symbol in gene_symbols:
+        i = table.index.get(gene_symbol)
+        if i is None:
+            rows.append([gene_symbol] + [None] * len(deg_store.COLUMNS))
+        else:
+            rows.append([gene_symbol] + [None if x != x else x for x in table.fields(i)[1:]])
+
+    return stream_table(request, query_frame(data, rpool.RDataFrame([table.header[0]] + deg_store.COLUMNS, rows)), offset, limit)
+
+@table_query_errors
+def see_gene_isoforms(request):
     data = json.loads(request.body.decode('utf-8'))
 #     data = {}
-    print(data)
+    logger.debug("Request data: %s", data)
     
+    return streaming.dict_response(request, compute_see_gene_isoforms(data))
+
+def no_progress(fraction):
+    pass
+
+def compute_see_gene_isoforms(data, progress=no_progress):
     bioproject = data["bioproject"]
     gene_symbol = data["gene_name_sy"]
 #     gene_symbol = "DUSP6"
@@ -669,23 +870,16 @@ def see_gene_isoforms(request):
     if "offset" in data: offset = data["offset"]
     if "limit" in data: limit = data["limit"]
     
-    rows = []
-
-    with lock:
-        dir = BASE_DATA_DIR + bioproject + "/"
-        bg = get_ballgown_object(dir + "bg.RData")
-        results = robjects.r("SearchGeneIsoforms")(gene_symbol, bg)
-        if results is rpy2.rinterface.NULL: return HttpResponse(json.dumps(empty_table()))
+    results = r_query_table(bioproject, data, offset, limit, "SearchGeneIsoforms", gene_symbol)
+    progress(0.9)
+    if results is None: return empty_table()
         
-    response = to_table(results, offset, limit)
-
-    return HttpResponse(json.dumps(response))
+    return to_table(results, offset, limit)
 
+@table_query_errors
 def search_by_transcript_symbol(request):
-    print(str(datetime.datetime.now()))
-
     data = json.loads(request.body.decode('utf-8'))
-    print(data)
+    logger.debug("Request data: %s", data)
     
     bioproject = data["bioproject"]
     transcript_symbol = data["transcript_name_sy"]
@@ -696,21 +890,14 @@ def search_by_transcript_symbol(request):
     if "offset" in data: offset = data["offset"]
     if "limit" in data: limit = data["limit"]
     
-    with lock:
-        dir = BASE_DATA_DIR + bioproject + "/"
-        bg = get_ballgown_object(dir + "bg.RData")
-        SearchByTranscript = robjects.r("SearchByTranscript")
-        results = SearchByTranscript(transcript_symbol, bg)
-    
-    response = to_table(results, offset, limit)
+    results = r_query_table(bioproject, data, offset, limit, "SearchByTranscript", transcript_symbol)
     
-    return HttpResponse(json.dumps(response))
+    return stream_table(request, results, offset, limit)
 
+@table_query_errors
 def search_by_feature(request):
-    print(str(datetime.datetime.now()))
-
     data = json.loads(request.body.decode('utf-8'))
-    print(data)
+    logger.debug("Request data: %s", data)
     
     bioproject = data["bioproject"]
     gene_symbol = data["gene_name_sy"]
@@ -722,21 +909,19 @@ def search_by_feature(request):
     if "offset" in data: offset = data["offset"]
     if "limit" in data: limit = data["limit"]
     
-    with lock:
-        dir = BASE_DATA_DIR + bioproject + "/"
-        bg = get_ballgown_object(dir + "bg.RData")
-        search = robjects.r("SearchByFeature")
-        results = search(gene_symbol, feature, bg)
-    
-    response = to_table(results, offset, limit)
+    results = r_query_table(bioproject, data, offset, limit, "SearchByFeature", gene_symbol, feature)
     
-    return HttpResponse(json.dumps(response))
+    return stream_table(request, results, offset, limit)
 
+@table_query_errors
 def search_by_condition(request):
     
     data = json.loads(request.body.decode('utf-8'))
-    print(data)
+    logger.debug("Request data: %s", data)
     
+    return streaming.dict_response(request, compute_search_by_condition(data))
+
+def compute_search_by_condition(data, progress=no_progress):
     conditions = []
     for x in range(1, 6):
         conditionId = "condition"+str(x)
@@ -759,13 +944,12 @@ def search_by_condition(request):
     if "offset" in data: offset = data["offset"]
     if "limit" in data: limit = data["limit"]
     
-    print("QUERY", final_conditions, gene)
+    logger.debug("QUERY %s %s", final_conditions, gene)
+    progress(0.1)
     
-    with lock:
-        dir = BASE_DATA_DIR + bioproject + "/"
-        bg = get_ballgown_object(dir + "bg.RData")
-        results = robjects.r("SearchByCondition")(final_conditions, gene, bg)
-        if results is rpy2.rinterface.NULL: return HttpResponse(json.dumps(empty_table()))
+    results = r_query_table(bioproject, data, offset, limit, "SearchByCondition", final_conditions, gene)
+    progress(0.9)
+    if results is None: return empty_table()
     
     response = to_table(results, offset, limit)
     
@@ -774,51 +958,14 @@ def search_by_condition(request):
 #     rows = response["hits"]
 #     header.sort(key=lambda x: preferential_order.index(x["label"]) if x["label"] in preferential_order else sys.maxsize)
     
-    return HttpResponse(json.dumps(response))
-
-def gene2id():
-    
-    map = {}
-    
-    # Download file from here: "ftp://ftp.ncbi.nlm.nih.gov/genomes/refseq/vertebrate_mammalian/Mus_musculus/reference/GCF_000001635.26_GRCm38.p6/GCF_000001635.26_GRCm38.p6_genomic.gff.gz"
-    # and extracted two-column file with the following command
-    # zcat GCF_000001635.26_GRCm38.p6_genomic.gff.gz | cut -f 9 | grep "Name=" | tr ';' '\t' | grep "GeneID" | grep "ID=gene" | cut -f 2,3 | sed 's/Dbxref=GeneID://g' | sed 's/Name=//g' | sed 's/,[^\t]*//g' | awk '{ print $2"\t"$1}'
-    # TODO: make it perfect by considering this border-case:
-    # NC_000068.7     BestRefSeq      gene    175470025       175480553       .       +       .       ID=gene6037;Dbxref=GeneID:100503949,MGI:MGI:3779822;Name=Zfp965;description=zinc finger protein 965;gbkey=Gene;gene=Zfp965;gene_biotype=protein_coding;gene_synonym=668009,Gm8923
-    # in which DESeq uses a synonym for the name of the gene (e.g.. Gm8923 or Gm10094)
-    with open(os.path.dirname(__file__) + "/utils/genename2id.tsv") as reader:
-        for line in reader:
-            gene_name, gene_id = line.strip().split("\t")
-            map[gene_name] = {"id": gene_id}
-    
-    with open(os.path.dirname(__file__) + "/utils/Mus_musculus.GRCm38.93.genes.gtf") as reader:
-        for line in reader:
-            fields = line.strip().split("\t")
-            chr, start, end, strand, info = [fields[i] for i in [0,3,4,6,8]]
-            gene_name = None
-            
-            for f in info.split(";"):
-                if "gene_name" in f:
-                    gene_name = f.strip().split(" ")[1].replace("\"", "")
-            
-            if gene_name is not None:
-                
-                if gene_name not in map:
-                    map[gene_name] = {"id": "UNKNOWN"}
-                
-                gene_info = map[gene_name]
-                gene_info["chr"] = "chr" + chr
-                gene_info["start"] = start
-                gene_info["end"] = end
-                gene_info["strand"] = strand
-            
-    return map
-            
+    return response
 
+@table_query_errors
+@data_condition(degs_paths)
 def search_by_diff_fold_expr(request):
 
-    data = json.loads(request.body.decode('utf-8'))
-    print(data)
+    data = get_request_data(request)
+    logger.debug("Request data: %s", data)
     
 #     feature = data["feature"]
 #     covariate = data["covariate"]
@@ -845,98 +992,99 @@ def search_by_diff_fold_expr(request):
     offset = 0
     limit = 10
     
-    if "offset" in data: offset = data["offset"]
-    if "limit" in data: limit = data["limit"]
+    if "offset" in data: offset = int(data["offset"])
+    if "limit" in data: limit = int(data["limit"])
     
-    gene2idmap = gene2id()
+    table = deg_store.get_table(BASE_DATA_DIR + "degs/" + bioproject + "/sorted.DEG.csv")
     
-    total = 0
-    n = -1
-    header = []
-    rows = []
-    with open(os.path.dirname(__file__) + "/data/degs/"+bioproject+"/sorted.DEG.csv") as reader:
-        for line in reader:
-            line = line.strip()
-            
-            n += 1
-            if n == 0:
-                header = line.split(" ")
-                
-                header = [header[0]] + ["Genomic position", "strand"] + header[1:] #+ ["Link to NCBI"]
-                
-                header = [{
-                    "label": colname,
-                    "title": colname,
-                    "tooltip": colname,
-                    "filters": {
-                        "title": colname + " filters:",
-                        "list": [
-                            {
-                                "type": "select",
-                                "key": colname,
-                                "title": "Select a "+colname+":",
-                                "placeholder": "",
-                                "operators": "LIKE",
-                                "chosen_value": ""
-                            }
-                        ]
-                    }
-                } for colname in header]
-                
-                continue
-            
-            gene, mean, gene_logfc, gene_lfcSE, gene_stat, gene_pvalue, gene_qvalue = fields = line.split(" ")
-            if gene_logfc == "NA" or float(gene_logfc) < min_fold_change: continue
-            if gene_pvalue == "NA" or float(gene_pvalue) > pvalue: continue
-            if gene_qvalue == "NA" or float(gene_qvalue) > qvalue: continue
-            
-            total += 1
-            
-            if total <= offset: continue
-            if total > offset + limit: continue
-            
+    header = table.header
+    header = [header[0]] + ["Genomic position", "strand"] + header[1:] #+ ["Link to NCBI"]
+    
+    header = [{
+        "label": colname,
+        "title": colname,
+        "tooltip": colname,
+        "filters": {
+            "title": colname + " filters:",
+            "list": [
+                {
+                    "type": "select",
+                    "key": colname,
+                    "title": "Select a "+colname+":",
+                    "placeholder": "",
+                    "operators": "LIKE",
+                    "chosen_value": ""
+                }
+            ]
+        }
+    } for colname in header]
+    
+    # Filters and sorting on the annotation columns use values looked up once per table
+    def annotation_column(function):
+        def column(genes):
+            values = []
+            for gene_name in genes:
+                gene_info = annotation.lookup(gene_name)
+                values.append(function(gene_info) if gene_info and "chr" in gene_info else None)
+            return values
+        return column
+
+    extra_columns = {
+        "Genomic position": annotation_column(lambda x: x["chr"] + ":" + x["start"] + "-" + x["end"]),
+        "strand": annotation_column(lambda x: x["strand"]),
+    }
+
+    selection = table.select(pvalue, qvalue, min_fold_change, table_query.from_data(data), extra_columns)
+    total = len(selection)
+    
+    def rows():
+        for index in selection[offset:offset+limit]:
+            fields = table.fields(index)
+        
             gene_name = fields[0]
-            gene_info = gene2idmap[gene_name]
+            # Genes missing from the annotation get N/A position cells
+            gene_info = annotation.lookup(gene_name) or {}
+            positioned = "chr" in gene_info
             row = {}
             for (i, h) in enumerate(header):
-                
+            
                 if i == 0:
                     value = fields[0]
                 elif i==1:
-                    value = gene_info["chr"] + ":" + gene_info["start"] + "-" + gene_info["end"]
+                    value = gene_info["chr"] + ":" + gene_info["start"] + "-" + gene_info["end"] if positioned else "N/A"
                 elif i==2:
-                    value = gene_info["strand"]
+                    value = gene_info.get("strand", "N/A")
                 elif h["label"] == "pvalue" or h["label"] == "padj":
                     value = '%.2E' % Decimal(float(fields[i-2]))
                 else:
                     value = "{0:.2f}".format(round(float(fields[i-2]), 2))
-                
+            
                 if i == 0 and "id" in gene_info:
                     gene_id = gene_info["id"]
                     obj = create_new_link("https://www.ncbi.nlm.nih.gov/gene/" + gene_id, value, "See "+value+" in NCBI")
-                elif i == 1:
+                elif i == 1 and positioned:
                     obj = create_new_link("http://genome.ucsc.edu/cgi-bin/hgTracks?db=mm10&pix=800&position=" + value, value, "See on Genome browser")
                 else: obj = {
                         "type": "text",
                         "label": value,
                         "color": "black"
                     }
-                
+            
                 row[h["label"]] = []
                 if i==0:
                     row[h["label"]].append(create_new_image("imgs/gene-icon.png", width="35px"))
                 row[h["label"]].append(obj)
-            
-            
-#             row["Link to NCBI"] = []
-            
-#             if gene_name in gene2idmap:
-# #                 gene_info = gene2idmap[gene_name]
-#                 gene_id = gene_info["id"]
-#                 row["Link to NCBI"].append(create_linkable_image("imgs/gene-icon.png", "https://www.ncbi.nlm.nih.gov/gene/" + gene_id, tooltip="See the "+gene_name+" gene in NCBI", width="35px"))
-            
-            rows.append(row)
-            
+        
+        
+    #             row["Link to NCBI"] = []
+        
+    #             if gene_name in gene2idmap:
+    # #                 gene_info = gene2idmap[gene_name]
+    #                 gene_id = gene_info["id"]
+    #                 row["Link to NCBI"].append(create_linkable_image("imgs/gene-icon.png", "https://www.ncbi.nlm.nih.gov/gene/" + gene_id, tooltip="See the "+gene_name+" gene in NCBI", width="35px"))
+        
+            yield row
+        
     
 #     print("QUERY", final_conditions, covariate, feature)
 #     with lock:
@@ -951,20 +1099,27 @@ def search_by_diff_fold_expr(request):
 #     response = to_table(results, offset, limit)
     
     
-    response = {"structure": {"field_list": header}, "total": total, "hits": rows}
-    
 #     preferential_order = ["chr", "start", "end", "strand", "gene_id", "gene_name"]
 #     header = response["structure"]["field_list"]
 #     header.sort(key=lambda x: preferential_order.index(x["label"]) if x["label"] in preferential_order else sys.maxsize)
     
-    return HttpResponse(json.dumps(response))
+    return streaming.table_response(request, header, total, rows())
 
-def gene_plotter(request):
-    print(str(datetime.datetime.now()))
+def dataset_version(bioproject):
+    st = os.stat(BASE_DATA_DIR + bioproject + "/bg.RData")
+    return "{}-{}".format(st.st_mtime_ns, st.st_size)
+
+def get_plot_cache():
+    basedir = PLOT_DIR
+    return plot_cache.get_cache(basedir, getattr(settings, "PLOT_CACHE_BYTES", None))
 
+def gene_plotter(request):
     data = json.loads(request.body.decode('utf-8'))
-    print(data)
+    logger.debug("Request data: %s", data)
     
+    return HttpResponse(json.dumps(compute_gene_plotter(data)))
+
+def compute_gene_plotter(data, progress=no_progress):
     bioproject = data["bioproject"]
     gene_symbol = data["gene_name_sy"]
     measure = data["measure"]
@@ -980,19 +1135,22 @@ def gene_plotter(request):
     if "offset" in data: offset = data["offset"]
     if "limit" in data: limit = data["limit"]
 
-    basedir = os.path.dirname(__file__) + "/../../material/imgs/temp/"
-    if not os.path.exists(basedir):
-        os.makedirs(basedir)
-        
-    with lock:
-        dir = BASE_DATA_DIR + bioproject + "/"
-        bg = get_ballgown_object(dir + "bg.RData")
-        results = robjects.r("Gene_Plotter_By_Group")(gene_symbol, measure, covariate, basedir, bg)
-        if results is rpy2.rinterface.NULL: return HttpResponse(json.dumps(empty_table()))
-    
-    print(results)
-    print(type(results))
-    print(results.names)
+    basedir = PLOT_DIR
+    plots = get_plot_cache()
+    
+    # Images are named after their parameters and the version of the
+    # dataset, so a repeated request is answered without rendering
+    plot_key = plots.key(bioproject, gene_symbol, measure, covariate, dataset_version(bioproject))
+    filename = plots.lookup(plot_key)
+    if filename is not None:
+        return create_new_image("imgs/temp/" + filename, "100%")
+    progress(0.1)
+    
+    results = r_call(bioproject, "Gene_Plotter_By_Group", gene_symbol, measure, covariate, basedir)
+    progress(0.8)
+    if results is None: return empty_table()
+    
+    logger.debug("Gene_Plotter_By_Group returned %s: %s", results.names, results)
 #     print(results[results.names[0]])
 #     print(results[results.names[1]])
 #     print(results[results.names[2]])
@@ -1008,56 +1166,86 @@ def gene_plotter(request):
     starts = results[2]
     ends = results[3]
     
-    print("CHROMOSOMES", chromosomes)
-    print("STARTS", starts)
-    print("ENDS", ends)
+    logger.debug("CHROMOSOMES %s", chromosomes)
+    logger.debug("STARTS %s", starts)
+    logger.debug("ENDS %s", ends)
     chromosome = chromosomes[0]
     min_start = min(starts)
     max_end = max(ends)
-    print(chromosome, min_start, max_end)
+    logger.debug("Region %s:%s-%s", chromosome, min_start, max_end)
     
     filename = results[4][0]
     if os.path.exists(filename):
-        os.rename(filename, basedir + filename)
-        
-        response = create_new_image("imgs/temp/" + filename, "100%")
+        filename = plots.store(plot_key, filename)
+        progress(0.9)
         
-        return HttpResponse(json.dumps(response))
+        return create_new_image("imgs/temp/" + filename, "100%")
     else:
-        return HttpResponse(json.dumps(create_error_message(filename)))
+        return create_error_message(filename)
+    
+def job_urls(request, job):
+    prefix = request.path[:request.path.index("jobs/")] + "jobs/" + job.id + "/"
+    return {"url": prefix, "result_url": prefix + "result/"}
+
+def submit_job(request):
+    data = json.loads(request.body.decode('utf-8'))
+    logger.debug("Request data: %s", data)
+    
+    kind = data.get("kind")
+    if kind not in jobs.KINDS:
+        return HttpResponse(json.dumps({"error": "Unknown job kind: " + str(kind), "kinds": sorted(jobs.KINDS)}), status=400)
+    
+    job = jobs.submit(kind, data.get("params", {}))
+    
+    response = jobs.describe(job)
+    response.update(job_urls(request, job))
+    
+    return HttpResponse(json.dumps(response), status=202)
+
+def job_status(request, job_id):
+    job = jobs.get_job(job_id)
+    if job is None: return HttpResponse(json.dumps({"error": "No such job"}), status=404)
+    
+    response = jobs.describe(job)
+    response.update(job_urls(request, job))
     
+    return HttpResponse(json.dumps(response))
+
+def job_result(request, job_id):
+    job = jobs.get_job(job_id)
+    if job is None: return HttpResponse(json.dumps({"error": "No such job"}), status=404)
+    
+    if job.status == jobs.Job.FAILED:
+        return HttpResponse(json.dumps(jobs.describe(job)), status=500)
+    if job.status != jobs.Job.DONE:
+        # Not ready yet: the client should keep polling the status
+        return HttpResponse(json.dumps(jobs.describe(job)), status=202)
+    
+    return HttpResponse(job.result)
+
 def empty_table():
     return {"structure": {"field_list": []}, "total": 0, "hits": []}
 
 def to_table(results, offset, limit):
-    total = results.nrow
-    
-    rows = []
-    header = []
+    return {"structure": {"field_list": table_header(results)}, "total": results.total, "hits": list(table_rows(results, offset, limit))}
+
+def stream_table(request, results, offset, limit):
+    # Same as HttpResponse(json.dumps(to_table(...))), one row at a time
+    if results is None: return streaming.dict_response(request, empty_table())
+    return streaming.table_response(request, table_header(results), results.total, table_rows(results, offset, limit))
+
+def table_rows(results, offset, limit):
     n = results.ncol
+    colnames = [simplify_column(x) for x in results.colnames]
     
-    i = -1
-    for result in results.iter_row():
-        i += 1
-        if i < offset: continue
-        if len(rows) >= limit: break
-        
+    # results may only hold the requested window (see r_table)
+    start = offset - results.offset
+    for result in results.rows[start:start+limit]:
         row_dict = {}
         
-        colnames = result.colnames
-        
         for i in range(0, n):
-            item = result[i]
+            value = result[i]
             colname = colnames[i]
-            colname = simplify_column(colname)
-            
-            if hasattr(item, 'levels'):
-                value = str(item.levels[item[0]-1])
-            else:
-                value = item[0]
-            
-            if value is rpy2.rinterface.NA_Character:
-                value = "N/A"
             
             row_dict[colname] = [{
                 "type": "text",
@@ -1065,8 +1253,9 @@ def to_table(results, offset, limit):
                 "color": "black"
             }]
         
-        rows.append(row_dict)
-    
+        yield row_dict
+
+def table_header(results):
     header = []
     for colname in results.colnames:
         colname = colname
@@ -1090,29 +1279,12 @@ def to_table(results, offset, limit):
                 ]
             }
         })
-        
-    response = {"structure": {"field_list": header}, "total": total, "hits": rows}
     
-    return response
+    return header
 
 def simplify_column(column):
     return column.replace("trimmed_", "")
 
-def get_ballgown_object(path):
-    
-    bg = cache.get(path)
-    if bg is None:
-        print("OBJECT 'BG' NOT FOUND IN CACHE", path)
-        base = init()
-        base.load(path)
-        bg = robjects.r("bg")
-        print("ADDING OBJECT 'BG' INTO CACHE", path)
-        cache.set(path, bg, None)
-    else:
-        print("OBJECT 'BG' FOUND IN CACHE", path)
-        
-    return bg
-
 def create_entry(id, label, img=None):
     entry = {"id": id, "label": label}
     if img is not None:
@@ -1120,6 +1292,7 @@ def create_entry(id, label, img=None):
         
     return entry
 
+@data_condition(project_paths)
 def get_projects(request):
     results = []
     
@@ -1134,29 +1307,31 @@ def get_projects(request):
     return HttpResponse(json.dumps(results))
 
 def simple_genes(request):
-    print("SIMPLE GENES")
+    logger.debug("SIMPLE GENES")
     return HttpResponse(json.dumps("SIMPLE GENES"))
 
+def get_autocomplete_index(bioproject, function):
+    # The ids are fetched from R once and then served from memory until
+    # the bioproject's bg.RData changes
+    return autocomplete.get_index((bioproject, function), [BASE_DATA_DIR + bioproject + "/bg.RData"], lambda: r_call(bioproject, function))
+
+def get_autocomplete_limit(request):
+    # ?limit= may lower the configured limit; an invalid one is ignored
+    limit = getattr(settings, "AUTOCOMPLETE_LIMIT", 50)
+    try:
+        requested = int(request.GET.get("limit", limit))
+    except ValueError:
+        requested = limit
+    return max(1, min(requested, limit))
+
 def genes(request, bioproject, prefix = ""):
-    print("GENES WITH PREFIX", bioproject, prefix)
+    logger.debug("GENES WITH PREFIX %s %s", bioproject, prefix)
     
-    with lock:
-        basedir = BASE_DATA_DIR + bioproject + "/"
-        bg = get_ballgown_object(basedir + "bg.RData")
-        getGenes = robjects.r("getGenes")
-        all_genes = getGenes(bg)
+    index = get_autocomplete_index(bioproject, "getGenes")
     
     response = []
     
-    genes = set()
-    for gene_id in all_genes:
-        id = str(gene_id)
-        if prefix not in id: continue
-        if len(genes) >= 50: break
-        
-        genes.add(id)
-    
-    for gene in sorted(genes):
+    for gene in index.search(prefix, get_autocomplete_limit(request), getattr(settings, "AUTOCOMPLETE_SUBSTRING", True)):
         response.append({"id": gene, "label": gene, "img": "imgs/gene-icon.png"})
         
     if len(response) > 1:
@@ -1176,45 +1351,32 @@ def features(request):
 
 def transcripts(request, bioproject, prefix = ""):
     
-    with lock:
-        basedir = BASE_DATA_DIR + bioproject + "/"
-        bg = get_ballgown_object(basedir + "bg.RData")
-        fx = robjects.r("getTranscript")
-        all_transcripts = fx(bg)
+    index = get_autocomplete_index(bioproject, "getTranscript")
     
     response = []
     
     response.insert(0, {"id": "ALL", "label": "Include any transcript", "img": "imgs/gene-icon.png"})
-    transcripts = set()
-    for transcript_id in all_transcripts:
-        id = str(transcript_id)
-        if prefix not in id: continue
-        if len(transcripts) >= 50: break
-        
-        transcripts.add(id)
-    
-    for transcript in sorted(transcripts):
+    for transcript in index.search(prefix, get_autocomplete_limit(request), getattr(settings, "AUTOCOMPLETE_SUBSTRING", True)):
         response.append({"id": transcript, "label": transcript, "img": "imgs/gene-icon.png"})
     
     return HttpResponse(json.dumps(response))
 
+def get_phenodata_index(bioproject):
+    # Shared by covariates, covariate_values and phenodata_info; built once
+    # per version of the phenodata (see phenodata.py)
+    csv_path = BASE_DATA_DIR + "phenodata/" + bioproject + "/phenodata.csv"
+    bg_path = BASE_DATA_DIR + bioproject + "/bg.RData"
+    return phenodata.get_index(bioproject, csv_path, bg_path, lambda: r_call(bioproject, "getCovariates"))
+
+@data_condition(phenodata_paths)
 def covariates(request, bioproject):
     
-    with lock:
-        basedir = BASE_DATA_DIR + bioproject + "/"
-        bg = get_ballgown_object(basedir + "bg.RData")
-        fx = robjects.r("getCovariates")
-        phenodata = fx(bg)
+    index = get_phenodata_index(bioproject)
     
     response = []
     
     response.insert(0, {"id": "ALL", "label": "Include any covariate", "img": "imgs/covariate.png"})
-    covariates = set()
-    for col_name in phenodata.colnames:
-        if col_name == "ids": continue
-        covariates.add(col_name)
-    
-    for covariate in covariates:
+    for covariate in index.columns:
         response.append({"id": covariate, "label": covariate, "img": "imgs/covariate.png"})
     
     return HttpResponse(json.dumps(response))
@@ -1231,52 +1393,14 @@ def measures(request):
 
 def covariate_values(request, bioproject, covariate):
     
-    with lock:
-        basedir = BASE_DATA_DIR + bioproject + "/"
-        bg = get_ballgown_object(basedir + "bg.RData")
-        fx = robjects.r("getCovariates")
-        phenodata = fx(bg)
+    index = get_phenodata_index(bioproject)
     
-    covariates = {}
-    for colname in phenodata.colnames:
-        index = phenodata.colnames.index(colname)
-        
-        values = set()
-        for result in phenodata.iter_row():
-            x = result[index]
-            
-            if hasattr(x, 'levels'):
-                value = str(x.levels[x[0]-1])
-            else:
-                value = x[0]
-    
-            values.add(value)
-        
-        response = []
-        
-        for value in values:
-            response.append({"id": value, "label": value, "img": "imgs/covariate.png"})
-            
-        covariates[colname] = response
-    
-    index = phenodata.colnames.index(covariate)
-    if index < 0:
+    if covariate not in index:
         return HttpResponse(json.dumps("No such covariate ({}) in data.".format(covariate)))
     
-    values = set()
-    for result in phenodata.iter_row():
-        x = result[index]
-        
-        if hasattr(x, 'levels'):
-            value = str(x.levels[x[0]-1])
-        else:
-            value = x[0]
-
-        values.add(value)
-    
     response = []
     
-    for value in values:
+    for value in index.distinct(covariate):
         response.append({"id": value, "label": value, "img": "imgs/covariate.png"})
     
     return HttpResponse(json.dumps(response))
@@ -1324,42 +1448,20 @@ def data_info(request, bioproject_id):
     bioproject_info = map[bioproject_id]
     return HttpResponse(json.dumps(create_chart("chart-bar", width="400px", xaxis="Dimensions", data=[("Number of experiments", bioproject_info["experiments"]), ("Number of samples", bioproject_info["samples"])])))
 
+@data_condition(phenodata_paths)
 def phenodata_info(request, bioproject_id):
 #     map = load_dataset_info()
 #     bioproject_info = map[bioproject_id]
     
-    filepath = os.path.dirname(__file__) + "/data/phenodata/"+ bioproject_id + "/phenodata.csv"
-    line_no = 0
-    header = []
-    counters =  {}
-    with open(filepath, "r") as reader:
-        for line in reader:
-            line = line.strip()
-            
-            line_no += 1
-            
-            fields = line.split(",")
-            
-            if line_no == 1:
-                header = fields
-                for h in header[1:]:
-                    counters[h] = Counter()
-            else:
-                for i in range(len(fields)):
-                    if i==0: continue
-                    
-                    key, value = [header[i], fields[i]]
-                    counters[key][value] += 1
+    index = get_phenodata_index(bioproject_id)
     
     multielement = create_new_multi_element(layout="row", alignment="start start")
-    for key,counter in counters.items():
+    for key in index.columns:
         if key in ["Replicate"]: continue
         
-        data = []
-        for v in counter:
-            data.append((v, counter[v]))
+        data = index.counts(key)
         
-        if len(data) == 1 and counter.most_common()[0][0] in ["na", "NA", "N/A"]: continue
+        if len(data) == 1 and data[0][0] in ["na", "NA", "N/A"]: continue
         
         chart = create_chart("chart-bar", min=0, descriptions=[key, "Quantity"], width="400px", data=data)
         chart["style"] = {
@@ -1369,10 +1471,9 @@ def phenodata_info(request, bioproject_id):
         
     return HttpResponse(json.dumps(multielement))
 
-from stress_mice.utils import selector
 def get_criteria(request):
     data = json.loads(request.body.decode('utf-8'))
-    print(data)
+    logger.debug("Request data: %s", data)
     bioproject = data["bioproject"]
     del data["bioproject"]
     
@@ -1394,40 +1495,39 @@ def get_criteria(request):
     response.sort(key=lambda x: x["key"])
     
     # Build new choices (if any!)
-    user_filter = None
     user_filter_clauses = []
     user_filter_keys = set()
     for (key,value) in data.items():
         user_filter_clauses.append(value)
         (k, v) = value.split("==")
         user_filter_keys.add(k)
-    print("ALREADY USED", user_filter_keys)
+    logger.debug("ALREADY USED %s", user_filter_keys)
+    logger.debug("FILTER %s", user_filter_clauses)
     
-    if user_filter_clauses:
-        user_filter = "(" + " & ".join(["("+str(x)+")" for x in user_filter_clauses]) + ")"
-    print("FILTER", user_filter_clauses, user_filter)
+    # The configurations matching the filter are the AND of the bitsets
+    # of its clauses (see facets.py)
+    index = facets.get_index(BASE_DATA_DIR + "configurations.tsv", bioproject)
+    mask = index.select(user_filter_clauses)
+    n_conditions = facets.popcount(mask)
     
     new_choices = set()
-    counts = Counter()
-    conditions = selector.select(os.path.dirname(__file__) + "/data/configurations.tsv", user_filter, bioproject, only_leaves=False, output_other_clauses_only=True)
-    for condition in conditions:
-        for clause in condition:
-            counts[clause] += 1
-            (k, v) = clause.split("==")
-            if v.replace("\"", "").startswith("control"): continue
-            
-            if k not in user_filter_keys:
-                new_choices.add(clause)
+    counts = index.counts(mask, exclude=user_filter_clauses)
+    for clause in counts:
+        (k, v) = clause.split("==")
+        if v.replace("\"", "").startswith("control"): continue
+        
+        if k not in user_filter_keys:
+            new_choices.add(clause)
 
-    print("CONDITIONS", len(conditions))
-    print("COUNTS", counts)
+    logger.debug("CONDITIONS %s", n_conditions)
+    logger.debug("COUNTS %s", counts)
     for c in counts:
-        if counts[c] == len(conditions) and c in new_choices:
+        if counts[c] == n_conditions and c in new_choices:
             new_choices.remove(c)
                 
     new_choices = sorted(new_choices)
     
-    if len(conditions) > 1 and len(new_choices) > 0:
+    if n_conditions > 1 and len(new_choices) > 0:
         new_key = "Criterion"+str(len(response)+1)
         select = create_select([{"id": x, "label": x} for x in new_choices], label=new_key, key=new_key)
         select["data"]["onChange"] = [{
@@ -1442,7 +1542,7 @@ def get_criteria(request):
         }]
         response.append(select)
     
-    print("RESPONSE", response)
+    logger.debug("RESPONSE %s", response)
         
     return HttpResponse(json.dumps(response))
 
@@ -0,0 +1,137 @@
+"""
+Preloading of bioprojects, off the request path.
+
+warm_up() loads the Ballgown object of each bioproject in its R worker
+and builds the indexes derived from it, several bioprojects at a time,
+and returns a per-bioproject report with timings and memory. It is run
+by the `warmup` management command and, when WARMUP_ON_STARTUP is set,
+in a background thread when the server starts; the ready/ endpoint
+reports whether that warm-up has finished. A warm-up that cannot list
+the bioprojects ends with the status "failed" and its error; the server
+is then reported ready and loads the datasets on first use, as without
+warm-up.
+"""
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+_state = {
+    "status": "idle",
+    "started_at": None,
+    "finished_at": None,
+    "done": 0,
+    "total": 0,
+    "report": [],
+    "shared": {},
+    "error": None,
+}
+_state_lock = threading.Lock()
+
+
+def get_state():
+    with _state_lock:
+        return dict(_state)
+
+
+def is_ready():
+    state = get_state()
+    # A failed warm-up is over too: the datasets then load on first use
+    if state["status"] in ("done", "failed"): return True
+    # Nothing to wait for if no warm-up was requested at startup
+    return state["status"] == "idle" and not getattr(settings, "WARMUP_ON_STARTUP", False)
+
+
+def warm_up_bioproject(bioproject):
+    from stress_mice import views
+
+    report = {"bioproject": bioproject, "steps": {}}
+    start = time.time()
+
+    def step(name, fx):
+        step_start = time.time()
+        result = fx()
+        report["steps"][name] = time.time() - step_start
+        return result
+
+    try:
+        path = views.BASE_DATA_DIR + bioproject + "/bg.RData"
+        if os.path.exists(path):
+            loaded = step("dataset", lambda: views.get_r_pool().preload(bioproject, path))
+            report.update(loaded)
+            step("genes", lambda: views.get_autocomplete_index(bioproject, "getGenes"))
+            step("transcripts", lambda: views.get_autocomplete_index(bioproject, "getTranscript"))
+            step("phenodata", lambda: views.get_phenodata_index(bioproject))
+
+        step("expression", lambda: views.expression_store.get_store(views.BASE_DATA_DIR + bioproject + "/expression/"))
+
+        degs_path = views.BASE_DATA_DIR + "degs/" + bioproject + "/sorted.DEG.csv"
+        if os.path.exists(degs_path):
+            step("degs", lambda: views.deg_store.get_table(degs_path))
+    except Exception:
+        report["error"] = traceback.format_exc()
+
+    report["seconds"] = time.time() - start
+    return report
+
+
+def warm_up(bioprojects=None, parallelism=None):
+    from stress_mice import views
+
+    with _state_lock:
+        _state.update(status="running", started_at=time.time(), finished_at=None, done=0, report=[], error=None)
+
+    shared = {}
+    report = []
+    status = "failed"
+    try:
+        try:
+            start = time.time()
+            views.load_dataset_info()
+            shared["catalog"] = time.time() - start
+            start = time.time()
+            views.annotation.get_index()
+            shared["annotation"] = time.time() - start
+        except Exception:
+            # Reported, but not fatal: the bioprojects can still be preloaded
+            with _state_lock:
+                _state["error"] = traceback.format_exc()
+
+        if bioprojects is None:
+            bioprojects = getattr(settings, "WARMUP_BIOPROJECTS", None) or sorted(views.load_dataset_info().keys())
+
+        with _state_lock:
+            _state["total"] = len(bioprojects)
+
+        # Bioprojects served by different R workers load in parallel
+        parallelism = parallelism or getattr(settings, "R_WORKERS", 4)
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            for entry in executor.map(warm_up_bioproject, bioprojects):
+                report.append(entry)
+                with _state_lock:
+                    _state["done"] += 1
+                    _state["report"] = list(report)
+        status = "done"
+    except Exception:
+        # e.g. no catalog to list the bioprojects from
+        with _state_lock:
+            _state["error"] = traceback.format_exc()
+    finally:
+        # Never left "running", so ready/ cannot answer 503 forever
+        with _state_lock:
+            _state.update(status=status, finished_at=time.time(), shared=shared)
+
+    return shared, report
+
+
+def start_in_background():
+    with _state_lock:
+        if _state["status"] != "idle": return
+        _state["status"] = "running"
+
+    thread = threading.Thread(target=warm_up, name="stress-mice-warmup")
+    thread.daemon = True
+    thread.start()
@@ -1,3 +1,7 @@
 PORT=7555
 #sudo neo4j-community-3.4.0/bin/neo4j start
+# Preload the bioprojects in the background; /stress_mice/ready/ answers OK once done
+export STRESS_MICE_WARMUP=1
+# Create or update the tables of the jobs (stress_mice/models.py)
+python3.5 project/django_server/manage.py migrate --noinput
 python3.5 project/django_server/manage.py runserver $PORT